@@ -1,5 +1,11 @@
 #!/usr/bin/env python3
 import urllib.request
+import urllib.error
+import http.client
+import concurrent.futures
+import threading
+import hashlib
+import json
 import time
 import os.path
 import re
@@ -8,6 +14,18 @@ import re
 cur_folder = os.path.dirname(__file__)
 REGISTRY_FILE = os.path.join(cur_folder, 'PSICQUIC_registry_imex.txt')
 PPI_FOLDER = os.path.join(cur_folder, 'ppis')
+# partially downloaded files and the manifest are kept in the download folder
+# (not in the PPI folder, since all files named PSICQUIC_* in there are
+#  imported as PPIs)
+DOWNLOAD_FOLDER = os.path.join(cur_folder, 'download', 'psicquic')
+MANIFEST_FILE = os.path.join(DOWNLOAD_FOLDER, 'manifest.json')
+
+# number of services downloaded concurrently
+MAX_CONCURRENT_DOWNLOADS = 4
+# number of rows requested per page (via `firstResult` and `maxResults`)
+PAGE_SIZE = 50000
+# size of the chunks read from the HTTP response
+CHUNK_SIZE = 1024*1024
 
 
 def get_psicquic_services(filename):
@@ -31,20 +49,201 @@ def urlopen_retry(url, retry = 3, delay = 1):
         try:
             cf = urllib.request.urlopen(url)
             return cf
-        except urllib.error.HTTPError as e:
+        except (urllib.error.URLError, http.client.HTTPException,
+                OSError) as e:
             # try again
             print("Failed to connect, retrying...")
             time.sleep(delay)
             i = i+1
             if (i == retry):
-                return e
+                raise
+
+
+class Manifest:
+    """
+    Keeps track of the state of all service downloads in a JSON file:
+    the number of rows (and bytes) already downloaded into the partial file,
+    and for completed downloads the total row count, size and checksum of the
+    final file. This makes the `already downloaded` check O(1).
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        if os.path.exists(filename):
+            with open(filename, "r") as f:
+                self.services = json.load(f)
+        else:
+            self.services = {}
+
+    def get(self, service_name):
+        with self.lock:
+            return dict(self.services.get(service_name, {}))
+
+    def update(self, service_name, entry):
+        with self.lock:
+            self.services[service_name] = entry
+            # write atomically, such that an interrupted write never
+            # corrupts the manifest
+            tmp_filename = self.filename + ".tmp"
+            with open(tmp_filename, "w") as f:
+                json.dump(self.services, f, indent=2, sort_keys=True)
+            os.replace(tmp_filename, self.filename)
+
+
+def file_sha256(filename):
+    """
+    Returns the SHA-256 checksum of the given file.
+    """
+    sha = hashlib.sha256()
+    with open(filename, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def download_page(url, outfile, retry=3, delay=1):
+    """
+    Appends the response of the given URL to the opened file `outfile`.
+    In case of failures, the partially written page is removed again before
+    retrying.
+
+    @returns:   The number of rows (lines) written.
+    """
+    start_pos = outfile.tell()
+    for i in range(0, retry):
+        try:
+            num_rows = 0
+            last_chunk = b''
+            with urllib.request.urlopen(url) as page:
+                while True:
+                    chunk = page.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    num_rows += chunk.count(b'\n')
+                    outfile.write(chunk)
+                    last_chunk = chunk
+                # `read(amt)` doesn't raise on a connection closed before
+                # the announced `Content-Length` was received
+                if page.length:
+                    raise http.client.IncompleteRead(last_chunk, page.length)
+            # terminate the last row, such that the next page's first row
+            # isn't appended to it
+            if last_chunk and not last_chunk.endswith(b'\n'):
+                outfile.write(b'\n')
+                num_rows += 1
+            outfile.flush()
+            os.fsync(outfile.fileno())
+            return num_rows
+        except (urllib.error.URLError, http.client.HTTPException, OSError):
+            # (a truncated page raises `http.client.IncompleteRead`)
+            print("Failed to download " + url + ", retrying...")
+            # roll back the partially written page
+            outfile.seek(start_pos)
+            outfile.truncate()
+            time.sleep(delay)
+    raise IOError("Failed to download " + url)
+
+
+def download_service(service_name, query_url, outfilename, manifest,
+                     page_size=PAGE_SIZE, part_folder=DOWNLOAD_FOLDER):
+    """
+    Downloads all rows of a single PSICQUIC service page-by-page into a
+    partial file and atomically moves it to `outfilename` when done.
+    Interrupted downloads are resumed from the last complete page.
+    """
+    # first get row count
+    count_url = query_url + '?format=count'
+    try:
+        cf = urlopen_retry(count_url)
+        count = int(cf.read())
+        cf.close()
+    except Exception:
+        print("[ERROR] Failed to download PPI " + service_name
+              + ", skipping...")
+        return
+
+    # check in the manifest whether the file is already complete (for the
+    # same announced row count)
+    entry = manifest.get(service_name)
+    if (entry.get("complete") and entry.get("count") == count
+            and os.path.exists(outfilename)
+            and os.path.getsize(outfilename) == entry.get("bytes")):
+        print("PPI file for '" + service_name + "' already exists, "
+              "skipping download.")
+        return
+
+    # resume from the partial file, if it is consistent with the manifest
+    part_filename = os.path.join(part_folder, os.path.basename(outfilename)
+                                 + ".part")
+    rows_done = 0
+    bytes_done = 0
+    if (not entry.get("complete") and entry.get("count") == count
+            and os.path.exists(part_filename)
+            and os.path.getsize(part_filename) >= entry.get("part_bytes", 0)):
+        rows_done = entry.get("part_rows", 0)
+        bytes_done = entry.get("part_bytes", 0)
+    entry = {"complete": False, "count": count,
+             "part_rows": rows_done, "part_bytes": bytes_done}
+    manifest.update(service_name, entry)
+
+    if rows_done > 0:
+        print("Resuming download from '" + service_name + "' at row "
+              + str(rows_done) + "/" + str(count))
+    else:
+        print("Downloading from '" + service_name + "': " + str(count)
+              + " rows ...")
+
+    mode = "r+b" if os.path.exists(part_filename) else "wb"
+    with open(part_filename, mode) as outfile:
+        # drop anything written after the last complete page
+        outfile.seek(bytes_done)
+        outfile.truncate()
+        while rows_done < count:
+            page_url = (query_url + '?format=tab25'
+                        + '&firstResult=' + str(rows_done)
+                        + '&maxResults=' + str(page_size))
+            num_rows = download_page(page_url, outfile)
+            if num_rows == 0:
+                # the service returned less rows than announced (the
+                # `format=count` query often over-reports)
+                break
+            rows_done += num_rows
+            entry["part_rows"] = rows_done
+            entry["part_bytes"] = outfile.tell()
+            manifest.update(service_name, entry)
 
+    if rows_done < count:
+        print("[WARNING] '" + service_name + "' returned only "
+              + str(rows_done) + " of " + str(count) + " announced rows")
 
-def download_all_ppis(folder, basename):
+    # atomically move the complete file into the PPI folder, the manifest
+    # keeps both the announced and the received number of rows
+    os.replace(part_filename, outfilename)
+    manifest.update(service_name, {"complete": True, "count": count,
+                                   "rows": rows_done,
+                                   "bytes": os.path.getsize(outfilename),
+                                   "sha256": file_sha256(outfilename)})
+    print("Finished download from '" + service_name + "': " + str(rows_done)
+          + " rows")
+
+
+def download_all_ppis(folder, basename, registry_file=REGISTRY_FILE,
+                      manifest_file=MANIFEST_FILE,
+                      part_folder=DOWNLOAD_FOLDER,
+                      max_workers=MAX_CONCURRENT_DOWNLOADS,
+                      page_size=PAGE_SIZE):
     """
     Downloads all PPIs provided by the PSICQUIC registry
     into the folder with the given basename as tsv file.
     E.g. for the PPI `MINT` the file name will be `folder/basename_MINT.tsv`.
+
+    Up to `max_workers` services are downloaded concurrently. The state of
+    all downloads is kept in the manifest file, such that completed services
+    are skipped and interrupted services are resumed on the next run.
     """
     # build PSICQUIC RESTFUL query (added to the base service url)
     # https://code.google.com/p/psicquic/wiki/PsicquicSpec_1_3_Rest
@@ -53,58 +252,38 @@ def download_all_ppis(folder, basename):
     psicquic_version = 'current'
     psicquic_method = 'query'
     psicquic_query = 'taxidA:9606%20AND%20taxidB:9606'
-    psicquic_parameters = 'format=tab25'   # use the PSI-MITAB 2.5 format
 
     psicquic_query_url = (psicquic_version + '/search/' + psicquic_method
                           + '/' + psicquic_query)
 
+    os.makedirs(folder, exist_ok=True)
+    os.makedirs(part_folder, exist_ok=True)
+    manifest = Manifest(manifest_file)
+
     # get dict of PSICQUIC services and service urls
-    psiquic_services = get_psicquic_services(REGISTRY_FILE)
-    for service_name, service_url in psiquic_services.items():
-        # remove the last /psicquic from the service_url
-        service_url = re.sub("/psicquic$", "", service_url)
-        # first get row count
-        count_url = service_url + '/' + psicquic_query_url + '?format=count'
-        tab25_url = service_url + '/' + psicquic_query_url + '?format=tab25'
-
-        # try opening URL
-        #with urllib.request.urlopen(count_url) as cf:
-        #    count = int(cf.read())
-        try:
-            cf = urlopen_retry(count_url)
-            count = int(cf.read())
-            cf.close()
-        except:
-            print("[ERROR] Failed to download PPI " + service_name + ", skipping...")
-            continue
+    psiquic_services = get_psicquic_services(registry_file)
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as pool:
+        futures = {}
+        for service_name, service_url in psiquic_services.items():
+            # remove the last /psicquic from the service_url
+            service_url = re.sub("/psicquic$", "", service_url)
+            query_url = service_url + '/' + psicquic_query_url
+            # get filename for output
+            outfilename = os.path.join(folder, basename + "_" + service_name
+                                       + ".tsv")
+            future = pool.submit(download_service, service_name, query_url,
+                                 outfilename, manifest, page_size,
+                                 part_folder)
+            futures[future] = service_name
 
-        print("Downloading from '" + service_name + "': " + str(count)
-              + " rows ...")
-        # get filename for output
-        outfilename = os.path.join(folder, basename + "_" + service_name
-                                   + ".tsv")
-        # in case the file already exists
-        if os.path.exists(outfilename):
-            # check that all interactions are there
-            with open(outfilename, "r") as f:
-                num_lines = sum(1 for line in f)
-            if num_lines == count:
-                # skip this specific PPI
-                print("PPI file already exists, skipping download.")
-                continue
-            else:
-                # remove the file
-                os.remove(outfilename)
-
-        CHUNK_SIZE = 4*1024
-        # open url and write out, chunk-by-chunk
-        with urllib.request.urlopen(tab25_url) as tab25_f:
-            with open(outfilename, "wb") as outfile:
-                while True:
-                    chunk = tab25_f.read(CHUNK_SIZE)
-                    if not chunk:
-                        break
-                    outfile.write(chunk)
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                print("[ERROR] Failed to download PPI " + futures[future]
+                      + " (" + str(e) + "), it will be resumed on the "
+                      "next run.")
 
 
-download_all_ppis(PPI_FOLDER, "PSICQUIC")
+if __name__ == '__main__':
+    download_all_ppis(PPI_FOLDER, "PSICQUIC")
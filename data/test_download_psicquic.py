@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+#
+# Tests the PSICQUIC downloader against a local HTTP stand-in of a PSICQUIC
+# service (paging, resuming from the manifest and truncated pages).
+#
+# Run via:  python3 -m unittest test_download_psicquic  (from `data/`)
+
+import http.server
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+import unittest.mock
+import urllib.parse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import download_psicquic
+
+
+class PsicquicHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves `format=count` and `format=tab25` (paged via `firstResult` and
+    `maxResults`) queries from the rows of the server.
+    """
+
+    def do_GET(self):
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        server = self.server
+        if query["format"] == ["count"]:
+            body = str(server.count).encode()
+        else:
+            first = int(query["firstResult"][0])
+            server.requests.append(first)
+            rows = server.rows[first:first + int(query["maxResults"][0])]
+            # the last row of a page isn't terminated by a newline
+            body = "\n".join(rows).encode()
+            if first in server.truncate:
+                # announce the full page, but only send half of it
+                server.truncate.remove(first)
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body[:len(body) // 2])
+                return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestDownloadPsicquic(unittest.TestCase):
+
+    NUM_ROWS = 7
+    PAGE_SIZE = 3
+
+    def setUp(self):
+        self.server = http.server.HTTPServer(("127.0.0.1", 0),
+                                             PsicquicHandler)
+        self.server.rows = ["a%i\tb%i" % (i, i) for i in range(self.NUM_ROWS)]
+        self.server.count = self.NUM_ROWS
+        self.server.requests = []
+        self.server.truncate = set()
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.folder = os.path.join(self.tmp_dir.name, "ppis")
+        self.part_folder = os.path.join(self.tmp_dir.name, "download")
+        self.manifest_file = os.path.join(self.part_folder, "manifest.json")
+        self.registry_file = os.path.join(self.tmp_dir.name, "registry.txt")
+        with open(self.registry_file, "w") as f:
+            f.write("test=http://127.0.0.1:%i/test/psicquic\n"
+                    % self.server.server_port)
+        self.outfilename = os.path.join(self.folder, "PSICQUIC_test.tsv")
+        self.part_filename = os.path.join(self.part_folder,
+                                          "PSICQUIC_test.tsv.part")
+
+        # don't wait between retries
+        patcher = unittest.mock.patch("download_psicquic.time.sleep")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp_dir.cleanup()
+
+    def download(self):
+        download_psicquic.download_all_ppis(
+            self.folder, "PSICQUIC", registry_file=self.registry_file,
+            manifest_file=self.manifest_file, part_folder=self.part_folder,
+            page_size=self.PAGE_SIZE)
+
+    def expected_content(self):
+        return "".join(r + "\n" for r in self.server.rows).encode()
+
+    def manifest_entry(self):
+        with open(self.manifest_file, "r") as f:
+            return json.load(f)["test"]
+
+    def assert_complete(self, rows):
+        with open(self.outfilename, "rb") as f:
+            self.assertEqual(f.read(), self.expected_content())
+        self.assertFalse(os.path.exists(self.part_filename))
+        entry = self.manifest_entry()
+        self.assertTrue(entry["complete"])
+        self.assertEqual(entry["count"], self.server.count)
+        self.assertEqual(entry["rows"], rows)
+        self.assertEqual(entry["bytes"], os.path.getsize(self.outfilename))
+
+    def test_paging(self):
+        self.download()
+        self.assertEqual(self.server.requests, [0, 3, 6])
+        self.assert_complete(self.NUM_ROWS)
+
+        # the second run skips the complete service
+        self.server.requests = []
+        self.download()
+        self.assertEqual(self.server.requests, [])
+        self.assert_complete(self.NUM_ROWS)
+
+    def test_resume(self):
+        # the first page is complete, the second was interrupted
+        os.makedirs(self.part_folder)
+        first_page = "".join(r + "\n" for r in self.server.rows[:3]).encode()
+        with open(self.part_filename, "wb") as f:
+            f.write(first_page + b"a3\tb")
+        manifest = download_psicquic.Manifest(self.manifest_file)
+        manifest.update("test", {"complete": False, "count": self.NUM_ROWS,
+                                 "part_rows": 3,
+                                 "part_bytes": len(first_page)})
+
+        self.download()
+        self.assertEqual(self.server.requests, [3, 6])
+        self.assert_complete(self.NUM_ROWS)
+
+    def test_truncated_page(self):
+        self.server.truncate = {3}
+        self.download()
+        # the truncated page is retried
+        self.assertEqual(self.server.requests, [0, 3, 3, 6])
+        self.assert_complete(self.NUM_ROWS)
+
+    def test_over_reported_count(self):
+        self.server.count = self.NUM_ROWS + 3
+        self.download()
+        self.assertEqual(self.server.requests, [0, 3, 6, 7])
+        self.assert_complete(self.NUM_ROWS)
+
+        # the second run skips the service, since the count didn't change
+        self.server.requests = []
+        self.download()
+        self.assertEqual(self.server.requests, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -242,6 +242,9 @@ cdef extern from "SQLiteIO.h":
 		_SQLiteIO(string db) except +
 		_PpiGraph load_ppi_graph(string ppi_name) except +
 		_TsPpiGraph load_tsppi_graph(string ppi_name, string expr_name) except +
+		_TsPpiGraph load_tsppi_graph(string ppi_name, string expr_name,
+		                             string cache_dir) except +
+		double getLastLoadTime()
 
 cdef class SQLiteIO:
 	"""An undirected, optionally weighted graph"""
@@ -250,11 +253,15 @@ cdef class SQLiteIO:
 	def __cinit__(self, database):
 		self._this = new _SQLiteIO(stdstring(database))
 
-	def load_tsppi_graph(self, ppi_name, expr_name):
+	def load_tsppi_graph(self, ppi_name, expr_name, cache_dir=None):
+		"""Loads the tissue specific graph. If `cache_dir` is given, the
+		graph is loaded from (or saved into) a memory mapped snapshot file in
+		that directory, instead of querying the database each time."""
 		p = stdstring(ppi_name)
 		e = stdstring(expr_name)
+		c = stdstring(cache_dir if cache_dir is not None else "")
 		tsppi_graph = TsPpiGraph()
-		cdef _TsPpiGraph tg = self._this.load_tsppi_graph(p, e)
+		cdef _TsPpiGraph tg = self._this.load_tsppi_graph(p, e, c)
 		# FIXME: remove unnecessary copy
 		tsppi_graph._set_this(new _TsPpiGraph(tg))
 		return tsppi_graph
@@ -267,6 +274,10 @@ cdef class SQLiteIO:
 		ppi_graph._set_this(new _PpiGraph(pg))
 		return ppi_graph
 
+	def getLastLoadTime(self):
+		"""Returns the time (in seconds) it took to load the last graph."""
+		return self._this.getLastLoadTime()
+
 
 
 #######################################################################
@@ -26,14 +26,78 @@
 
 #include "SQLiteIO.h"
 #include "Subgraphs.h"
+#include "SnapshotIO.h"
+#include "cputimer.h"
+
+// C includes (mkdir)
+#include <sys/stat.h>
+
+// STL includes
+#include <algorithm>
+#include <unordered_map>
+#include <utility>
+#include <vector>
 
 
 namespace tsppi
 {
 
+namespace
+{
+// the gene dictionary (`pappi.id_mapping.GENE_DICT_TABLE`)
+const std::string GENE_DICT_TABLE = "gene_dict";
+// the suffix of the integer encoded edge tables of the PPIs
+// (`pappi.ppis.ppi.EDGE_TABLE_SUFFIX`)
+const std::string EDGE_TABLE_SUFFIX = "_edges";
+
+/// An (undirected) edge, stored as (u,v) with u <= v
+typedef std::pair<NetworKit::node, NetworKit::node> edge_t;
+
+/**
+ * @brief Creates the graph from the given (unsorted) edges.
+ *
+ * Duplicate edges (in either direction) are removed by sorting the edges,
+ * instead of checking `hasEdge()` (linear in the degree) for every edge.
+ */
+void build_graph(NetworKit::Graph& G, unsigned int graph_size, std::vector<edge_t>& edges)
+{
+    std::sort(edges.begin(), edges.end());
+    edges.erase(std::unique(edges.begin(), edges.end()), edges.end());
+
+    G = NetworKit::Graph(graph_size);
+    for (const edge_t& e : edges)
+    {
+        G.addEdge(e.first, e.second);
+    }
+}
+
+/// Adds the given string (and a separator) to the FNV-1a hash `h`.
+uint64_t fnv1a(uint64_t h, const std::string& str)
+{
+    for (unsigned char c : str)
+    {
+        h = (h ^ c) * 0x100000001b3ULL;
+    }
+    return (h ^ 0xff) * 0x100000001b3ULL;
+}
+
+/// The FNV-1a offset basis
+const uint64_t FNV1A_BASIS = 0xcbf29ce484222325ULL;
+
+/// Returns a hash map (for O(1) lookups) of the given map.
+template <typename K, typename V>
+std::unordered_map<K, V> to_hash_map(const std::map<K, V>& map)
+{
+    return std::unordered_map<K, V>(map.begin(), map.end());
+}
+} // anonymous namespace
+
 
 TsPpiGraph SQLiteIO::load_tsppi_graph(const std::string& ppi_name, const std::string& expr_name)
 {
+    CPUTimer timer;
+    timer.start();
+
     // first load the shared ids
     std::map<std::string, int> id_map;
     get_tsppi_ids(id_map, ppi_name, expr_name);
@@ -54,12 +118,73 @@ TsPpiGraph SQLiteIO::load_tsppi_graph(const std::string& ppi_name, const std::st
     Subgraphs sg(graph, tissue_expr);
     TsPpiGraph result(sg, id_map, tissue_id_map, ppi_name + "_" + expr_name);
 
+    timer.stop();
+    load_time = timer.getTime();
+    return result;
+}
+
+
+TsPpiGraph SQLiteIO::load_tsppi_graph(const std::string& ppi_name, const std::string& expr_name, const std::string& cache_dir)
+{
+    if (cache_dir.empty())
+    {
+        return load_tsppi_graph(ppi_name, expr_name);
+    }
+
+    CPUTimer timer;
+    timer.start();
+
+    const std::string snapshot_file = cache_dir + "/" + ppi_name + "_" + expr_name + SnapshotIO::FILE_SUFFIX;
+    const uint64_t source_stamp = get_source_stamp(ppi_name, expr_name);
+    if (source_stamp == 0)
+    {
+        // the source tables weren't created by the pipeline, thus a
+        // snapshot can't be validated
+        return load_tsppi_graph(ppi_name, expr_name);
+    }
+
+    // load the snapshot, if it is up to date
+    if (SnapshotIO::file_exists(snapshot_file))
+    {
+        try
+        {
+            if (SnapshotIO::read_source_stamp(snapshot_file) == source_stamp)
+            {
+                TsPpiGraph result = SnapshotIO::read_tsppi_graph(snapshot_file);
+                timer.stop();
+                load_time = timer.getTime();
+                return result;
+            }
+        }
+        catch (std::exception& ex)
+        {
+            std::cout << "Ignoring snapshot: " << ex.what() << std::endl;
+        }
+    }
+
+    // otherwise load from the database and (re-)create the snapshot
+    TsPpiGraph result = load_tsppi_graph(ppi_name, expr_name);
+    mkdir(cache_dir.c_str(), 0755);
+    try
+    {
+        SnapshotIO::write_tsppi_graph(snapshot_file, result, source_stamp);
+    }
+    catch (std::exception& ex)
+    {
+        std::cout << "Unable to save snapshot: " << ex.what() << std::endl;
+    }
+
+    timer.stop();
+    load_time = timer.getTime();
     return result;
 }
 
 
 PpiGraph SQLiteIO::load_ppi_graph(const std::string& ppi_name)
 {
+    CPUTimer timer;
+    timer.start();
+
     // first load the shared ids
     std::map<std::string, int> id_map;
     get_ppi_ids(id_map, ppi_name);
@@ -69,6 +194,9 @@ PpiGraph SQLiteIO::load_ppi_graph(const std::string& ppi_name)
     load_graph(g, id_map, ppi_name);
 
     PpiGraph ppi(g, id_map, ppi_name);
+
+    timer.stop();
+    load_time = timer.getTime();
     return ppi;
 }
 
@@ -137,40 +265,104 @@ void SQLiteIO::get_tsppi_ids(std::map<std::string, int>& tsppi_ids, const std::s
 
 void SQLiteIO::load_graph(NetworKit::Graph& G, const std::map<std::string, int>& id_map, const std::string& ppi_name)
 {
-    try
+    // use the integer encoded edges, if available
+    if (table_exists(GENE_DICT_TABLE) && table_exists(ppi_name + EDGE_TABLE_SUFFIX))
     {
-        // get size of graph
-        unsigned int graph_size = id_map.size();
+        load_encoded_graph(G, id_map, ppi_name);
+        return;
+    }
 
-        // create graph
-        G = NetworKit::Graph(graph_size);
+    try
+    {
+        // hash map for the lookups of the gene IDs of all edges
+        std::unordered_map<std::string, int> gene_ids = to_hash_map(id_map);
 
         // query to get edge list
         std::string edgelist_query_str = std::string("SELECT Gene1, Gene2 FROM `") + ppi_name + "`";
         SQLite::Statement edgelist_query(db, edgelist_query_str);
 
         // Loop to execute the query step by step, to get rows of result
+        std::vector<edge_t> edges;
         while (edgelist_query.executeStep())
         {
             // get the result columns
             std::string gene1_id = edgelist_query.getColumn(0);
             std::string gene2_id = edgelist_query.getColumn(1);
 
-            auto gene1_it = id_map.find(gene1_id);
-            auto gene2_it = id_map.find(gene2_id);
+            auto gene1_it = gene_ids.find(gene1_id);
+            auto gene2_it = gene_ids.find(gene2_id);
+            // if both gene IDs are part of the ID map (i.e. part of the
+            // intersection between the PPI and the expression data
+            if (gene1_it != gene_ids.end() && gene2_it != gene_ids.end())
+            {
+                NetworKit::node u = gene1_it->second;
+                NetworKit::node v = gene2_it->second;
+                edges.push_back(edge_t(std::min(u, v), std::max(u, v)));
+            }
+        }
+
+        // create the graph, without duplicate edges
+        build_graph(G, id_map.size(), edges);
+    }
+    catch (std::exception& ex)
+    {
+        std::cout << "SQLite exception: " << ex.what() << std::endl;
+        throw std::runtime_error("unable to load graph");
+    }
+}
+
+void SQLiteIO::load_encoded_graph(NetworKit::Graph& G, const std::map<std::string, int>& id_map, const std::string& ppi_name)
+{
+    try
+    {
+        // map the gene dictionary keys of all genes of the PPI to the node
+        // ids (only one lookup by name per gene, instead of per edge)
+        const std::string edge_table = ppi_name + EDGE_TABLE_SUFFIX;
+        std::stringstream ss;
+        ss << "SELECT id, Gene FROM " << GENE_DICT_TABLE << " WHERE id IN ";
+        ss << "(SELECT Gene1 FROM `" << edge_table << "`";
+        ss << " UNION ";
+        ss << "SELECT Gene2 FROM `" << edge_table << "`)";
+        SQLite::Statement key_query(db, ss.str());
+
+        std::unordered_map<int, int> key_map;
+        while (key_query.executeStep())
+        {
+            int gene_key = key_query.getColumn(0);
+            std::string gene_id = key_query.getColumn(1);
+            auto gene_it = id_map.find(gene_id);
+            if (gene_it != id_map.end())
+            {
+                key_map[gene_key] = gene_it->second;
+            }
+        }
+
+        // query to get the integer encoded edge list
+        std::string edgelist_query_str = std::string("SELECT Gene1, Gene2 FROM `") + edge_table + "`";
+        SQLite::Statement edgelist_query(db, edgelist_query_str);
+
+        // Loop to execute the query step by step, to get rows of result
+        std::vector<edge_t> edges;
+        while (edgelist_query.executeStep())
+        {
+            // get the result columns
+            int gene1_key = edgelist_query.getColumn(0);
+            int gene2_key = edgelist_query.getColumn(1);
+
+            auto gene1_it = key_map.find(gene1_key);
+            auto gene2_it = key_map.find(gene2_key);
             // if both gene IDs are part of the ID map (i.e. part of the
             // intersection between the PPI and the expression data
-            if (gene1_it != id_map.end() && gene2_it != id_map.end())
+            if (gene1_it != key_map.end() && gene2_it != key_map.end())
             {
-                int u = gene1_it->second;
-                int v = gene2_it->second;
-                // check if this edge has already been added
-                if (!G.hasEdge(u, v) && !G.hasEdge(v, u))
-                {
-                    G.addEdge(u, v);
-                }
+                NetworKit::node u = gene1_it->second;
+                NetworKit::node v = gene2_it->second;
+                edges.push_back(edge_t(std::min(u, v), std::max(u, v)));
             }
         }
+
+        // create the graph, without duplicate edges
+        build_graph(G, id_map.size(), edges);
     }
     catch (std::exception& ex)
     {
@@ -179,13 +371,59 @@ void SQLiteIO::load_graph(NetworKit::Graph& G, const std::map<std::string, int>&
     }
 }
 
-void SQLiteIO::load_tissue_expression(Subgraphs::node_labels_t& tissue_expr, const std::map<std::string, int> id_map, std::map<std::string, int> tissue_id_map, const std::string& expr_name)
+bool SQLiteIO::table_exists(const std::string& table_name)
+{
+    SQLite::Statement query(db, "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = ?");
+    query.bind(1, table_name);
+    query.executeStep();
+    int count = query.getColumn(0);
+    return count > 0;
+}
+
+uint64_t SQLiteIO::get_source_stamp(const std::string& ppi_name, const std::string& expr_name)
+{
+    // the fingerprints of the stages which created the PPI and the
+    // expression core table (see `pappi.stage_cache`)
+    if (!table_exists("pipeline_stages"))
+    {
+        return 0;
+    }
+    try
+    {
+        uint64_t h = FNV1A_BASIS;
+        const std::string stages[] = {"ppi:" + ppi_name, "core:" + expr_name};
+        for (const std::string& stage : stages)
+        {
+            SQLite::Statement query(db, "SELECT fingerprint FROM pipeline_stages WHERE stage = ?");
+            query.bind(1, stage);
+            if (!query.executeStep())
+            {
+                return 0;
+            }
+            std::string fingerprint = query.getColumn(0);
+            h = fnv1a(h, fingerprint);
+        }
+        // never return the stamp of unknown source tables
+        return h == 0 ? 1 : h;
+    }
+    catch (std::exception& ex)
+    {
+        std::cout << "SQLite exception: " << ex.what() << std::endl;
+        throw std::runtime_error("unable to read the stage fingerprints");
+    }
+}
+
+void SQLiteIO::load_tissue_expression(Subgraphs::node_labels_t& tissue_expr, const std::map<std::string, int>& id_map, const std::map<std::string, int>& tissue_id_map, const std::string& expr_name)
 {
     try
     {
         // remember the number of tissues
         const int nTissues = tissue_id_map.size();
 
+        // hash maps for the lookups of the genes and tissues of all rows
+        std::unordered_map<std::string, int> gene_ids = to_hash_map(id_map);
+        std::unordered_map<std::string, int> tissue_ids = to_hash_map(tissue_id_map);
+
         // query to load the core of the expression dataset
         const std::string nodeexpr_query_str = std::string("SELECT Gene, Type, Expressed FROM ") + expr_name + "_core";
         SQLite::Statement nodeexpr_query(db, nodeexpr_query_str);
@@ -204,14 +442,15 @@ void SQLiteIO::load_tissue_expression(Subgraphs::node_labels_t& tissue_expr, con
             int expressed_bit = nodeexpr_query.getColumn(2);
 
             // check if gene is used
-            auto gene_it = id_map.find(gene_name);
-            if (gene_it != id_map.end())
+            auto gene_it = gene_ids.find(gene_name);
+            auto tissue_it = tissue_ids.find(tissue_name);
+            if (gene_it != gene_ids.end() && tissue_it != tissue_ids.end())
             {
                 // get gene index
                 int gene_id = gene_it->second;
 
                 // get the tissue index
-                int tissue_id = tissue_id_map[tissue_name];
+                int tissue_id = tissue_it->second;
 
                 // set relevant entry of the matrix
                 tissue_expr[gene_id][tissue_id] = expressed_bit == 0 ? false : true;
@@ -49,6 +49,8 @@ private:
     std::string db_filename;
     /// The SQLite database instance
     SQLite::Database db;
+    /// The time (in seconds) it took to load the last graph
+    double load_time;
 
 public:
     /**
@@ -57,7 +59,8 @@ public:
      * @param database_filename The filepath to the SQLite Database file.
      */
     SQLiteIO(const std::string & database_filename)
-        : db_filename(database_filename), db(database_filename, SQLITE_OPEN_READWRITE) {}
+        : db_filename(database_filename), db(database_filename, SQLITE_OPEN_READWRITE),
+          load_time(0.0) {}
 
     /// Destructor
     virtual ~SQLiteIO() {}
@@ -65,9 +68,32 @@ public:
     // load the tissue specific graph
     TsPpiGraph load_tsppi_graph(const std::string& ppi_name, const std::string& expr_name);
 
+    /**
+     * @brief Loads the tissue specific graph via a snapshot in `cache_dir`.
+     *
+     * If the directory holds a snapshot (see `SnapshotIO`) of the graph,
+     * which was created from the same source tables, the graph is loaded
+     * from the snapshot. Otherwise, the graph is loaded from the database
+     * and the snapshot is (re-)created. An empty `cache_dir` disables the
+     * snapshots.
+     *
+     * The source tables are identified by the fingerprints of the
+     * `ppi:<ppi>` and `core:<expr>` stages in the `pipeline_stages` table
+     * (see `pappi.stage_cache`), which change with the input files, the
+     * code and all upstream stages (e.g. the ID mapping). Without these
+     * fingerprints, the graph is always loaded from the database.
+     */
+    TsPpiGraph load_tsppi_graph(const std::string& ppi_name, const std::string& expr_name, const std::string& cache_dir);
+
     // load the global Ppi graph (no tissue specific)
     PpiGraph load_ppi_graph(const std::string& ppi_name);
 
+    /// Returns the time (in seconds) it took to load the last graph
+    double getLastLoadTime() const
+    {
+        return load_time;
+    }
+
     // Returns SQLite datatypes for the given C++ datatype
     template <typename T>
     static std::string getSqlType();
@@ -79,9 +105,15 @@ private:
     void get_tsppi_ids(std::map<std::string, int>& tsppi_ids, const std::string& ppi_name, const std::string& expr_name);
     /// Loads the graph from the database.
     void load_graph(NetworKit::Graph& G, const std::map<std::string, int>& id_map, const std::string& ppi_name);
+    /// Loads the graph from the integer encoded edge table of the PPI.
+    void load_encoded_graph(NetworKit::Graph& G, const std::map<std::string, int>& id_map, const std::string& ppi_name);
+    /// Returns whether the given table exists in the database.
+    bool table_exists(const std::string& table_name);
+    /// Returns a hash of the fingerprints of the stages which created the source tables (0 if unknown).
+    uint64_t get_source_stamp(const std::string& ppi_name, const std::string& expr_name);
 
     /// Loads the tissue specific expression from the database
-    void load_tissue_expression(Subgraphs::node_labels_t& tissue_expr, const std::map<std::string, int> id_map, const std::map<std::string, int> tissue_id_map, const std::string& expr_name);
+    void load_tissue_expression(Subgraphs::node_labels_t& tissue_expr, const std::map<std::string, int>& id_map, const std::map<std::string, int>& tissue_id_map, const std::string& expr_name);
     /// Loads the tissue-name -> integer mapping from the database
     void get_tissue_id_map(std::map<std::string, int>& tissue_id_map, const std::string& expr_name);
 };
@@ -0,0 +1,339 @@
+/*
+ * Copyright (c) 2014 Patrick Flick <patrick.flick@gmail.com>
+ *
+ * Permission is hereby granted, free of charge, to any person
+ * obtaining a copy of this software and associated documentation
+ * files (the "Software"), to deal in the Software without
+ * restriction, including without limitation the rights to use,
+ * copy, modify, merge, publish, distribute, sublicense, and/or sell
+ * copies of the Software, and to permit persons to whom the
+ * Software is furnished to do so, subject to the following
+ * conditions:
+ *
+ * The above copyright notice and this permission notice shall be
+ * included in all copies or substantial portions of the Software.
+ *
+ * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+ * EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+ * OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+ * NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+ * WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+ * FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+ * OTHER DEALINGS IN THE SOFTWARE.
+ *
+ */
+
+#include "SnapshotIO.h"
+#include "Subgraphs.h"
+
+// C includes (mmap)
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+// STL includes
+#include <algorithm>
+#include <cstdio>
+#include <cstring>
+#include <fstream>
+#include <iterator>
+#include <map>
+#include <numeric>
+#include <stdexcept>
+#include <utility>
+#include <vector>
+
+
+namespace tsppi
+{
+
+const std::string SnapshotIO::FILE_SUFFIX = ".tsppi";
+
+namespace
+{
+
+const char SNAPSHOT_MAGIC[8] = {'T', 'S', 'P', 'P', 'I', 'S', 'N', 'P'};
+const uint32_t SNAPSHOT_VERSION = 1;
+// written in native byte order, to detect files of a different endianness
+const uint32_t SNAPSHOT_BYTE_ORDER = 0x01020304;
+
+typedef Subgraphs::node_label_t::block_type block_t;
+
+/// The header at the beginning of every snapshot file
+struct snapshot_header
+{
+    char magic[8];
+    uint32_t version;
+    uint32_t byte_order;
+    /// the size (in bytes) of the node label blocks
+    uint64_t block_size;
+    uint64_t num_nodes;
+    uint64_t num_edges;
+    uint64_t num_tissues;
+    /// the number of blocks per node label
+    uint64_t num_blocks;
+    /// the size (in bytes) of the name tables
+    uint64_t names_size;
+    uint64_t source_stamp;
+};
+
+/// Returns the given size rounded up to a multiple of 8 bytes.
+inline std::size_t aligned(std::size_t size)
+{
+    return (size + 7) & ~static_cast<std::size_t>(7);
+}
+
+/// The byte offsets of the sections of a snapshot file
+struct snapshot_layout
+{
+    std::size_t offsets;
+    std::size_t targets;
+    std::size_t labels;
+    std::size_t names;
+    std::size_t file_size;
+
+    snapshot_layout(const snapshot_header& header)
+    {
+        offsets = sizeof(snapshot_header);
+        targets = offsets + aligned(sizeof(uint64_t) * (header.num_nodes + 1));
+        labels = targets + aligned(sizeof(uint32_t) * header.num_edges);
+        names = labels + aligned(header.block_size * header.num_nodes * header.num_blocks);
+        file_size = names + header.names_size;
+    }
+};
+
+/// A read-only memory mapping of a whole file
+class mapped_file
+{
+    void* data;
+    std::size_t size;
+public:
+    mapped_file(const std::string& filename) : data(MAP_FAILED), size(0)
+    {
+        int fd = open(filename.c_str(), O_RDONLY);
+        if (fd < 0)
+            throw std::runtime_error("unable to open snapshot file " + filename);
+        struct stat file_stat;
+        if (fstat(fd, &file_stat) == 0 && file_stat.st_size > 0)
+        {
+            size = file_stat.st_size;
+            data = mmap(NULL, size, PROT_READ, MAP_PRIVATE, fd, 0);
+        }
+        close(fd);
+        if (data == MAP_FAILED)
+            throw std::runtime_error("unable to map snapshot file " + filename);
+    }
+
+    ~mapped_file()
+    {
+        munmap(data, size);
+    }
+
+    const char* begin() const
+    {
+        return static_cast<const char*>(data);
+    }
+
+    std::size_t length() const
+    {
+        return size;
+    }
+};
+
+/// Checks the header of the mapped snapshot file and returns it.
+const snapshot_header& check_header(const mapped_file& file, const std::string& filename)
+{
+    if (file.length() < sizeof(snapshot_header))
+        throw std::runtime_error("truncated snapshot file " + filename);
+    const snapshot_header& header = *reinterpret_cast<const snapshot_header*>(file.begin());
+    if (std::memcmp(header.magic, SNAPSHOT_MAGIC, sizeof(SNAPSHOT_MAGIC)) != 0)
+        throw std::runtime_error("not a snapshot file: " + filename);
+    if (header.version != SNAPSHOT_VERSION || header.byte_order != SNAPSHOT_BYTE_ORDER
+            || header.block_size != sizeof(block_t))
+        throw std::runtime_error("incompatible snapshot file " + filename);
+    if (snapshot_layout(header).file_size != file.length())
+        throw std::runtime_error("truncated snapshot file " + filename);
+    return header;
+}
+
+/// Returns the next `\0` terminated name of the name tables.
+std::string next_name(const char*& pos, const char* end)
+{
+    const char* name_end = static_cast<const char*>(std::memchr(pos, '\0', end - pos));
+    if (name_end == NULL)
+        throw std::runtime_error("corrupt name table in snapshot file");
+    std::string name(pos, name_end);
+    pos = name_end + 1;
+    return name;
+}
+
+/// Writes the bytes of the given vector, padded to a multiple of 8 bytes.
+template <typename T>
+void write_section(std::ofstream& out, const std::vector<T>& section)
+{
+    const std::size_t size = sizeof(T) * section.size();
+    const char padding[8] = {0};
+    out.write(reinterpret_cast<const char*>(section.data()), size);
+    out.write(padding, aligned(size) - size);
+}
+
+} // anonymous namespace
+
+
+void SnapshotIO::write_tsppi_graph(const std::string& filename, TsPpiGraph& tsppi, uint64_t source_stamp)
+{
+    const NetworKit::Graph& graph = tsppi.subgraphs.graph;
+    const Subgraphs::node_labels_t& labels = tsppi.subgraphs.node_exists;
+    const uint64_t num_nodes = graph.numberOfNodes();
+    const uint64_t num_tissues = tsppi.numberOfTissues();
+
+    // get all edges as (u,v) with u <= v in CSR order
+    std::vector<std::pair<uint32_t, uint32_t> > edges;
+    edges.reserve(graph.numberOfEdges());
+    graph.forEdges([&](NetworKit::node u, NetworKit::node v) {
+        edges.push_back(std::make_pair(std::min(u, v), std::max(u, v)));
+    });
+    std::sort(edges.begin(), edges.end());
+    edges.erase(std::unique(edges.begin(), edges.end()), edges.end());
+
+    std::vector<uint64_t> offsets(num_nodes + 1, 0);
+    std::vector<uint32_t> targets(edges.size());
+    for (std::size_t i = 0; i < edges.size(); ++i)
+    {
+        offsets[edges[i].first + 1]++;
+        targets[i] = edges[i].second;
+    }
+    std::partial_sum(offsets.begin(), offsets.end(), offsets.begin());
+
+    // the blocks of all node labels
+    const uint64_t num_blocks = labels.empty() ? 0 : labels[0].num_blocks();
+    std::vector<block_t> blocks;
+    blocks.reserve(num_nodes * num_blocks);
+    for (uint64_t u = 0; u < num_nodes; ++u)
+    {
+        if (labels[u].num_blocks() != num_blocks)
+            throw std::runtime_error("node labels of different sizes");
+        boost::to_block_range(labels[u], std::back_inserter(blocks));
+    }
+
+    // the name tables
+    std::vector<char> names;
+    for (uint64_t u = 0; u < num_nodes; ++u)
+    {
+        std::string name = tsppi.getGeneName(u);
+        names.insert(names.end(), name.c_str(), name.c_str() + name.size() + 1);
+    }
+    for (uint64_t t = 0; t < num_tissues; ++t)
+    {
+        std::string name = tsppi.getTissueName(t);
+        names.insert(names.end(), name.c_str(), name.c_str() + name.size() + 1);
+    }
+    names.insert(names.end(), tsppi.ppi_name.c_str(), tsppi.ppi_name.c_str() + tsppi.ppi_name.size() + 1);
+
+    snapshot_header header;
+    std::memcpy(header.magic, SNAPSHOT_MAGIC, sizeof(SNAPSHOT_MAGIC));
+    header.version = SNAPSHOT_VERSION;
+    header.byte_order = SNAPSHOT_BYTE_ORDER;
+    header.block_size = sizeof(block_t);
+    header.num_nodes = num_nodes;
+    header.num_edges = targets.size();
+    header.num_tissues = num_tissues;
+    header.num_blocks = num_blocks;
+    header.names_size = names.size();
+    header.source_stamp = source_stamp;
+
+    // write into a temporary file first, and replace the snapshot only once
+    // it is complete (the process ID keeps concurrent writers of the same
+    // snapshot apart)
+    const std::string tmp_filename = filename + "." + std::to_string(getpid()) + ".tmp";
+    {
+        std::ofstream out(tmp_filename.c_str(), std::ios::out | std::ios::binary | std::ios::trunc);
+        out.write(reinterpret_cast<const char*>(&header), sizeof(header));
+        write_section(out, offsets);
+        write_section(out, targets);
+        write_section(out, blocks);
+        out.write(names.data(), names.size());
+        if (!out)
+        {
+            std::remove(tmp_filename.c_str());
+            throw std::runtime_error("unable to write snapshot file " + tmp_filename);
+        }
+    }
+    if (std::rename(tmp_filename.c_str(), filename.c_str()) != 0)
+    {
+        std::remove(tmp_filename.c_str());
+        throw std::runtime_error("unable to write snapshot file " + filename);
+    }
+}
+
+
+TsPpiGraph SnapshotIO::read_tsppi_graph(const std::string& filename)
+{
+    mapped_file file(filename);
+    const snapshot_header& header = check_header(file, filename);
+    const snapshot_layout layout(header);
+
+    const uint64_t* offsets = reinterpret_cast<const uint64_t*>(file.begin() + layout.offsets);
+    const uint32_t* targets = reinterpret_cast<const uint32_t*>(file.begin() + layout.targets);
+    const block_t* blocks = reinterpret_cast<const block_t*>(file.begin() + layout.labels);
+    const char* names = file.begin() + layout.names;
+    const uint64_t num_nodes = header.num_nodes;
+
+    // create the graph from the CSR adjacency, the edges are unique, so
+    // there is no need for `hasEdge()` checks
+    if (offsets[num_nodes] != header.num_edges)
+        throw std::runtime_error("corrupt adjacency in snapshot file " + filename);
+    NetworKit::Graph graph(num_nodes);
+    for (uint64_t u = 0; u < num_nodes; ++u)
+    {
+        if (offsets[u] > offsets[u + 1] || offsets[u + 1] > header.num_edges)
+            throw std::runtime_error("corrupt adjacency in snapshot file " + filename);
+        for (uint64_t i = offsets[u]; i < offsets[u + 1]; ++i)
+        {
+            if (targets[i] >= num_nodes)
+                throw std::runtime_error("corrupt adjacency in snapshot file " + filename);
+            graph.addEdge(u, targets[i]);
+        }
+    }
+
+    // copy the node label blocks into the bitsets
+    Subgraphs::node_labels_t labels(num_nodes);
+    for (uint64_t u = 0; u < num_nodes; ++u)
+    {
+        const block_t* node_blocks = blocks + u * header.num_blocks;
+        labels[u] = Subgraphs::node_label_t(node_blocks, node_blocks + header.num_blocks);
+        labels[u].resize(header.num_tissues);
+    }
+
+    // read the name tables
+    const char* pos = names;
+    const char* names_end = names + header.names_size;
+    std::map<std::string, int> id_map;
+    for (uint64_t u = 0; u < num_nodes; ++u)
+        id_map[next_name(pos, names_end)] = u;
+    std::map<std::string, int> tissue_id_map;
+    for (uint64_t t = 0; t < header.num_tissues; ++t)
+        tissue_id_map[next_name(pos, names_end)] = t;
+    std::string name = next_name(pos, names_end);
+
+    Subgraphs sg(graph, labels);
+    return TsPpiGraph(sg, id_map, tissue_id_map, name);
+}
+
+
+uint64_t SnapshotIO::read_source_stamp(const std::string& filename)
+{
+    mapped_file file(filename);
+    return check_header(file, filename).source_stamp;
+}
+
+
+bool SnapshotIO::file_exists(const std::string& filename)
+{
+    struct stat file_stat;
+    return stat(filename.c_str(), &file_stat) == 0;
+}
+
+} // namespace tsppi
@@ -0,0 +1,98 @@
+/*
+ * Copyright (c) 2014 Patrick Flick <patrick.flick@gmail.com>
+ *
+ * Permission is hereby granted, free of charge, to any person
+ * obtaining a copy of this software and associated documentation
+ * files (the "Software"), to deal in the Software without
+ * restriction, including without limitation the rights to use,
+ * copy, modify, merge, publish, distribute, sublicense, and/or sell
+ * copies of the Software, and to permit persons to whom the
+ * Software is furnished to do so, subject to the following
+ * conditions:
+ *
+ * The above copyright notice and this permission notice shall be
+ * included in all copies or substantial portions of the Software.
+ *
+ * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+ * EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+ * OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+ * NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+ * WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+ * FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+ * OTHER DEALINGS IN THE SOFTWARE.
+ *
+ */
+
+#ifndef SNAPSHOTIO_H
+#define SNAPSHOTIO_H
+
+// STL includes
+#include <string>
+
+// own includes
+#include <PpiGraph.h>
+
+namespace tsppi
+{
+
+/**
+ * @brief Snapshots of tissue specific PPI graphs.
+ *
+ * A snapshot is a single binary file (in native byte order) holding the
+ * complete `TsPpiGraph`, so that it can be loaded by mapping the file into
+ * memory instead of querying and joining the SQLite tables again. The file
+ * consists of a fixed size header, followed by 8 byte aligned sections:
+ *
+ *  - the CSR offsets (uint64_t[#nodes + 1]) and the CSR targets
+ *    (uint32_t[#edges]) of the graph, each undirected edge {u,v} is stored
+ *    once as u < v (or u == v for self loops) in the row of u.
+ *  - the node labels, the blocks of the `boost::dynamic_bitset` of each
+ *    node (Subgraphs::node_label_t::block_type[#nodes * #blocks]).
+ *  - the name tables: the `\0` terminated names of all genes (by node id),
+ *    followed by the names of all tissues (by tissue id) and the name of
+ *    the graph.
+ */
+class SnapshotIO
+{
+public:
+    /// The file extension of snapshot files
+    static const std::string FILE_SUFFIX;
+
+    /**
+     * @brief Writes the snapshot of the given graph into the file.
+     *
+     * The snapshot is first written into a temporary file, which is then
+     * renamed, so that an existing snapshot is never partially overwritten.
+     *
+     * @param filename      The snapshot file path.
+     * @param tsppi         The graph.
+     * @param source_stamp  An arbitrary value identifying the source data of
+     *                      the graph, which is stored in the header.
+     */
+    static void write_tsppi_graph(const std::string& filename, TsPpiGraph& tsppi, uint64_t source_stamp = 0);
+
+    /**
+     * @brief Loads the graph from the snapshot file via `mmap`.
+     *
+     * @param filename      The snapshot file path.
+     *
+     * @throws std::runtime_error if the file is not a valid snapshot.
+     */
+    static TsPpiGraph read_tsppi_graph(const std::string& filename);
+
+    /**
+     * @brief Returns the source stamp stored in the header of the snapshot
+     *        file.
+     *
+     * @throws std::runtime_error if the file is not a valid snapshot.
+     */
+    static uint64_t read_source_stamp(const std::string& filename);
+
+    /// Returns whether the file exists.
+    static bool file_exists(const std::string& filename);
+};
+
+} // namespace tsppi
+
+#endif // SNAPSHOTIO_H
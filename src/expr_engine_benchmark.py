@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+#
+# This script validates the NumPy based `ExpressionMatrix` engine against the
+# SQL implementation of the expression post-processing (removing duplicates,
+# classification, expression counts and the core tables) on all five
+# expression data sets and compares their run times.
+#
+# The normalized tables (`<name>_normalized`) have to exist in the database,
+# i.e. `init_data.py` has to be run first.
+
+# for timing
+import time
+
+import pappi.sql
+from pappi.data_config import *
+from pappi.expr.hpa import HPA
+from pappi.expr.hpa_all import HPA_All
+from pappi.expr.emtab import Emtab
+from pappi.expr.rnaseq_atlas import RnaSeqAtlas
+from pappi.expr.gene_atlas import GeneAtlas
+
+# the tables created by the post-processing (suffixes to the data set name)
+RESULT_TABLES = ["", "_expr_counts", "_core", "_core_expr_counts"]
+
+
+def post_process(expr, name, use_matrix_engine, threshold):
+    """
+    Runs the post-processing of the normalized table of the data set `expr`
+    into tables with the given name.
+    """
+    normalized_table = expr.name + "_normalized"
+    expr.name = name
+    expr.use_matrix_engine = use_matrix_engine
+    expr.cur_tmp_name = normalized_table
+    start = time.time()
+    expr.rm_duplicates()
+    expr.classify()
+    expr.expr_counts()
+    expr.create_core_table(threshold)
+    expr.expr_counts(True)
+    return time.time() - start
+
+
+def tables_equal(table1, table2, con):
+    cur = con.cursor()
+    for t1, t2 in [(table1, table2), (table2, table1)]:
+        cur.execute('SELECT COUNT(*) FROM (SELECT * FROM ' + t1 + ' EXCEPT '
+                    'SELECT * FROM ' + t2 + ')')
+        if cur.fetchone()[0] != 0:
+            return False
+    cur.close()
+    return (pappi.sql.get_column_names(table1, con)
+            == pappi.sql.get_column_names(table2, con))
+
+
+def benchmark(expr_class, filename, con):
+    name = expr_class(filename, con).name
+    # use the same core threshold for both
+    threshold = expr_class(filename, con).get_optimal_coverage_threshold()
+    sql_time = post_process(expr_class(filename, con), "cmp_sql_" + name,
+                            False, threshold)
+    matrix_time = post_process(expr_class(filename, con),
+                               "cmp_matrix_" + name, True, threshold)
+    for suffix in RESULT_TABLES:
+        if not tables_equal("cmp_sql_" + name + suffix,
+                            "cmp_matrix_" + name + suffix, con):
+            print("[WARNING] tables differ for " + name + suffix)
+    print("%s\t%.2f\t%.2f\t%.2f" % (name, sql_time, matrix_time,
+                                    sql_time / max(matrix_time, 1e-9)))
+    # clean up
+    cur = con.cursor()
+    for prefix in ["cmp_sql_", "cmp_matrix_"]:
+        for suffix in RESULT_TABLES + ["_no_dupl", "_tissues"]:
+            cur.execute('DROP TABLE IF EXISTS ' + prefix + name + suffix)
+    cur.close()
+    con.commit()
+
+
+if __name__ == '__main__':
+    con = pappi.sql.get_conn(DATABASE)
+    print("dataset\tsql_time\tmatrix_time\tspeedup")
+    benchmark(HPA, HPA_FILE, con)
+    benchmark(HPA_All, HPA_FILE, con)
+    benchmark(Emtab, EMTAB_FILE, con)
+    benchmark(RnaSeqAtlas, RNASEQ_ATLAS_FILE, con)
+    benchmark(GeneAtlas, GENE_ATLAS_FILE, con)
@@ -17,10 +17,11 @@ if __name__ == "__main__":
     namespaces = ["biological_process", "molecular_function",
                   "cellular_component"]
     # first import all:
-    dag = fastdag.GODag(GO_OBO_FILE)
+    dag = fastdag.GODag(GO_OBO_FILE, cache_dir=GO_DAG_CACHE_FOLDER)
     print("Whole graph size: " + str(dag_graph_size(dag)))
 
     for namespace in namespaces:
-        new_dag = fastdag.GODag(GO_OBO_FILE, only_namespace=namespace)
+        new_dag = fastdag.GODag(GO_OBO_FILE, only_namespace=namespace,
+                                cache_dir=GO_DAG_CACHE_FOLDER)
         print("namespace '" + namespace + "' graph size: "
               + str(dag_graph_size(new_dag)))
@@ -373,6 +373,7 @@ if __name__ == "__main__":
         print(" getting graph properties of `" + ppi_name + "`")
         print("##################################################")
         ppi = sqlio.load_ppi_graph(ppi_name)
+        timings[(ppi_name, 'load')] = sqlio.getLastLoadTime()
         timings = get_graph_properties(ppi, con, True, timings)
         timings = get_node_properties(ppi, con, True, timings)
         save_timings(timings, con, "ppi_graph_stats_timings")
@@ -389,7 +390,9 @@ if __name__ == "__main__":
             print("##################################################")
             print(" getting graph properties of `" + graph_name + "`")
             print("##################################################")
-            tsppi = sqlio.load_tsppi_graph(ppi_name, expr_name)
+            tsppi = sqlio.load_tsppi_graph(ppi_name, expr_name,
+                                           TSPPI_CACHE_FOLDER)
+            timings[(graph_name, 'load')] = sqlio.getLastLoadTime()
 
             # global ts graph properties
             timings = get_graph_properties(tsppi, con, True, timings)
@@ -410,7 +413,8 @@ if __name__ == "__main__":
             print("##################################################")
             print(" getting TS tissue properties of `" + graph_name + "`")
             print("##################################################")
-            tsppi = sqlio.load_tsppi_graph(ppi_name, expr_name)
+            tsppi = sqlio.load_tsppi_graph(ppi_name, expr_name,
+                                           TSPPI_CACHE_FOLDER)
 
             # get tissue specific graph properties (no timing for this
             # available)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+#
+# This script compares the run times of the SQL JOIN based identifier mapping
+# and the in-memory mapping (`id_mapping.map_rows_in_memory`) for the PPI
+# networks, including the statistics of the (verbose) mapping, and checks that
+# both result in the same tables.
+#
+# The ID mapping tables have to exist in the database, i.e. `init_data.py`
+# has to be run first.
+
+# for timing
+import time
+
+import pappi.sql
+import pappi.id_mapping
+from pappi.data_config import *
+from pappi.ppis.ccsb import CCSB
+from pappi.ppis.bossi_lehner import Bossi_Lehner
+from pappi.ppis.havu import Havugimana
+from pappi.ppis.string import StringDB
+
+# the tables created by the mapping (suffixes to the mapped table)
+RESULT_TABLES = ["", "_unmatched_ids", "_unmatched_rows"]
+
+
+def count_diff(table1, table2, con):
+    cur = con.cursor()
+    cur.execute('SELECT COUNT(*) FROM (SELECT * FROM ' + table1 + ' EXCEPT '
+                'SELECT * FROM ' + table2 + ')')
+    result = cur.fetchone()[0]
+    cur.close()
+    return result
+
+
+def map_ids(ppi, src_table, dst_table, in_memory, con):
+    start = time.time()
+    pappi.id_mapping.map_identifier(src_table, [ppi.gene1_colname,
+                                    ppi.gene2_colname], ppi.orig_id,
+                                    dst_table, pappi.id_mapping.UNIFYING_ID,
+                                    con, verbose=True, in_memory=in_memory,
+                                    unmatched_tables=True)
+    return time.time() - start
+
+
+def benchmark(ppi, con):
+    ppi.import_raw_file()
+    ppi.filter()
+    src_table = ppi.get_cur_tmp_table()
+
+    cur = con.cursor()
+    cur.execute('SELECT MAX(rowid) FROM '
+                + pappi.id_mapping.MAPPING_STATS_TABLE)
+    last_stats_row = cur.fetchone()[0]
+
+    sql_time = map_ids(ppi, src_table, "cmp_sql_mapped", False, con)
+    memory_time = map_ids(ppi, src_table, "cmp_memory_mapped", True, con)
+    for suffix in RESULT_TABLES:
+        if (count_diff("cmp_sql_mapped" + suffix,
+                       "cmp_memory_mapped" + suffix, con) != 0
+                or count_diff("cmp_memory_mapped" + suffix,
+                              "cmp_sql_mapped" + suffix, con) != 0):
+            print("[WARNING] tables differ for " + ppi.name + suffix)
+    cur.execute('SELECT total_ids, matched_ids, total_rows, matched_rows, '
+                'unmatched_rows FROM ' + pappi.id_mapping.MAPPING_STATS_TABLE
+                + ' WHERE rowid > ?', [last_stats_row])
+    stats = cur.fetchall()
+    if len(stats) != 2 or stats[0] != stats[1]:
+        print("[WARNING] mapping statistics differ for " + ppi.name)
+
+    print("%s\t%.2f\t%.2f\t%.2f" % (ppi.name, sql_time, memory_time,
+                                    sql_time / max(memory_time, 1e-9)))
+    # clean up
+    cur.execute('DELETE FROM ' + pappi.id_mapping.MAPPING_STATS_TABLE + ' '
+                'WHERE rowid > ?', [last_stats_row])
+    for prefix in ["cmp_sql_mapped", "cmp_memory_mapped"]:
+        for suffix in RESULT_TABLES:
+            cur.execute('DROP TABLE IF EXISTS ' + prefix + suffix)
+    for suffix in ["raw", "filtered"]:
+        cur.execute('DROP TABLE IF EXISTS ' + ppi.name + '_' + suffix)
+    cur.close()
+    con.commit()
+
+
+if __name__ == '__main__':
+    con = pappi.sql.get_conn(DATABASE)
+    print("ppi\tsql_time\tmemory_time\tspeedup")
+    benchmark(CCSB(CCSB_FILE, con), con)
+    benchmark(Bossi_Lehner(BOSSI_FILE, con), con)
+    benchmark(Havugimana(HAVU_FILE, con), con)
+    benchmark(StringDB(STRING_FILE, con), con)
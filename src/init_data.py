@@ -18,31 +18,111 @@
 # - Expression `core` datasets
 # - Gene + edge overlaps of datasets (PPI vs PPI, Expr vs Expr, PPI vs. Expr)
 # - Expression aggregation statistics
-
+#
+# Every step is run as a stage of the `StageCache`: re-running this script
+# only rebuilds the stages whose input files, parameters, code or upstream
+# stages changed. Run with `--rebuild` to delete the database and rebuild
+# everything from scratch. Intermediate tables of the PPI and expression
+# pre-processing are only written to the database with `--keep-intermediates`.
+# Independent stages are run concurrently (see `pappi.task_graph`), a timing
+# report with the critical path of the stages is printed at the end.
+
+import functools
 import os
 import re
+import sys
+import pappi.binary_io
 import pappi.id_mapping
 import pappi.sql
+import pappi.table_manager
 from pappi.data_config import *
+from pappi.stage_cache import StageCache
+from pappi.table_manager import TableManager
+from pappi.task_graph import TaskGraph
 
 ##############################
 # get database connection
 ##############################
 
-# first delete an old DB, to make sure everything is new
-if (os.path.exists(DATABASE)):
+# delete an old DB, if everything is to be rebuilt from scratch
+if "--rebuild" in sys.argv and os.path.exists(DATABASE):
     os.remove(DATABASE)
 
-# get new database connection
+# get database connection
 con = pappi.sql.get_conn(DATABASE)
 
+# the stage cache for skipping up-to-date stages
+stages = StageCache(con)
+
+# the intermediate tables of the PPIs and expression data sets are only kept
+# in memory (unless run with `--keep-intermediates`)
+TableManager.staging = "--keep-intermediates" not in sys.argv
+
+# the mapping stats are kept across runs with a single row per mapped table
+# (the stages running in parallel append their rows to it)
+pappi.id_mapping.create_mapping_stats_table(con)
+
+# the stages are run as task graph: independent stages (all PPIs and
+# expression data sets) are run concurrently in worker processes
+graph = TaskGraph(stages, DATABASE,
+                  append_tables=[pappi.id_mapping.MAPPING_STATS_TABLE])
+
+# the shared modules every stage reads and writes its tables with, their
+# source code is part of the fingerprint of the stages (see `StageCache`)
+SQL_CODE = [pappi.sql]
+TABLE_CODE = SQL_CODE + [pappi.table_manager, pappi.binary_io]
+
 
 ##############################
 # import the mapping tables
 ##############################
 
-pappi.id_mapping.import_biomart_file(BIOMART_FILE, con)
-pappi.id_mapping.import_hgnc_file(HGNC_FILE, con)
+def import_mapping_tables(sql_conn):
+    pappi.id_mapping.import_biomart_file(BIOMART_FILE, sql_conn)
+    pappi.id_mapping.import_hgnc_file(HGNC_FILE, sql_conn)
+
+# the lazily created mapping tables (`<from>_2_<to>`, `<id>_all_ids`) are
+# derived from the mapping tables and thus have to be dropped on a rebuild
+graph.add("mapping", import_mapping_tables,
+          files=[BIOMART_FILE, HGNC_FILE],
+          code=[pappi.id_mapping] + SQL_CODE,
+          outputs=["biomart", "hgnc"],
+          drop=(pappi.sql.get_table_names(con, "%\\_2\\_%")
+                + pappi.sql.get_table_names(con, "%\\_all\\_ids")))
+
+# the identifier catalog: all identifiers of the mapping tables and their
+# candidate matches, from which all `<from>_2_<to>` tables are created (for
+# any resolution of ambiguous matches), and the gene dictionary by which the
+# genes of the `<ppi>_edges` tables are encoded
+graph.add("id_catalog",
+          functools.partial(pappi.id_mapping.create_id_catalog, verbose=True),
+          upstream=["mapping"], code=[pappi.id_mapping] + SQL_CODE,
+          outputs=[pappi.id_mapping.ID_CATALOG_TABLE,
+                   pappi.id_mapping.ID_CATALOG_MAP_TABLE,
+                   pappi.id_mapping.ID_CATALOG_AMBIGUITIES_TABLE,
+                   pappi.id_mapping.GENE_DICT_TABLE])
+
+# the mapping tables (and their indexes) needed by the PPIs and expression
+# data sets are created upfront, since the stages running in parallel can only
+# read the shared database
+MAPPED_ID_TYPES = ["ensembl", "uniprot", "ensp"]
+UNIFYING_ID = pappi.id_mapping.UNIFYING_ID
+
+
+def create_mapping_tables(sql_conn):
+    for from_id in MAPPED_ID_TYPES:
+        pappi.id_mapping.create_mapping_table(from_id, UNIFYING_ID, sql_conn,
+                                              True)
+        pappi.id_mapping.create_mapping_table_index(from_id, UNIFYING_ID,
+                                                    sql_conn)
+    pappi.id_mapping.create_all_id_table(UNIFYING_ID, sql_conn)
+
+graph.add("mapping_tables", create_mapping_tables, upstream=["id_catalog"],
+          params=MAPPED_ID_TYPES, code=[pappi.id_mapping] + SQL_CODE,
+          outputs=([i + "_2_" + UNIFYING_ID for i in MAPPED_ID_TYPES]
+                   + [i + "_all_ids"
+                      for i in MAPPED_ID_TYPES + [UNIFYING_ID]]))
+mapping_stages = ["mapping", "id_catalog", "mapping_tables"]
 
 
 #####################
@@ -53,7 +133,12 @@ pappi.id_mapping.import_hgnc_file(HGNC_FILE, con)
 import pappi.go.import_ass
 
 # import GO associations
-pappi.go.import_ass.import_go_association(GO_ASSOC_FILE, con)
+graph.add("go_assoc",
+          functools.partial(pappi.go.import_ass.import_go_association,
+                            GO_ASSOC_FILE),
+          parallel=True, files=[GO_ASSOC_FILE],
+          code=[pappi.go.import_ass] + SQL_CODE,
+          outputs=[pappi.go.import_ass.GO_ASSOC_TABLE])
 
 
 ##############################
@@ -66,22 +151,45 @@ from pappi.ppis.havu import Havugimana
 from pappi.ppis.string import StringDB
 from pappi.ppis.psicquic import Psicquic
 from pappi.ppis.psicquic_comb import PsicquicAll
+import pappi.ppis.ppi
+
+
+def init_ppi(ppi, sql_conn):
+    # the stage may run in a worker process with its own connection
+    ppi.sql_conn = sql_conn
+    ppi.init_ppi(True)
+
+
+def add_ppi_stage(ppi, upstream=mapping_stages):
+    """
+    Adds the initialization of the PPI as stage, returns the stage name.
+    """
+    return graph.add("ppi:" + ppi.name, functools.partial(init_ppi, ppi),
+                     parallel=True, files=[ppi.filename],
+                     params=[ppi.orig_id, ppi.gene1_colname,
+                             ppi.gene2_colname],
+                     upstream=upstream,
+                     code=([type(ppi), pappi.ppis.ppi, pappi.id_mapping]
+                           + TABLE_CODE),
+                     outputs=[ppi.name, ppi.name + "_edges"],
+                     drop=[ppi.name + "_ids"])
 
 ccsb_ppi = CCSB(CCSB_FILE, con)
-ccsb_ppi.init_ppi(True)
+ppi_stages = [add_ppi_stage(ccsb_ppi)]
 
 bossi_ppi = Bossi_Lehner(BOSSI_FILE, con)
-bossi_ppi.init_ppi(True)
+ppi_stages.append(add_ppi_stage(bossi_ppi))
 
 havu_ppi = Havugimana(HAVU_FILE, con)
-havu_ppi.init_ppi(True)
+ppi_stages.append(add_ppi_stage(havu_ppi))
 
 string_ppi = StringDB(STRING_FILE, con)
-string_ppi.init_ppi(True)
+ppi_stages.append(add_ppi_stage(string_ppi))
 
 # import all PSICQUIC networks
 psicquic_ppis = []
 psicquic_ppi_names = []
+psicquic_stages = []
 for pf in PSICQUIC_FILES:
     # extract the service name form the file name via regex
     service_name = re.match(r'.*_([a-zA-Z0-9-]+)\.tsv$', pf).group(1)
@@ -89,14 +197,15 @@ for pf in PSICQUIC_FILES:
     service_name = service_name.replace('-', '_').lower()
     # create ppi class and init
     p = Psicquic(pf, con, service_name)
-    p.init_ppi(True)
+    psicquic_stages.append(add_ppi_stage(p))
     # append to list of all ppis
     psicquic_ppis.append(p)
     psicquic_ppi_names.append(service_name)
 
 # construct combined PSICQUIC PPI network
 psicquic_all_ppi = PsicquicAll(con, psicquic_ppi_names)
-psicquic_all_ppi.init_ppi(True)
+ppi_stages.append(add_ppi_stage(psicquic_all_ppi,
+                                mapping_stages + psicquic_stages))
 
 ##############################
 # import expression data sets
@@ -107,21 +216,69 @@ from pappi.expr.hpa_all import HPA_All
 from pappi.expr.emtab import Emtab
 from pappi.expr.rnaseq_atlas import RnaSeqAtlas
 from pappi.expr.gene_atlas import GeneAtlas
+import pappi.expr.expr
+import pappi.expr.matrix
+
+
+def expr_stage_name(expr):
+    return "expr:" + expr.name
+
+
+def init_expr(expr, sql_conn):
+    # the stage may run in a worker process with its own connection
+    expr.sql_conn = sql_conn
+    expr.init_data()
+
+
+def add_expr_stage(expr, files=[]):
+    """
+    Adds the initialization of the expression data set as stage.
+    """
+    return graph.add(expr_stage_name(expr), functools.partial(init_expr, expr),
+                     parallel=True, files=[expr.filename] + files,
+                     upstream=mapping_stages,
+                     code=([type(expr), pappi.expr.expr, pappi.expr.matrix,
+                            pappi.id_mapping] + TABLE_CODE),
+                     outputs=[expr.name, expr.name + "_expr_counts"],
+                     drop=[expr.name + s for s in ["_ids", "_tissues",
+                                                   "_coverage",
+                                                   "_node_labels"]])
 
 hpa_expr = HPA(HPA_FILE, con)
-hpa_expr.init_data()
+add_expr_stage(hpa_expr)
 
 hpa_all_expr = HPA_All(HPA_FILE, con)
-hpa_all_expr.init_data()
+add_expr_stage(hpa_all_expr)
 
 emtab_expr = Emtab(EMTAB_FILE, con)
-emtab_expr.init_data()
+add_expr_stage(emtab_expr)
 
 rnaseq_atlas = RnaSeqAtlas(RNASEQ_ATLAS_FILE, con)
-rnaseq_atlas.init_data()
+add_expr_stage(rnaseq_atlas)
 
 gene_atlas = GeneAtlas(GENE_ATLAS_FILE, con)
-gene_atlas.init_data()
+add_expr_stage(gene_atlas, [U133A_ANNOT_FILE, GNF1H_ANNOT_FILE])
+
+all_exprs = [hpa_expr, hpa_all_expr, emtab_expr, rnaseq_atlas, gene_atlas]
+expr_stages = [expr_stage_name(e) for e in all_exprs]
+
+
+###################################
+#  create core expression tables  #
+###################################
+def create_core(expr, sql_conn):
+    print("creating core table for: " + expr.name)
+    expr.sql_conn = sql_conn
+    expr.create_core_table()
+    # get expression counts for the core tables
+    expr.expr_counts(True)
+
+for expr in all_exprs:
+    graph.add("core:" + expr.name, functools.partial(create_core, expr),
+              parallel=True, upstream=[expr_stage_name(expr)],
+              code=[pappi.expr.expr, pappi.expr.matrix] + TABLE_CODE,
+              outputs=[expr.name + "_core", expr.name + "_core_expr_counts"],
+              drop=[expr.name + "_tissues", expr.name + "_coverage"])
 
 
 ##############################
@@ -130,23 +287,42 @@ gene_atlas.init_data()
 
 from pappi import overlap_analysis
 
-overlap_analysis.calc_ppi_edge_overlap(con)
-overlap_analysis.calc_ppi_id_overlap(con)
-overlap_analysis.calc_expr_overlap(con)
+
+def add_overlap_stage(func, upstream, outputs):
+    # the overlap analyses are run in the main process, since they read
+    # (almost) all PPI and expression tables, the overlaps are computed from
+    # NumPy bitmasks (see `overlap_analysis.BITMASK_OVERLAP`)
+    graph.add("overlap:" + func.__name__,
+              functools.partial(func, bitmask=True),
+              params=[overlap_analysis.PPIS_TO_ANALYZE,
+                      overlap_analysis.EXPRS_TO_ANALYZE],
+              upstream=upstream,
+              code=[overlap_analysis, pappi.ppis.ppi] + SQL_CODE,
+              outputs=outputs)
+
+add_overlap_stage(overlap_analysis.calc_ppi_edge_overlap, ppi_stages,
+                  ["ppi_edge_overlap"])
+add_overlap_stage(overlap_analysis.calc_ppi_id_overlap, ppi_stages,
+                  ["ppi_id_overlap"])
+add_overlap_stage(overlap_analysis.calc_expr_overlap, expr_stages,
+                  ["expr_overlap"])
 # overlap of ppis and expression data sets (protein coverage of ppis by expr)
-overlap_analysis.calc_pairwise_expr_ppi_id_overlap(con)
-overlap_analysis.calc_pairwise_expr_ppi_edge_overlap(con)
+add_overlap_stage(overlap_analysis.calc_pairwise_expr_ppi_id_overlap,
+                  ppi_stages + expr_stages, ["overlap_pairwise_expr_ppi"])
+add_overlap_stage(overlap_analysis.calc_pairwise_expr_ppi_edge_overlap,
+                  ppi_stages + expr_stages,
+                  ["overlap_pairwise_expr_ppi_edges"])
 
 # overlap of PPIs with each other (both IDs and edges)
-overlap_analysis.calc_pairwise_ppi_id_overlap(con)
-overlap_analysis.calc_pairwise_ppi_edge_overlap(con)
+add_overlap_stage(overlap_analysis.calc_pairwise_ppi_id_overlap, ppi_stages,
+                  ["overlap_pairwise_ppi_ids"])
+add_overlap_stage(overlap_analysis.calc_pairwise_ppi_edge_overlap,
+                  ppi_stages, ["overlap_pairwise_ppi_edges"])
 
 
-###################################
-#  create core expression tables  #
-###################################
-for expr in [hpa_expr, hpa_all_expr, emtab_expr, rnaseq_atlas, gene_atlas]:
-    print("creating core table for: " + expr.name)
-    expr.create_core_table()
-    # get expression counts for the core tables
-    expr.expr_counts(True)
+##############################
+# run all stages
+##############################
+
+graph.run()
+graph.print_report()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+#
+# This script compares the run times of the original UNION based
+# linearization of the [Gene]x[Tissue] expression tables and the single-pass
+# `sql.linearize_table` for the E-MTAB-513 and GeneAtlas data sets, and
+# checks that both result in the same tables.
+
+# for timing
+import time
+import os
+
+import pappi.sql
+from pappi.data_config import *
+from pappi.expr.emtab import Emtab
+from pappi.expr.gene_atlas import GeneAtlas
+
+# the benchmark uses its own database
+BENCHMARK_DATABASE = os.path.join(os.path.dirname(DATABASE),
+                                  'linearize_benchmark.sqlite')
+
+
+def union_linearize_table(src_table, excl_columns, cat_col_name,
+                          val_col_name, dst_table, con):
+    # the original implementation: one SELECT per column, combined by UNION
+    col_names = pappi.sql.get_column_names(src_table, con)
+    transpose_cols = [x for x in col_names if not x in excl_columns]
+    remaining_cols = ", ".join(excl_columns)
+    select_stmts = ['SELECT ' + remaining_cols + ' , \'' + x + '\' AS '
+                    + cat_col_name + ', [' + x + '] AS ' + val_col_name
+                    + ' FROM ' + src_table for x in transpose_cols]
+    union = " UNION ".join(select_stmts)
+    cur = con.cursor()
+    cur.execute('DROP TABLE IF EXISTS ' + dst_table)
+    cur.execute('CREATE TABLE ' + dst_table + ' AS ' + union)
+    cur.close()
+    con.commit()
+
+
+def count_diff(table1, table2, con):
+    cur = con.cursor()
+    cur.execute('SELECT COUNT(*) FROM (SELECT * FROM ' + table1 + ' EXCEPT '
+                'SELECT * FROM ' + table2 + ')')
+    result = cur.fetchone()[0]
+    cur.close()
+    return result
+
+
+def benchmark(expr, excl_columns, con):
+    expr.import_raw_file()
+    src_table = expr.get_cur_tmp_table()
+
+    start = time.time()
+    union_linearize_table(src_table, excl_columns, "Tissue",
+                          "ExpressionValue", "union_linear", con)
+    union_time = time.time() - start
+
+    start = time.time()
+    pappi.sql.linearize_table(src_table, excl_columns, "Tissue",
+                              "ExpressionValue", "stream_linear", con)
+    stream_time = time.time() - start
+
+    cur = con.cursor()
+    cur.execute('SELECT COUNT(*) FROM stream_linear')
+    num_rows = cur.fetchone()[0]
+    cur.close()
+    if (count_diff("union_linear", "stream_linear", con) != 0
+            or count_diff("stream_linear", "union_linear", con) != 0):
+        print("[WARNING] linearized tables differ for " + expr.name)
+    if (pappi.sql.get_column_names("union_linear", con)
+            != pappi.sql.get_column_names("stream_linear", con)):
+        print("[WARNING] linearized tables have different columns for "
+              + expr.name)
+    print("%s\t%i\t%.2f\t%.2f\t%.2f" % (expr.name, num_rows, union_time,
+                                        stream_time,
+                                        union_time / max(stream_time, 1e-9)))
+
+
+if __name__ == '__main__':
+    if os.path.exists(BENCHMARK_DATABASE):
+        os.remove(BENCHMARK_DATABASE)
+    con = pappi.sql.get_conn(BENCHMARK_DATABASE)
+    print("dataset\trows\tunion_time\tstream_time\tspeedup")
+    benchmark(Emtab(EMTAB_FILE, con), ["Gene_ID", "Gene_Name"], con)
+    benchmark(GeneAtlas(GENE_ATLAS_FILE, con), ["Gene_ID"], con)
+    con.close()
+    os.remove(BENCHMARK_DATABASE)
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+#
+# This script compares the run times of the original csv based PSI-MITAB 2.5
+# parser and the dedicated `mitab_line_parser` on the largest PSICQUIC files.
+
+# for timing
+import time
+# for the original parser
+import csv
+import os
+
+from pappi.data_config import *
+from pappi.ppis.psicquic import psicquic_row_iter, mitab_line_parser
+
+# the number of (largest) PSICQUIC files to benchmark
+NUM_FILES = 3
+
+
+def time_csv_parser(filename):
+    start = time.time()
+    num_rows = 0
+    with open(filename, 'r') as f:
+        reader = csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE)
+        for row in psicquic_row_iter(reader):
+            num_rows += 1
+    return (num_rows, time.time() - start)
+
+
+def time_mitab_parser(filename):
+    start = time.time()
+    num_rows = 0
+    with open(filename, 'r') as f:
+        for row in mitab_line_parser(f):
+            num_rows += 1
+    return (num_rows, time.time() - start)
+
+
+if __name__ == '__main__':
+    files = sorted(PSICQUIC_FILES, key=os.path.getsize, reverse=True)
+    print("file\trows\tcsv_time\tmitab_time\tspeedup")
+    for filename in files[0:NUM_FILES]:
+        rows_csv, csv_time = time_csv_parser(filename)
+        rows_mitab, mitab_time = time_mitab_parser(filename)
+        if rows_csv != rows_mitab:
+            print("[WARNING] parsers returned different number of rows for "
+                  + filename)
+        print("%s\t%i\t%.2f\t%.2f\t%.2f" % (os.path.basename(filename),
+                                            rows_mitab, csv_time, mitab_time,
+                                            csv_time / max(mitab_time, 1e-9)))
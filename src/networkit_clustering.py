@@ -255,7 +255,7 @@ def get_scorer(con):
     scorer = GoGenePreBufSimilarity(GO_OBO_FILE, GO_SCORE_FILE,
                                     GO_SCORE_MAP_FILE, GO_BPSCORE_FILE,
                                     GO_BPSCORE_ROW_FILE, GO_BPSCORE_MAP_FILE,
-                                    con, True)
+                                    con, True, GO_DAG_CACHE_FOLDER)
     init_time = time.time() - start
     print("scorer init time: " + str(init_time) + " s")
     return scorer
@@ -297,7 +297,8 @@ if __name__ == "__main__":
                 writer.set_expr(expr)
 
                 # get graph
-                tsppi = sqlio.load_tsppi_graph(ppi, expr)
+                tsppi = sqlio.load_tsppi_graph(ppi, expr,
+                                               TSPPI_CACHE_FOLDER)
 
                 # run the clustering algos
                 run_global_clustering(tsppi, clusterer, scorer, writer)
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+#
+# This script compares the run times of the original line-by-line
+# `OBOReader` and the single-pass block parser `parse_obo` on the GO OBO file,
+# and checks that both parse the same [Term] records.
+
+# for timing
+import time
+
+from pappi.data_config import *
+from pappi.go.fastdag import OBOReader, parse_obo
+
+
+def time_obo_reader(filename):
+    start = time.time()
+    records = [(r.id, r.name, r.namespace, tuple(r._parents),
+                tuple(r.alt_ids), r.is_obsolete)
+               for r in OBOReader(filename)]
+    return (records, time.time() - start)
+
+
+def time_parse_obo(filename):
+    start = time.time()
+    records = [r[:6] for r in parse_obo(filename)]
+    return (records, time.time() - start)
+
+
+if __name__ == '__main__':
+    print("file\tterms\treader_time\tparse_time\tspeedup")
+    reader_records, reader_time = time_obo_reader(GO_OBO_FILE)
+    parse_records, parse_time = time_parse_obo(GO_OBO_FILE)
+    if reader_records != parse_records:
+        print("[WARNING] the parsed records differ")
+    print("%s\t%i\t%.2f\t%.2f\t%.2f" % (os.path.basename(GO_OBO_FILE),
+                                        len(parse_records), reader_time,
+                                        parse_time,
+                                        reader_time / max(parse_time, 1e-9)))
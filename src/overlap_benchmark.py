@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+#
+# This script compares the run times of the SQL based overlap analyses (the
+# Venn-diagram overlaps and the pairwise overlaps of the PPIs and expression
+# data sets) and the NumPy bitmask engine, and checks that both result in
+# the same tables.
+#
+# The PPI and expression tables have to exist in the database, i.e.
+# `init_data.py` has to be run first.
+
+# for timing
+import time
+
+import pappi.sql
+from pappi.data_config import *
+from pappi import overlap_analysis
+
+
+def table_rows(table, con):
+    cur = con.cursor()
+    cur.execute('SELECT * FROM ' + table)
+    result = sorted(cur.fetchall())
+    cur.close()
+    return result
+
+
+def benchmark(func, table, con, **kwargs):
+    start = time.time()
+    func(con, bitmask=False, **kwargs)
+    sql_time = time.time() - start
+    sql_rows = table_rows(table, con)
+    sql_cols = pappi.sql.get_column_names(table, con)
+
+    start = time.time()
+    func(con, bitmask=True, **kwargs)
+    bitmask_time = time.time() - start
+    if (table_rows(table, con) != sql_rows
+            or pappi.sql.get_column_names(table, con) != sql_cols):
+        print("[WARNING] tables differ for " + table)
+
+    print("%s\t%.2f\t%.2f\t%.2f" % (table, sql_time, bitmask_time,
+                                    sql_time / max(bitmask_time, 1e-9)))
+
+
+if __name__ == '__main__':
+    con = pappi.sql.get_conn(DATABASE)
+    print("table\tsql_time\tbitmask_time\tspeedup")
+    benchmark(overlap_analysis.calc_ppi_edge_overlap, "ppi_edge_overlap",
+              con)
+    benchmark(overlap_analysis.calc_ppi_id_overlap, "ppi_id_overlap", con)
+    benchmark(overlap_analysis.calc_expr_overlap, "expr_overlap", con)
+    benchmark(overlap_analysis.calc_pairwise_expr_ppi_id_overlap,
+              "overlap_pairwise_expr_ppi", con, verbose=False)
+    benchmark(overlap_analysis.calc_pairwise_expr_ppi_edge_overlap,
+              "overlap_pairwise_expr_ppi_edges", con, verbose=False)
+    benchmark(overlap_analysis.calc_pairwise_ppi_id_overlap,
+              "overlap_pairwise_ppi_ids", con)
+    benchmark(overlap_analysis.calc_pairwise_ppi_edge_overlap,
+              "overlap_pairwise_ppi_edges", con)
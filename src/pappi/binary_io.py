@@ -0,0 +1,158 @@
+'''
+Compact binary files for exporting PPI networks and expression node labels,
+which external tools (and the C++ loader) can memory map instead of querying
+the SQLite database.
+
+Every file `filename` holds a single raw (little-endian, C-order) array, and
+is described by the JSON header `filename`.json with the dtype and shape of
+the array, as well as the names of the nodes (and tissues):
+
+  - Edge lists: `uint32` array of shape (#edges, 2) with the node ids
+    [0, #nodes) of each undirected edge, with u <= v and sorted by (u, v)
+    without duplicates. Thus the rows with the same u are consecutive, and
+    the CSR offsets are a prefix sum of the counts of u.
+  - Node labels: `uint8` array of shape (2, #nodes, ceil(#tissues / 8)), the
+    packed bit-matrices node x tissue of whether the gene is expressed (layer
+    0) and whether there is data for the gene (layer 1). Tissue t of a node
+    is bit (t % 8) of byte (t / 8) of its row (i.e. the least significant bit
+    comes first, as in `boost::dynamic_bitset`).
+
+@author: Patrick Flick
+'''
+
+import json
+import os
+
+import numpy
+
+# the format version written into the headers
+FORMAT_VERSION = 1
+EDGE_LIST_FORMAT = 'pappi_edge_list'
+NODE_LABELS_FORMAT = 'pappi_node_labels'
+# the layers of the node label bit-matrices
+NODE_LABEL_LAYERS = ['expressed', 'present']
+
+
+def header_filename(filename):
+    """
+    Returns the file name of the JSON header of the binary file `filename`.
+    """
+    return filename + '.json'
+
+
+def write_array(filename, array, header):
+    """
+    Writes the array as raw binary file `filename` and the header (a dict,
+    to which the dtype and shape of the array are added) as JSON file.
+    """
+    array = numpy.ascontiguousarray(array,
+                                    dtype=array.dtype.newbyteorder('<'))
+    header = dict(header)
+    header['version'] = FORMAT_VERSION
+    header['data'] = os.path.basename(filename)
+    header['dtype'] = array.dtype.str
+    header['shape'] = list(array.shape)
+    array.tofile(filename)
+    with open(header_filename(filename), 'w') as f:
+        json.dump(header, f)
+
+
+def read_array(filename, fmt=None, mmap=True):
+    """
+    Reads the binary file `filename` written by `write_array()`.
+
+    @param fmt:     The expected format of the header (if given).
+    @param mmap:    Whether to memory map the file (read-only) instead of
+                    reading it into memory.
+    @returns:       The tuple (header, array).
+    """
+    with open(header_filename(filename), 'r') as f:
+        header = json.load(f)
+    if fmt is not None and header.get('format') != fmt:
+        raise ValueError("The file `" + filename + "` is not of the format "
+                         + fmt)
+    if header['version'] > FORMAT_VERSION:
+        raise ValueError("Unsupported format version "
+                         + str(header['version']) + " of `" + filename + "`")
+    dtype = numpy.dtype(header['dtype'])
+    shape = tuple(header['shape'])
+    if mmap and numpy.prod(shape) > 0:
+        array = numpy.memmap(filename, dtype=dtype, mode='r', shape=shape)
+    else:
+        array = numpy.fromfile(filename, dtype=dtype).reshape(shape)
+    return header, array
+
+
+def write_edge_list(filename, edges, nodes):
+    """
+    Writes the edge list of an undirected graph.
+
+    @param edges:   An array of shape (#edges, 2) of node ids in
+                    [0, len(nodes)), the edges are normalized (u <= v, sorted
+                    and without duplicates) before writing.
+    @param nodes:   The names of all nodes (by node id).
+    """
+    edges = numpy.asarray(edges, dtype=numpy.uint32).reshape(-1, 2)
+    edges = numpy.unique(numpy.sort(edges, axis=1), axis=0)
+    if len(edges) > 0 and edges.max() >= len(nodes):
+        raise ValueError("The edges contain node ids >= the number of nodes")
+    write_array(filename, edges, {'format': EDGE_LIST_FORMAT,
+                                  'num_nodes': len(nodes),
+                                  'num_edges': len(edges),
+                                  'nodes': list(nodes)})
+
+
+def read_edge_list(filename, mmap=True):
+    """
+    Reads an edge list written by `write_edge_list()`.
+
+    @returns:   The tuple (nodes, edges).
+    """
+    header, edges = read_array(filename, EDGE_LIST_FORMAT, mmap)
+    return header['nodes'], edges
+
+
+def write_node_labels(filename, expressed, present, nodes, tissues):
+    """
+    Writes the node labels of the given boolean matrices node x tissue as
+    packed bit-matrices.
+
+    @param expressed:   Whether the gene (node) is expressed in the tissue.
+    @param present:     Whether there is data for the gene in the tissue.
+    @param nodes:       The names of all nodes (the rows of the matrices).
+    @param tissues:     The names of all tissues (the columns).
+    """
+    shape = (len(nodes), len(tissues))
+    layers = [numpy.asarray(m, dtype=bool).reshape(shape)
+              for m in [expressed, present]]
+    packed = numpy.packbits(numpy.stack(layers), axis=2, bitorder='little')
+    write_array(filename, packed, {'format': NODE_LABELS_FORMAT,
+                                   'layers': NODE_LABEL_LAYERS,
+                                   'bitorder': 'little',
+                                   'num_nodes': len(nodes),
+                                   'num_tissues': len(tissues),
+                                   'nodes': list(nodes),
+                                   'tissues': list(tissues)})
+
+
+def read_node_labels(filename, mmap=True):
+    """
+    Reads the node labels written by `write_node_labels()`.
+
+    @returns:   The tuple (nodes, tissues, packed), where `packed` is the
+                array of the packed bit-matrices (see the module
+                documentation). `unpack_node_labels()` returns the boolean
+                matrices.
+    """
+    header, packed = read_array(filename, NODE_LABELS_FORMAT, mmap)
+    return header['nodes'], header['tissues'], packed
+
+
+def unpack_node_labels(packed, num_tissues):
+    """
+    Returns the boolean matrices node x tissue (expressed, present) of the
+    packed node labels.
+    """
+    layers = numpy.unpackbits(packed, axis=2, count=num_tissues,
+                              bitorder='little').astype(bool)
+    return layers[0], layers[1]
@@ -21,6 +21,8 @@ MAP_DATA_FOLDER = os.path.join(DATA_FOLDER, 'mapping')
 
 # TODO add these files into the repo data folder !?
 DATABASE = os.path.join(DATA_FOLDER, 'sql_database.sqlite')
+# snapshots of the tissue specific PPI graphs (for `ppi_networkit`)
+TSPPI_CACHE_FOLDER = os.path.join(DATA_FOLDER, 'tsppi_cache')
 
 # mapping
 HGNC_FILE = os.path.join(MAP_DATA_FOLDER, 'hgnc_downloads.txt')
@@ -58,3 +60,5 @@ GO_SCORE_MAP_FILE = os.path.join(GO_DATA_FOLDER, 'score_mapping.json')
 GO_BPSCORE_FILE = os.path.join(GO_DATA_FOLDER, 'bp_score.npy')
 GO_BPSCORE_ROW_FILE = os.path.join(GO_DATA_FOLDER, 'row_sums.npy')
 GO_BPSCORE_MAP_FILE = os.path.join(GO_DATA_FOLDER, 'gene_bpscore_mapping.json')
+# compiled GO DAGs (see `fastdag.GODag`)
+GO_DAG_CACHE_FOLDER = os.path.join(GO_DATA_FOLDER, 'dag_cache')
@@ -26,7 +26,8 @@ class Emtab(GeneExpression):
         table_name = self.next_tmp_table("raw")
         sql.import_csv(self.filename, table_name, self.file_field_seperator,
                        self.file_has_header, csv_quoting=self.file_quoting,
-                       sql_conn=self.sql_conn, skip_rows=3)
+                       sql_conn=self.sql_conn, skip_rows=3,
+                       num_workers=self.import_workers)
 
     def linearize_table(self):
         """
@@ -1,7 +1,9 @@
 from .. import sql
+from .. import binary_io
 from ..table_manager import TableManager
-from ..utils import progressbar
+from .matrix import ExpressionMatrix
 import csv
+import numpy
 
 # at least 90 percent of genes have to be covered
 # TODO:
@@ -14,6 +16,19 @@ class GeneExpression(TableManager):
     file_field_seperator = '\t'
     file_has_header = True
     file_quoting = csv.QUOTE_NONE
+    # the normalized tables are not staged, they are read by the analysis
+    # scripts
+    staged_suffixes = [None, 'raw', 'filtered', 'linear', 'no_dupl']
+    # whether `rm_duplicates`, `classify`, `expr_counts` and
+    # `create_core_table` use the NumPy based `ExpressionMatrix` instead of
+    # SQL queries
+    use_matrix_engine = False
+    # the current ExpressionMatrix (only used with the matrix engine)
+    matrix = None
+    core_matrix = None
+    # whether the core tissues are selected by the greedy heuristic instead
+    # of the coverage threshold (see `create_core_table`)
+    greedy_core = False
 
     """
     An interface/super-class to all Gene/Protein-Expression data sets.
@@ -49,6 +64,9 @@ class GeneExpression(TableManager):
         #       calculates the core before classification
         # self.expr_counts(True)
 
+        # drop the intermediate tables (in staging mode)
+        self.drop_staged_tables()
+
     def import_raw_file(self):
         """
         Imports the expression file in raw format into the SQL database
@@ -58,7 +76,8 @@ class GeneExpression(TableManager):
         table_name = self.next_tmp_table("raw")
         sql.import_csv(self.filename, table_name, self.file_field_seperator,
                        self.file_has_header, csv_quoting=self.file_quoting,
-                       sql_conn=self.sql_conn)
+                       sql_conn=self.sql_conn,
+                       num_workers=self.import_workers)
 
     def linearize_table(self):
         """
@@ -102,6 +121,11 @@ class GeneExpression(TableManager):
         # numeric (i.e. a string), this function has to be overwritten by the
         # subclasses
         src_table = self.get_cur_tmp_table()
+        if self.use_matrix_engine:
+            # duplicates are aggregated while loading the matrix, the
+            # `no_dupl` table is not created
+            self.matrix = ExpressionMatrix.from_table(self.sql_conn, src_table)
+            return
         dst_table = self.next_tmp_table("no_dupl")
         # TODO: count how many are removed, and log somewhere
         sqlquery = ('SELECT Gene, Type, '
@@ -127,6 +151,14 @@ class GeneExpression(TableManager):
                     ' CASE WHEN ExpressionValue ' + self.classify_cond + ' '
                     ' THEN 1 ELSE 0 END AS Expressed '
                     'FROM ' + src_table)
+        if self.use_matrix_engine:
+            if self.matrix is None:
+                self.matrix = ExpressionMatrix.from_table(self.sql_conn,
+                                                          src_table)
+            self.matrix.classify(self.classify_cond)
+            self.matrix.write_expressed_table(dst_table, sqlquery,
+                                              self.sql_conn)
+            return
         sql.new_table_from_query(dst_table, sqlquery, self.sql_conn)
 
     def expr_counts(self, for_core=False):
@@ -145,8 +177,27 @@ class GeneExpression(TableManager):
                     ' SUM(Expressed) AS ExpressedCount '
                     'FROM ' + src_table + ' '
                     'GROUP BY Gene')
+        if self.use_matrix_engine:
+            matrix = self.core_matrix if for_core else self.matrix
+            if matrix is None:
+                matrix = self.load_expressed_matrix(src_table)
+            matrix.write_expr_counts_table(dst_table, sqlquery,
+                                           self.sql_conn)
+            return
         sql.new_table_from_query(dst_table, sqlquery, self.sql_conn)
 
+    def load_expressed_matrix(self, table=None):
+        """
+        Loads the classified table (Gene, Type, Expressed) into an
+        `ExpressionMatrix` (for the matrix engine).
+        """
+        if table is None:
+            table = self.name
+        matrix = ExpressionMatrix.from_table(self.sql_conn, table,
+                                             'Expressed')
+        matrix.classify('= 1')
+        return matrix
+
     def create_ids_table(self):
         """
         Creates a table named <name>_ids that holds all the distinct IDs used
@@ -155,13 +206,13 @@ class GeneExpression(TableManager):
         """
         if sql.table_exists(self.name + '_ids', self.sql_conn):
             return
-        cur = sql_conn.cursor()
+        cur = self.sql_conn.cursor()
         cur.execute('CREATE TABLE IF NOT EXISTS `' + self.name + '_ids` '
                     '(id integer primary key autoincrement, Gene varchar(16))')
         sqlquery = ('SELECT DISTINCT Gene FROM ' + self.name)
         cur.execute('INSERT INTO `' + self.name + '_ids` (Gene) ' + sqlquery)
         cur.close()
-        sql_conn.commit()
+        self.sql_conn.commit()
 
     def create_tissue_table(self):
         """
@@ -181,6 +232,13 @@ class GeneExpression(TableManager):
 
     def create_tissue_coverage_table(self):
         """
+        Creates the table <name>_coverage: for every distinct gene coverage
+        of the tissues (used as threshold), the number of tissues with at
+        least that gene coverage and the number of genes with data for all
+        of these tissues.
+
+        The curve is computed in a single sweep over the [Gene]x[Tissue]
+        matrix of the data set (see `ExpressionMatrix.coverage_curve`).
         """
 
         # create tissue table first
@@ -190,61 +248,27 @@ class GeneExpression(TableManager):
         cur = self.sql_conn.cursor()
 
         # first create the results table
-        cur.execute('DROP TABLE IF EXISTS ' + self.name + '_coverage')
+        cur.execute('DROP TABLE IF EXISTS main.' + self.name + '_coverage')
         cur.execute('CREATE TABLE ' + self.name + '_coverage '
                     '(gene_coverage_threshold int, gene_coverage int, '
                     'total_genes int, tissue_coverage int, total_tissues int)')
 
-        # get the tissue table with the gene coverage for each tissue
-        cur.execute('SELECT Type, Gene_Coverage FROM ' + self.name +
-                    '_tissues ORDER BY Gene_Coverage ASC')
-        all_rows = cur.fetchall()
-        num_tissues = len(all_rows)
-        cur.execute('SELECT COUNT(DISTINCT Gene) FROM ' + self.name)
-        num_genes_total = cur.fetchone()[0]
-        print("Creating coverage table:")
-        progressbar.show_progress(0.0)
-
-        # TODO:
-        #       formalize this `greedy` algorithm. There might be a more
-        #       optimal combination of tissues and proteins that cover more
-        #       in total. I'm guessing this problem is NP hard (not sure
-        #       though, i may have to check that out) also the greedy algo
-        #       could be extended, so that it adds further tissues even if the
-        #       next one doesn't improve the score (skip one), that would
-        #       require though a different more dynamic approach/implementation
-        #       of the greedy algorithm, and most possibly not via SQL but with
-        #       python using 2D matrizzes instead of a ~ 1D table for Genes
-        #       CROSS Tissues
-        for coverage in sorted(set([int(c) for t, c in all_rows])):
-            num_bigger = sum(map(lambda x: x[1] >= coverage, all_rows))
-            sqlquery = ('SELECT COUNT(*) FROM ('
-                        'SELECT a.Gene, COUNT(*) FROM ' + self.name + ' AS a '
-                        'INNER JOIN ' + self.name + '_tissues AS b ON '
-                        'a.Type = b.Type WHERE Gene_Coverage >= '
-                        + str(coverage) + ' GROUP BY Gene HAVING COUNT(*) >= '
-                        + str(num_bigger)
-                        + ')')
-            cur.execute(sqlquery)
-            num_genes_covered = cur.fetchone()[0]
-
-            cur.execute('INSERT INTO ' + self.name + '_coverage '
+        print("Creating coverage table")
+        matrix = self.matrix
+        if matrix is None or matrix.expressed is None:
+            matrix = self.load_expressed_matrix()
+        num_genes_total, num_tissues = matrix.present.shape
+        thresholds, genes_covered, num_bigger = matrix.coverage_curve()
+        rows = zip(thresholds.tolist(), genes_covered.tolist(),
+                   [num_genes_total] * len(thresholds), num_bigger.tolist(),
+                   [num_tissues] * len(thresholds))
+        cur.executemany('INSERT INTO ' + self.name + '_coverage '
                         '(gene_coverage_threshold, gene_coverage, '
                         'total_genes, tissue_coverage, '
                         'total_tissues) '
-                        ' VALUES (?,?,?,?,?)',
-                        [coverage, num_genes_covered, num_genes_total,
-                         num_bigger, num_tissues])
-            progressbar.show_progress((num_tissues - num_bigger)
-                                      * 1.0 / num_tissues)
-
-           # print("with %.0f coverage threshold: %.2f tissue and %.2f genes"
-           #       "are left with full coverage" %
-           #       (coverage, num_bigger * 100.0 / num_tissues,
-           #        num_genes_covered * 100.0 / num_genes_total))
-           # print("num bigger: %i " % num_bigger)
-           # print("Coverage is: %.2f" % (coverage))
-        progressbar.finish_progress()
+                        ' VALUES (?,?,?,?,?)', rows)
+        cur.close()
+        self.sql_conn.commit()
 
     def get_optimal_coverage_threshold(self):
         """
@@ -269,26 +293,72 @@ class GeneExpression(TableManager):
         # return the result
         return threshold
 
-    def create_core_table(self, threshold=None):
-        """
-        """
+    def create_core_table(self, threshold=None, greedy=None):
+        """
+        Creates the table <name>_core, holding the `core` of the expression
+        data set: the data of a set of tissues for all genes that have data
+        for all of these tissues.
+
+        @param threshold:   The core tissues are those with a gene coverage of
+                            at least this threshold. If not given, the
+                            threshold maximizing #genes * #tissues is used.
+        @param greedy:      Whether the core tissues are selected by the
+                            greedy heuristic (see
+                            `ExpressionMatrix.greedy_core_types`) instead of
+                            by a threshold. (default: `self.greedy_core`)
+        """
+        if greedy is None:
+            greedy = self.greedy_core
+        type_mask = None
+        if greedy:
+            if self.matrix is None or self.matrix.expressed is None:
+                self.matrix = self.load_expressed_matrix()
+            type_mask = self.matrix.greedy_core_types()
         # if threshold is not give, use "optimal" value
-        if threshold is None:
+        elif threshold is None:
             threshold = self.get_optimal_coverage_threshold()
 
         # join/intersect the main table with list of covered genes and
         # list of covered tissues
 
-        # get number of tissues in core
+        if self.use_matrix_engine:
+            if self.matrix is None or self.matrix.expressed is None:
+                self.matrix = self.load_expressed_matrix()
+            self.core_matrix = self.matrix.core(threshold, type_mask)
+            print("num tissues: " + str(len(self.core_matrix.types)))
+            self.core_matrix.write_expressed_table(
+                self.name + '_core',
+                'SELECT Gene, Type, Expressed FROM ' + self.name,
+                self.sql_conn)
+            return
+
+        # the tissue table is only created by the coverage table, i.e. not if
+        # the threshold is given
+        self.create_tissue_table()
+
         cur = self.sql_conn.cursor()
-        cur.execute('SELECT COUNT(*) FROM ' + self.name + '_tissues '
-                    'WHERE Gene_Coverage >= ' + str(threshold))
+        if greedy:
+            # the selected tissues are put into a temporary table
+            cur.execute('DROP TABLE IF EXISTS temp.' + self.name
+                        + '_core_tissues')
+            cur.execute('CREATE TEMP TABLE ' + self.name + '_core_tissues '
+                        '(Type text)')
+            core_types = self.matrix.types[type_mask].tolist()
+            cur.executemany('INSERT INTO temp.' + self.name + '_core_tissues '
+                            'VALUES (?)', [(t,) for t in core_types])
+            core_tissues = ('(SELECT Type FROM temp.' + self.name
+                            + '_core_tissues)')
+        else:
+            core_tissues = ('(SELECT Type FROM ' + self.name + '_tissues'
+                            ' WHERE Gene_Coverage >= ' + str(threshold) + ')')
+
+        # get number of tissues in core
+        cur.execute('SELECT COUNT(*) FROM ' + core_tissues)
         num_tissues = cur.fetchone()[0]
 
         # join table with tissues, then delete Genes that are not in the core
         sqlquery = ('SELECT Gene, Type, Expressed FROM ' + self.name + ' '
-                    'WHERE Type IN (SELECT Type FROM ' + self.name + '_tissues'
-                    ' WHERE Gene_Coverage >= ' + str(threshold) + ')')
+                    'WHERE Type IN ' + core_tissues)
         sql.new_table_from_query(self.name + '_core', sqlquery, self.sql_conn)
         print("num tissues: " + str(num_tissues))
         cur.execute('DELETE FROM ' + self.name + '_core '
@@ -297,6 +367,8 @@ class GeneExpression(TableManager):
                     '  GROUP BY Gene '
                     '  HAVING COUNT(*) < ' + str(num_tissues) + ''
                     ')')
+        if greedy:
+            cur.execute('DROP TABLE temp.' + self.name + '_core_tissues')
 
         cur.close()
         self.sql_conn.commit()
@@ -360,15 +432,23 @@ class GeneExpression(TableManager):
         sql.new_table_from_query(self.name + '_node_labels', sqlquery,
                                  self.sql_conn)
 
-    def export_node_labels(self, node_ids_tbl,  # filename,
+    def export_node_labels(self, node_ids_tbl, filename=None,
                            sep='|', null_syb='-'):
         """
         Exports binary expression node labels for the given Node-IDs table
-        which must be of the form (id, Gene).
+        which must be of the form (id, Gene): the table
+        `name`_node_labels_for_export of the text labels (see
+        `create_node_labels()`), and the file `filename` of the packed
+        node x tissue bit-matrices (see `binary_io.write_node_labels()`, with
+        the nodes in the order of the ids and the tissues of the text labels).
+
+        @param filename:    The file-path for the binary node labels. If this
+                            is set to `None`, only the table is created.
+                            (default: None)
         """
         # create node labels if they don't yet exist
         if not sql.table_exists(self.name + '_node_labels', self.sql_conn):
-            self.create_node_labels(sep, null_syb)
+            self.create_node_labels(sep=sep, null_syb=null_syb)
 
         # map the node labels to the node ids of the given table
         sqlquery = ('SELECT b.id, a.Label '
@@ -378,6 +458,41 @@ class GeneExpression(TableManager):
                                  sqlquery, self.sql_conn)
 
         # save results to file
-        #with open(filename, "w") as f:
-        #    for row in cur.fetchall():
-        #        f.write("%i\t%s\n" % (row[0], row[1]))
+        if filename is not None:
+            self.write_node_labels(node_ids_tbl, filename)
+
+    def write_node_labels(self, node_ids_tbl, filename):
+        """
+        Writes the binary node labels of the genes of the Node-IDs table
+        (id, Gene) for the tissues of the text labels (see
+        `export_node_labels()`), directly from the expression table.
+        """
+        tissue_tbl = self.get_tissue_table(PARAM_TISSUE_MIN_GENE_COVERAGE)
+        cur = self.sql_conn.cursor()
+        cur.execute('SELECT Type FROM ' + tissue_tbl + ' ORDER BY Type')
+        tissues = [row[0] for row in cur.fetchall()]
+        cur.execute('SELECT id, Gene FROM ' + node_ids_tbl + ' ORDER BY id')
+        nodes = cur.fetchall()
+        cur.execute('SELECT b.id, a.Type, a.Expressed '
+                    'FROM ' + self.name + ' AS a '
+                    'INNER JOIN ' + node_ids_tbl + ' AS b ON a.Gene = b.Gene '
+                    'WHERE a.Expressed IS NOT NULL '
+                    '  AND a.Type IN (SELECT Type FROM ' + tissue_tbl + ')')
+        rows = cur.fetchall()
+        cur.close()
+
+        shape = (len(nodes), len(tissues))
+        expressed = numpy.zeros(shape, dtype=bool)
+        present = numpy.zeros(shape, dtype=bool)
+        if rows:
+            ids, types, values = zip(*rows)
+            node_idx = numpy.searchsorted(
+                numpy.array([n[0] for n in nodes], dtype=numpy.int64),
+                numpy.array(ids, dtype=numpy.int64))
+            tissue_ids = dict((t, i) for i, t in enumerate(tissues))
+            tissue_idx = numpy.array([tissue_ids[t] for t in types],
+                                     dtype=numpy.int64)
+            present[node_idx, tissue_idx] = True
+            expressed[node_idx, tissue_idx] = numpy.array(values) != 0
+        binary_io.write_node_labels(filename, expressed, present,
+                                    [n[1] for n in nodes], tissues)
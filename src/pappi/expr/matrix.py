@@ -0,0 +1,225 @@
+'''
+A NumPy based engine for the post-processing of expression data sets.
+
+The linear (Gene, Type, ExpressionValue) table of a data set is loaded once
+into a dense [Gene]x[Type] matrix. Removing duplicates (via MAX), classifying,
+counting and selecting the core are then array operations, and only the
+resulting tables are written back into the database.
+
+@author: Patrick Flick
+'''
+
+import numpy
+
+from .. import sql
+
+# the comparison operators supported in classification conditions
+CLASSIFY_OPERATORS = {'>=': numpy.greater_equal,
+                      '>': numpy.greater,
+                      '<=': numpy.less_equal,
+                      '<': numpy.less,
+                      '=': numpy.equal,
+                      '==': numpy.equal,
+                      '!=': numpy.not_equal}
+
+
+def parse_classify_cond(classify_cond):
+    """
+    Parses a SQL classification condition of the form `<op> <value>`
+    (e.g. '>= 1.0') into the NumPy comparison function and the threshold.
+    """
+    cond = classify_cond.strip()
+    # try the two character operators first
+    for op in sorted(CLASSIFY_OPERATORS, key=len, reverse=True):
+        if cond.startswith(op):
+            return CLASSIFY_OPERATORS[op], float(cond[len(op):])
+    raise ValueError("Unsupported classification condition: '"
+                     + classify_cond + "'")
+
+
+class ExpressionMatrix:
+    """
+    A [Gene]x[Type] expression matrix.
+
+    The genes and types are kept as sorted arrays (the same order as an SQL
+    `ORDER BY` on TEXT columns). `present` marks which (gene, type) pairs
+    exist in the data set, `values` holds the (maximum) expression values,
+    NULL values are NaN. `expressed` is set after the classification.
+    """
+
+    def __init__(self, genes, types, values, present):
+        self.genes = genes
+        self.types = types
+        self.values = values
+        self.present = present
+        self.expressed = None
+
+    @classmethod
+    def from_table(cls, sql_conn, table, value_col='ExpressionValue'):
+        """
+        Loads the given linear table with the columns (Gene, Type,
+        `value_col`) into a matrix. Duplicate (Gene, Type) rows are
+        aggregated via MAX() (NULL values are ignored, as by SQL).
+        """
+        cur = sql_conn.cursor()
+        cur.execute('SELECT Gene, Type, ' + value_col + ' FROM ' + table)
+        rows = cur.fetchall()
+        cur.close()
+        if rows:
+            genes, types, values = zip(*rows)
+        else:
+            genes, types, values = [], [], []
+        if None in genes or None in types:
+            raise ValueError("The table `" + table + "` contains NULL genes "
+                             "or types")
+        genes, gene_idx = numpy.unique(numpy.array(genes, dtype=str),
+                                       return_inverse=True)
+        types, type_idx = numpy.unique(numpy.array(types, dtype=str),
+                                       return_inverse=True)
+        values = numpy.array([numpy.nan if v is None else v for v in values],
+                             dtype=numpy.float64)
+
+        shape = (len(genes), len(types))
+        present = numpy.zeros(shape, dtype=bool)
+        present[gene_idx, type_idx] = True
+        matrix = numpy.full(shape, numpy.nan, dtype=numpy.float64)
+        # MAX() of duplicates, NaN (NULL) only if all values are NULL
+        numpy.fmax.at(matrix, (gene_idx, type_idx), values)
+        return cls(genes, types, matrix, present)
+
+    def classify(self, classify_cond):
+        """
+        Classifies the expression values with the given SQL condition (e.g.
+        '>= 1.0'), NULL values are classified as not expressed.
+        """
+        compare, threshold = parse_classify_cond(classify_cond)
+        with numpy.errstate(invalid='ignore'):
+            self.expressed = compare(self.values, threshold) & self.present
+
+    def expr_counts(self):
+        """
+        Returns the total counts and the expressed counts of all genes.
+        """
+        total = self.present.sum(axis=1)
+        expressed = (self.expressed & self.present).sum(axis=1)
+        return total, expressed
+
+    def gene_coverage(self):
+        """
+        Returns the number of genes with data for each type.
+        """
+        return self.present.sum(axis=0)
+
+    def coverage_curve(self):
+        """
+        Computes the tissue coverage curve in a single sweep: for every
+        distinct gene coverage `c` of the types, the types with a gene
+        coverage of at least `c` are selected and the genes with data for
+        all of these types are counted.
+
+        Sorting the types by decreasing gene coverage, the selected types for
+        any threshold are a prefix of that order. A gene is thus covered iff
+        the first type it has no data for comes after that prefix.
+
+        @returns:   The arrays (thresholds, number of covered genes,
+                    number of selected types), in increasing threshold order.
+        """
+        coverage = self.gene_coverage()
+        num_genes, num_types = self.present.shape
+        order = numpy.argsort(-coverage, kind='stable')
+        present = self.present[:, order]
+        # position of the first missing type of each gene (num_types if
+        # the gene has data for all types)
+        first_missing = numpy.where(present.all(axis=1), num_types,
+                                    numpy.argmin(present, axis=1))
+        # genes_covered[k]: number of genes with data for the first k types
+        hist = numpy.bincount(first_missing, minlength=num_types + 1)
+        genes_covered = numpy.cumsum(hist[::-1])[::-1]
+
+        thresholds = numpy.unique(coverage)
+        # number of types with a coverage >= each threshold
+        num_selected = num_types - numpy.searchsorted(numpy.sort(coverage),
+                                                      thresholds, 'left')
+        return thresholds, genes_covered[num_selected], num_selected
+
+    def greedy_core_types(self):
+        """
+        Selects the core types greedily: starting from all genes, the type
+        which keeps the most genes (with data for all selected types) is
+        added in each step, until all types are selected. In contrast to the
+        coverage threshold, the selected types are not restricted to the
+        types with the highest gene coverage, and steps which don't increase
+        the score are not stopping the selection. The selection with the
+        maximum score (#genes * #types) is returned.
+
+        @returns:   A boolean mask of the selected types.
+        """
+        num_genes, num_types = self.present.shape
+        gene_mask = numpy.ones(num_genes, dtype=bool)
+        type_mask = numpy.zeros(num_types, dtype=bool)
+        best_score = 0
+        best_mask = type_mask.copy()
+        for i in range(num_types):
+            # number of remaining genes for each candidate type
+            remaining = self.present[gene_mask].sum(axis=0)
+            remaining[type_mask] = -1
+            t = numpy.argmax(remaining)
+            if remaining[t] <= 0:
+                # no genes left, the score can't increase anymore
+                break
+            type_mask[t] = True
+            gene_mask &= self.present[:, t]
+            score = (i + 1) * remaining[t]
+            if score > best_score:
+                best_score = score
+                best_mask = type_mask.copy()
+        return best_mask
+
+    def core(self, threshold=None, type_mask=None):
+        """
+        Returns the core of the data set: the sub-matrix of all types with a
+        gene coverage of at least `threshold` (or the types given by the
+        boolean `type_mask`) and all genes with data for all these types.
+        """
+        if type_mask is None:
+            type_mask = self.gene_coverage() >= threshold
+        gene_mask = self.present[:, type_mask].all(axis=1)
+        core = ExpressionMatrix(self.genes[gene_mask], self.types[type_mask],
+                                self.values[gene_mask][:, type_mask],
+                                self.present[gene_mask][:, type_mask])
+        if self.expressed is not None:
+            core.expressed = self.expressed[gene_mask][:, type_mask]
+        return core
+
+    def write_expressed_table(self, dst_table, schema_query, sql_conn):
+        """
+        Writes the (Gene, Type, Expressed) table of all present entries
+        in (Gene, Type) order.
+
+        @param schema_query:    A query of the same columns (and types), it
+                                is only used to create the empty table.
+        """
+        sql.new_table_from_query(dst_table, schema_query + ' LIMIT 0',
+                                 sql_conn)
+        gene_idx, type_idx = numpy.nonzero(self.present)
+        rows = zip(self.genes[gene_idx].tolist(),
+                   self.types[type_idx].tolist(),
+                   self.expressed[gene_idx, type_idx].astype(int).tolist())
+        sql.insert_rows(dst_table, rows, 3, sql_conn)
+        sql_conn.commit()
+
+    def write_expr_counts_table(self, dst_table, schema_query, sql_conn):
+        """
+        Writes the (Gene, TotalCount, ExpressedCount) table in Gene order.
+
+        @param schema_query:    A query of the same columns (and types), it
+                                is only used to create the empty table.
+        """
+        sql.new_table_from_query(dst_table, schema_query + ' LIMIT 0',
+                                 sql_conn)
+        total, expressed = self.expr_counts()
+        has_data = total > 0
+        rows = zip(self.genes[has_data].tolist(), total[has_data].tolist(),
+                   expressed[has_data].tolist())
+        sql.insert_rows(dst_table, rows, 3, sql_conn)
+        sql_conn.commit()
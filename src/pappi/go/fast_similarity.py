@@ -13,12 +13,13 @@ class GoFastSimilarity(GoSimilarity):
     # the biological process root node
     BP_root = 8150
 
-    def __init__(self, obo_file, sql_conn, verbose=True):
+    def __init__(self, obo_file, sql_conn, verbose=True, cache_dir=None):
         # load gene ontology with fastSemSim
         if verbose:
             print("loading gene ontology")
         # import only the BP namespace:
-        self.go_dag = GODag(obo_file, only_namespace="biological_process")
+        self.go_dag = GODag(obo_file, only_namespace="biological_process",
+                            cache_dir=cache_dir)
 
         # load annotation class with fastSemSim
         if verbose:
@@ -46,6 +47,31 @@ class GoFastSimilarity(GoSimilarity):
             raise Exception("SimRel score is invalid")
         return score
 
+    def simRel_scores(self, terms1, terms2):
+        """
+        Returns the SimRel scores of all pairs of the given terms as matrix
+        (len(terms1), len(terms2)), using the batched MICA of the GO DAG.
+        """
+        dag = self.go_dag
+        idx1 = numpy.array([dag.term_index[t] for t in terms1],
+                           dtype=numpy.int64)
+        idx2 = numpy.array([dag.term_index[t] for t in terms2],
+                           dtype=numpy.int64)
+        mica = dag.mica_indeces(idx1, idx2)
+        if (mica < 0).any():
+            raise Exception("Terms without common ancestor")
+        # get IC and p() of the MICAs
+        lca_IC = dag.IC_array[mica]
+        lca_p = dag.p_array[mica]
+        # calc the denominator for the scores
+        denom = dag.IC_array[idx1][:, None] + dag.IC_array[idx2][None, :]
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            scores = numpy.where(denom != 0,
+                                 2*lca_IC / denom * (1 - lca_p), 0.0)
+        if (scores > 1.0).any() or (scores < 0.0).any():
+            raise Exception("SimRel score is invalid")
+        return scores
+
     def term_pairwise_score(self, term1, term2):
         return self._simRel_score(term1, term2)
 
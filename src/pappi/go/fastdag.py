@@ -2,11 +2,30 @@
 # -*- coding: UTF-8 -*-
 
 import sys
+import os
 import math
+import re
+import collections
+import collections.abc
+import hashlib
+
+import numpy
 #from exceptions import EOFError
 
 typedef_tag, term_tag = "[Typedef]", "[Term]"
 
+# the block size (in characters) in which `parse_obo()` reads the OBO file
+OBO_BLOCK_SIZE = 1 << 22
+
+# the version of the `GODag` cache files (increase on format changes)
+GODAG_CACHE_VERSION = 1
+
+# a compact record of an OBO [Term] stanza (the multi-valued fields are
+# tuples of the IDs)
+OBORecord = collections.namedtuple('OBORecord',
+                                   ['id', 'name', 'namespace', 'is_a',
+                                    'alt_ids', 'is_obsolete', 'part_of'])
+
 # TODO: this is duplicate from go_similarity
 def name2id(name):
     return int(name.split(":")[1])
@@ -29,6 +48,80 @@ def read_until(handle, start):
     raise EOFError("%s tag cannot be found" % start)
 
 
+def _obo_line_regex(part_of):
+    # matches the stanza tags and the parsed tags (all other lines are
+    # skipped by the regex itself)
+    tags = ['id', 'name', 'namespace', 'is_a', 'alt_id', 'is_obsolete']
+    if part_of:
+        tags.append('relationship')
+    return re.compile(r'^(?:\[([^\]\r\n]*)\]|(' + '|'.join(tags)
+                      + r'):[ \t]*([^\r\n]*))', re.M)
+
+
+def parse_obo(obo_file, part_of=False, block_size=OBO_BLOCK_SIZE):
+    """
+    Parses all [Term] stanzas of the given OBO file in a single pass.
+
+    The file is read in large blocks (cut at the last line break), and the
+    stanza tags and the parsed tag-value lines of each block are found with
+    a single regular expression, instead of checking every line.
+
+    @param obo_file:    The OBO file name.
+    @param part_of:     Whether to parse the `part_of` relationships.
+    @param block_size:  The number of characters read at a time.
+    @returns:           A generator of `OBORecord`s.
+    """
+    line_regex = _obo_line_regex(part_of)
+    # the fields of the current [Term] stanza (None outside of [Term]s)
+    rec = None
+    with open(obo_file) as f:
+        remainder = ''
+        while True:
+            block = f.read(block_size)
+            if block:
+                # only parse complete lines
+                text = remainder + block
+                cut = text.rfind('\n') + 1
+                remainder = text[cut:]
+                text = text[:cut]
+            else:
+                text = remainder
+            for tag, key, value in line_regex.findall(text):
+                if tag:
+                    if rec is not None:
+                        yield _obo_record(rec)
+                    rec = _new_obo_fields() if tag == 'Term' else None
+                elif rec is None:
+                    continue
+                elif key == 'is_a':
+                    rec['is_a'].append(value.split()[0])
+                elif key == 'alt_id':
+                    rec['alt_ids'].append(value.strip())
+                elif key == 'relationship':
+                    rel = value.split()
+                    if len(rel) > 1 and rel[0] == 'part_of':
+                        rec['part_of'].append(rel[1])
+                elif key == 'is_obsolete':
+                    rec['is_obsolete'] = value.strip() == 'true'
+                else:
+                    rec[key] = value.strip()
+            if not block:
+                break
+    if rec is not None:
+        yield _obo_record(rec)
+
+
+def _new_obo_fields():
+    return {'id': '', 'name': '', 'namespace': '', 'is_a': [],
+            'alt_ids': [], 'is_obsolete': False, 'part_of': []}
+
+
+def _obo_record(fields):
+    return OBORecord(fields['id'], fields['name'], fields['namespace'],
+                     tuple(fields['is_a']), tuple(fields['alt_ids']),
+                     fields['is_obsolete'], tuple(fields['part_of']))
+
+
 class OBOReader:
     """
     parse obo file, usually the most updated can be downloaded from
@@ -57,7 +150,13 @@ class OBOReader:
         if not line.startswith(term_tag):
             read_until(self._handle, term_tag)
         while 1:
-            yield self.next()
+            # a StopIteration raised inside a generator is a RuntimeError
+            # (PEP 479)
+            try:
+                rec = self.next()
+            except StopIteration:
+                return
+            yield rec
 
     def next(self):
 
@@ -147,9 +246,115 @@ class GOTerm:
         return all_children
 
 
+def file_hash(filename, block_size=1 << 20):
+    # the SHA-1 hex digest of the file content
+    h = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _to_csr(lists, dtype=numpy.int64):
+    # concatenates the lists into the CSR arrays (ptr, idx)
+    ptr = numpy.zeros(len(lists) + 1, dtype=numpy.int64)
+    ptr[1:] = numpy.cumsum([len(l) for l in lists])
+    idx = numpy.array([x for l in lists for x in l], dtype=dtype)
+    return ptr, idx
+
+
+def _from_csr(ptr, idx):
+    # splits the CSR arrays into a list of lists
+    idx = idx.tolist()
+    return [idx[a:b] for a, b in zip(ptr[:-1].tolist(), ptr[1:].tolist())]
+
+
+def _sets_to_csr(sets):
+    # the CSR arrays (ptr, idx) of the sets of indeces, each row sorted
+    ptr = numpy.zeros(len(sets) + 1, dtype=numpy.int64)
+    numpy.cumsum([len(x) for x in sets], out=ptr[1:])
+    idx = numpy.fromiter((i for x in sets for i in sorted(x)),
+                         dtype=numpy.int64, count=ptr[-1])
+    return ptr, idx
+
+
+def _transpose_csr(ptr, idx, n):
+    # the CSR arrays of the transposed relation (each row sorted)
+    rows = numpy.repeat(numpy.arange(n), numpy.diff(ptr))
+    order = numpy.lexsort((rows, idx))
+    t_ptr = numpy.zeros(n + 1, dtype=numpy.int64)
+    numpy.cumsum(numpy.bincount(idx, minlength=n), out=t_ptr[1:])
+    return t_ptr, rows[order]
+
+
+def csr_gather(ptr, idx, rows):
+    # the concatenated CSR rows `rows`, returns the arrays (i, values) where
+    # `i` is the position in `rows` of each value
+    lengths = ptr[rows + 1] - ptr[rows]
+    i = numpy.repeat(numpy.arange(len(rows)), lengths)
+    starts = numpy.cumsum(lengths) - lengths
+    offsets = numpy.arange(len(i)) - starts[i] + ptr[rows][i]
+    return i, idx[offsets]
+
+
+class ClosureView(collections.abc.Mapping):
+    """
+    A read-only dict {term id -> set of term ids} backed by the CSR arrays
+    (ptr, idx) of a closure: the indeces of the terms related to the term
+    with index `i` are `idx[ptr[i]:ptr[i+1]]`.
+
+    The sets are created on the first access of a term and then kept.
+    """
+
+    def __init__(self, csr, term_ids, term_index):
+        self.term_ids = term_ids
+        self.term_index = term_index
+        self._sets = dict()
+        self._csr = csr
+        # the CSR lists of the term ids (created on first access)
+        self._ptr = None
+        self._ids = None
+
+    def csr(self):
+        """
+        Returns the CSR arrays (ptr, idx) of the term indeces.
+        """
+        return self._csr
+
+    def __getitem__(self, term):
+        result = self._sets.get(term)
+        if result is None:
+            i = self.term_index[term]
+            if self._ptr is None:
+                ptr, idx = self.csr()
+                self._ptr = ptr.tolist()
+                self._ids = self.term_ids[idx].tolist()
+            result = set(self._ids[self._ptr[i]:self._ptr[i + 1]])
+            self._sets[term] = result
+        return result
+
+    def __iter__(self):
+        return iter(self.term_index)
+
+    def __len__(self):
+        return len(self.term_index)
+
+    def __contains__(self, term):
+        return term in self.term_index
+
+
 class GODag:
 
-    def __init__(self, obo_file="gene_ontology.1_2.obo", only_namespace=None, load_obsolete=False):
+    def __init__(self, obo_file="gene_ontology.1_2.obo", only_namespace=None,
+                 load_obsolete=False, cache_dir=None):
+        """
+        Loads the GO DAG from the OBO file.
+
+        @param cache_dir:   If given, the compiled DAG is saved into this
+                            folder (keyed by the hash of the OBO file and the
+                            filter options) and loaded from there on later
+                            constructions, without parsing the OBO file.
+        """
         # initialize all members
 
         # a set of integer IDs of all GO terms present in the DAG
@@ -162,34 +367,156 @@ class GODag:
         self.parents = dict()
         # a dict of ID->[set of ID]
         self.children = dict()
-        # all ancestors
+        # the term ids by term index and the dict ID->term index
+        self.term_ids = numpy.zeros(0, dtype=numpy.int64)
+        self.term_index = dict()
+        # all ancestors (a dict-like ID->[set of ID] view of the CSR arrays
+        # of the term indeces, see `ClosureView.csr()`)
         self.ancestors = dict()
-        # all decendents
+        # all decendents (a dict-like ID->[set of ID] view of the CSR arrays)
         self.decendents = dict()
+        # the cumulative annotation frequencies, probabilities and
+        # information content (as arrays by term index and dicts by ID)
+        self.freq_array = None
+        self.p_array = None
+        self.IC_array = None
+        self.freq = dict()
+        self.p = dict()
         # a dict of ID-> Information content
         self.IC = dict()
+        # the CSR arrays of the ancestors (and the term itself) of all terms
+        # ordered by decreasing IC, as term indeces and as lists of IDs
+        # (created on the first MICA query)
+        self._mica_csr = None
+        self._mica_lists = None
+
+        # load the file (or its cached DAG)
+        if cache_dir is None:
+            self.load_obo_file(obo_file, only_namespace, load_obsolete)
+            return
+        cache_file = self.cache_filename(obo_file, cache_dir, only_namespace,
+                                         load_obsolete)
+        if not self.load_cache(cache_file):
+            self.load_obo_file(obo_file, only_namespace, load_obsolete)
+            if not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            self.save_cache(cache_file)
+
+    @staticmethod
+    def cache_filename(obo_file, cache_dir, only_namespace=None,
+                       load_obsolete=False):
+        """
+        Returns the name of the cache file of the compiled DAG of the given
+        OBO file and filter options.
+        """
+        name = 'godag_' + file_hash(obo_file)
+        if only_namespace is not None:
+            name += '_' + only_namespace
+        if load_obsolete:
+            name += '_obsolete'
+        return os.path.join(cache_dir, name + '.npz')
+
+    def save_cache(self, cache_file):
+        """
+        Saves the compiled DAG as `.npz` file. The terms are stored by their
+        index in the sorted array of all term ids, the parents, ancestors and
+        decendents as CSR arrays of term indeces.
+        """
+        ids = self.term_ids.tolist()
+        index = self.term_index
+        recs = [self.nodes[t] for t in ids]
+        # the parents are kept in the order of the `is_a` tags
+        is_a = [[index[name2id(x)] for x in r.is_a] for r in recs]
+        arrays = dict()
+        arrays['version'] = numpy.array(GODAG_CACHE_VERSION)
+        arrays['ids'] = numpy.array(ids, dtype=numpy.int64)
+        arrays['accessions'] = numpy.array([r.id for r in recs], dtype=str)
+        arrays['names'] = numpy.array([r.name for r in recs], dtype=str)
+        arrays['namespaces'] = numpy.array([r.namespace for r in recs],
+                                           dtype=str)
+        arrays['is_obsolete'] = numpy.array([r.is_obsolete for r in recs],
+                                            dtype=bool)
+        arrays['level'] = numpy.array([self.level[t] for t in ids],
+                                      dtype=numpy.int32)
+        arrays['alt_ids_ptr'], arrays['alt_ids'] = _to_csr(
+            [r.alt_ids for r in recs], dtype=str)
+        arrays['is_a_ptr'], arrays['is_a'] = _to_csr(is_a)
+        for key, view in [('ancestors', self.ancestors),
+                          ('decendents', self.decendents)]:
+            arrays[key + '_ptr'], arrays[key] = view.csr()
+        # write to a temporary file first, to never leave a partial cache
+        tmp_file = cache_file + '.' + str(os.getpid()) + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            numpy.savez(f, **arrays)
+        os.replace(tmp_file, cache_file)
+
+    def load_cache(self, cache_file):
+        """
+        Loads the compiled DAG saved by `save_cache()`.
 
-        # load the file
-        self.load_obo_file(obo_file, only_namespace, load_obsolete)
+        @returns:   False if the cache file doesn't exist or is of a
+                    different version, True otherwise.
+        """
+        if not os.path.isfile(cache_file):
+            return False
+        with numpy.load(cache_file) as data:
+            if int(data['version']) != GODAG_CACHE_VERSION:
+                return False
+            print("load GO DAG cache %s" % cache_file, file=sys.stderr)
+            ids = data['ids']
+            accessions = data['accessions'].tolist()
+            names = data['names'].tolist()
+            namespaces = data['namespaces'].tolist()
+            is_obsolete = data['is_obsolete'].tolist()
+            level = data['level'].tolist()
+            alt_ids = _from_csr(data['alt_ids_ptr'], data['alt_ids'])
+            is_a = _from_csr(data['is_a_ptr'], data['is_a'])
+            # map the term indeces back to the term ids
+            parents = _from_csr(data['is_a_ptr'], ids[data['is_a']])
+            closures = [(data[key + '_ptr'], data[key])
+                        for key in ['ancestors', 'decendents']]
+            self.term_ids = ids
+            ids = ids.tolist()
+
+        self.terms = set(ids)
+        self.term_index = dict((t, i) for i, t in enumerate(ids))
+        self.level = dict(zip(ids, level))
+        self.roots = set()
+        for i, t in enumerate(ids):
+            rec = OBORecord(accessions[i], names[i], namespaces[i],
+                            tuple(accessions[p] for p in is_a[i]),
+                            tuple(alt_ids[i]), is_obsolete[i], ())
+            self.nodes[t] = rec
+            for alt in alt_ids[i]:
+                self.nodes[name2id(alt)] = rec
+            if len(parents[i]) == 0 and not is_obsolete[i]:
+                self.roots.add(t)
+            self.parents[t] = set(parents[i])
+            self.children[t] = set()
+        for t in ids:
+            for p in self.parents[t]:
+                self.children[p].add(t)
+        self._init_closure_views(*closures)
+        print(str(len(self.terms)) + " nodes loaded", file=sys.stderr)
+        return True
 
     def load_obo_file(self, obo_file, only_namespace=None, load_obsolete=False):
 
         print("load obo file %s" % obo_file, file=sys.stderr)
-        obo_reader = OBOReader(obo_file)
         # parse all file entries:
-        for rec in obo_reader:
+        for rec in parse_obo(obo_file):
             # filter by namespace (in case that option is set)
             if (not only_namespace is None) and rec.namespace != only_namespace:
                 continue
             # filter out obsolete (done by default)
             if not load_obsolete and rec.is_obsolete:
                 continue
-            # get and initialize integer id
-            rec.int_id = name2id(rec.id)
+            # get the integer id
+            int_id = name2id(rec.id)
             # set data records
-            self.nodes[rec.int_id] = rec
+            self.nodes[int_id] = rec
             # and add the integer id to the set of all IDs
-            self.terms.add(rec.int_id)
+            self.terms.add(int_id)
             # let the alternative IDs refer to the real (current) ones
             # TODO: do I need to add them to the set of all terms?
             for alt in rec.alt_ids:
@@ -201,55 +528,16 @@ class GODag:
 
     def populate_terms(self):
 
-        # recusively find the level of a term
-        def depth(term):
-            if not term in self.level:
-                level = 0
-                # if there are no parents -> root at level 0
-                if len(self.parents[term]) != 0:
-                    level = min(depth(t) for t in self.parents[term]) + 1
-                # save the level
-                self.level[term] = level
-            return self.level[term]
-
-        # recursively find all decendents for a term
-        def rec_dec(term):
-            if not term in self.decendents:
-                dec = set()
-                for c in self.children[term]:
-                    dec = dec.union(rec_dec(c))
-                self.decendents[term] = dec
-            else:
-                dec = self.decendents[term]
-            # add self before returning
-            # create a copy first
-            dec = set(dec)
-            dec.add(term)
-            return dec
-
-        # recursively find all ancesotrs for a term
-        def rec_anc(term):
-            if not term in self.ancestors:
-                anc = set()
-                for p in self.parents[term]:
-                    anc = anc.union(rec_anc(p))
-                self.ancestors[term] = anc
-            else:
-                anc = self.ancestors[term]
-            # add self before returning
-            anc = set(anc)  # create a copy first
-            anc.add(term)
-            return anc
-
         # initialize the parents data structure (a dict from id->set of ids)
         self.roots = set()
         for rec in self.nodes.values():
-            parents = set([name2id(x) for x in rec._parents])
+            int_id = name2id(rec.id)
+            parents = set([name2id(x) for x in rec.is_a])
             # check if this is a root node, if yes then add to roots
             if len(parents) == 0 and not rec.is_obsolete:
-                self.roots.add(rec.int_id)
+                self.roots.add(int_id)
             # save the parents
-            self.parents[rec.int_id] = parents
+            self.parents[int_id] = parents
 
         # initialize children
         for term in self.terms:
@@ -261,17 +549,65 @@ class GODag:
             for p in self.parents[term]:
                 self.children[p].add(term)
 
-        # initialize the ancestors and decendents
-        for term in self.terms:
-            rec_anc(term)
-            rec_dec(term)
+        # the terms are indexed by their position in the sorted term ids
+        self.term_ids = numpy.array(sorted(self.terms), dtype=numpy.int64)
+        self.term_index = dict((t, i) for i, t
+                               in enumerate(self.term_ids.tolist()))
+
+        # the levels and closures are computed in topological order (all
+        # parents before their children)
+        order = self.topological_order()
+        # populate the `level` data (the shortest path to a root)
+        for term in order:
+            parents = self.parents[term]
+            if len(parents) == 0:
+                self.level[term] = 0
+            else:
+                self.level[term] = min(self.level[p] for p in parents) + 1
 
-        # initialize the `1evel` data
-        for term in self.terms:
-            # populate `level`
-            if not term in self.level:
-                depth(term)
+        # the ancestors as the union of the parents' ancestors, and the
+        # decendents as the transposed ancestors
+        ancestors = self._closure_csr(order, self.parents)
+        decendents = _transpose_csr(*ancestors, n=len(self.term_ids))
+        self._init_closure_views(ancestors, decendents)
 
+    def topological_order(self):
+        """
+        Returns all terms ordered such that every term comes after all of
+        its parents.
+        """
+        num_parents = dict((t, len(self.parents[t])) for t in self.terms)
+        order = [t for t in sorted(self.terms) if num_parents[t] == 0]
+        # `order` grows while it is iterated
+        for term in order:
+            for c in self.children[term]:
+                num_parents[c] -= 1
+                if num_parents[c] == 0:
+                    order.append(c)
+        if len(order) != len(self.terms):
+            raise ValueError("The GO DAG contains cycles")
+        return order
+
+    def _closure_csr(self, order, neighbors):
+        # the CSR arrays (by term index) of the transitive closure of the
+        # `neighbors` relation, each term in `order` has to come after all
+        # of its neighbors
+        closure = [None] * len(self.term_ids)
+        for term in order:
+            row = set()
+            for t in neighbors[term]:
+                j = self.term_index[t]
+                row.add(j)
+                row |= closure[j]
+            closure[self.term_index[term]] = row
+        return _sets_to_csr(closure)
+
+    def _init_closure_views(self, ancestors_csr, decendents_csr):
+        # the dict-of-sets views of the closures (for backward compatibility)
+        self.ancestors = ClosureView(ancestors_csr, self.term_ids,
+                                     self.term_index)
+        self.decendents = ClosureView(decendents_csr, self.term_ids,
+                                      self.term_index)
 
     def _to_id(self, term):
         if type(term) is str:
@@ -320,55 +656,95 @@ class GODag:
         return _paths_to_top_recursive(term)
 
 
-    def term_probability(self, associations):
-        # initialize annotation counting dict
-        anno = dict()
-        for t in self.terms:
-            anno[t] = 0
-
-        # count number of annotations per term
-        for key, terms in associations.items():
-            for t in terms:
-                t = self._to_id(t)
-                if not t in self.terms:
-                    continue
-                anno[t] = anno[t] + 1
-
-        # determine cummulative frequency
-        self.freq = dict()
-        for t in self.terms:
-            child_freq = sum(anno[s] for s in self.decendents[t])
-            self.freq[t] = anno[t] + child_freq
+    def annotation_pairs(self, associations):
+        """
+        Returns the arrays (gene indeces, term indeces) of all annotations
+        of the given associations {gene -> set of terms} with terms in the
+        DAG. The genes are indexed in the order of the associations.
+        """
+        genes = []
+        terms = []
+        for g, gene_terms in enumerate(associations.values()):
+            for t in gene_terms:
+                i = self.term_index.get(self._to_id(t))
+                if i is not None:
+                    genes.append(g)
+                    terms.append(i)
+        return (numpy.array(genes, dtype=numpy.int64),
+                numpy.array(terms, dtype=numpy.int64))
+
+    def term_probability(self, associations, unique_genes=False):
+        """
+        Determines the (cumulative) annotation frequencies and the
+        probabilities of all terms, as the arrays `freq_array` and `p_array`
+        (by term index) and the dicts `freq` and `p` (by term id).
+
+        @param associations:    The dict {gene -> set of terms}.
+        @param unique_genes:    If False, the frequency of a term is its
+                                number of annotations plus the numbers of
+                                annotations of all its decendents, i.e. a gene
+                                annotated with several of these terms counts
+                                several times. If True, the frequency is the
+                                number of distinct genes annotated with the
+                                term or any of its decendents.
+        """
+        n = len(self.term_ids)
+        genes, terms = self.annotation_pairs(associations)
+        if unique_genes:
+            # each gene annotates the terms and all their ancestors, counted
+            # once per (gene, term)
+            i, anc = csr_gather(*self.ancestors.csr(), rows=terms)
+            pairs = numpy.concatenate([genes * n + terms, genes[i] * n + anc])
+            pairs.sort()
+            distinct = numpy.ones(len(pairs), dtype=bool)
+            distinct[1:] = pairs[1:] != pairs[:-1]
+            freq = numpy.bincount(pairs[distinct] % n, minlength=n)
+        else:
+            # count number of annotations per term
+            anno = numpy.bincount(terms, minlength=n)
+            # and add the annotations of all decendents
+            ptr, dec = self.decendents.csr()
+            rows = numpy.repeat(numpy.arange(n), numpy.diff(ptr))
+            freq = anno + numpy.bincount(rows, weights=anno[dec],
+                                         minlength=n).astype(numpy.int64)
 
         # from frequency determine probability
-        self.p = dict()
-        total_freq = sum(self.freq[r] for r in self.roots)
-        for term, f in self.freq.items():
-            self.p[term] = f / total_freq
+        total_freq = freq[[self.term_index[r] for r in self.roots]].sum()
+        self.freq_array = freq
+        self.p_array = freq / total_freq
+        ids = self.term_ids.tolist()
+        self.freq = dict(zip(ids, freq.tolist()))
+        self.p = dict(zip(ids, self.p_array.tolist()))
 
 
     def term_IC(self, terms=None):
+        """
+        Determines the information content -log10(p) of all terms as the
+        array `IC_array` (by term index) and the dict `IC` (by term id, only
+        for the given terms if set). Terms with p = 0 have an IC of 0.
+        """
         # check that the probabilities (from the frequencies)
         # have already been determined
         if len(self.p) == 0:
             raise Exception
 
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            self.IC_array = numpy.where(self.p_array > 0.0,
+                                        -numpy.log10(self.p_array), 0.0)
+        # the MICA order depends on the IC
+        self._mica_csr = None
+        self._mica_lists = None
+
         # get the set of terms to use
         if terms is None:
-            terms = self.terms
+            ids = self.term_ids.tolist()
+            IC = self.IC_array.tolist()
         else:
             # convert to integer ids
-            if type(terms[0]) is str():
-                terms = set([name2id(t) for t in terms])
-            terms = self.terms.intersect(terms)
-
-        # initialize and fill the information content
-        self.IC = dict()
-        for i in terms:
-            if not self.p[i] > 0.0:
-                self.IC[i] = 0.0
-            else:
-                self.IC[i] = - math.log10(self.p[i])
+            ids = list(self.terms.intersection(self._to_id(t)
+                                               for t in terms))
+            IC = self.IC_array[[self.term_index[t] for t in ids]].tolist()
+        self.IC = dict(zip(ids, IC))
 
 
     def get_lca_option1(self, term1, term2):
@@ -421,11 +797,9 @@ class GODag:
         """
         Finds the lowest common ancestors for the two given terms
         """
-        # get common ancestors
-        t1_anc = self.ancestors[term1]
-        t1_anc.add(term1)
-        t2_anc = self.ancestors[term2]
-        t2_anc.add(term2)
+        # get common ancestors (without modifying the `ancestors` sets)
+        t1_anc = self.ancestors[term1] | set([term1])
+        t2_anc = self.ancestors[term2] | set([term2])
         common_ancestors = t1_anc.intersection(t2_anc)
 
         # get the common ancestors with maximum level
@@ -441,24 +815,128 @@ class GODag:
         #return self.get_lca_option1(term1, term2)
         return self.get_lca_option2(term1, term2)
 
+    def _ranked_ancestors(self):
+        # the CSR arrays (ptr, idx) of the ancestors of each term including
+        # the term itself, ordered by decreasing IC (ties by term index)
+        if self._mica_csr is None:
+            if self.IC_array is None:
+                raise Exception("The IC has to be determined first")
+            n = len(self.term_ids)
+            order = numpy.lexsort((numpy.arange(n), -self.IC_array))
+            rank = numpy.empty(n, dtype=numpy.int64)
+            rank[order] = numpy.arange(n)
+            ptr, idx = self.ancestors.csr()
+            num_anc = numpy.diff(ptr)
+            # add each term to its own ancestors, then sort each row by rank
+            rows = numpy.concatenate([numpy.repeat(numpy.arange(n), num_anc),
+                                      numpy.arange(n)])
+            idx = numpy.concatenate([idx, numpy.arange(n)])
+            idx = idx[numpy.lexsort((rank[idx], rows))]
+            ptr = numpy.zeros(n + 1, dtype=numpy.int64)
+            numpy.cumsum(num_anc + 1, out=ptr[1:])
+            self._mica_csr = (ptr, idx)
+        return self._mica_csr
+
+    def mica_indeces(self, a, b, block_size=1024, chunk_size=1 << 22):
+        """
+        Returns the MICA (the common ancestor with the maximum IC) of all
+        pairs of the given term indeces as array (len(a), len(b)) of term
+        indeces (-1 if the terms have no common ancestor).
+
+        Each term's ancestors are ordered by IC once, so the MICA is the
+        first of them that is also an ancestor of the other term. For a
+        block of terms `b`, the membership matrix of the ancestors of the
+        terms `a` is filled from the ancestors of the block's terms, and the
+        first common ancestors of many terms `a` are found by a single
+        argmax.
+
+        @param block_size:  The number of terms `b` per block.
+        @param chunk_size:  The maximum number of ancestor memberships
+                            gathered at once.
+        """
+        a = numpy.asarray(a, dtype=numpy.int64)
+        b = numpy.asarray(b, dtype=numpy.int64)
+        ptr, idx = self._ranked_ancestors()
+        # all ancestors of the terms `a`, the membership matrix only holds
+        # their rows (and an extra all-False row `num_anc` for padding)
+        is_ancestor = numpy.zeros(len(self.term_ids), dtype=bool)
+        is_ancestor[csr_gather(ptr, idx, a)[1]] = True
+        ancestors = numpy.flatnonzero(is_ancestor)
+        num_anc = len(ancestors)
+        local = numpy.full(len(self.term_ids), num_anc, dtype=numpy.int64)
+        local[ancestors] = numpy.arange(num_anc)
+
+        # the ranked ancestors of the terms `a` as rows of a matrix (in local
+        # indeces), the terms are sorted by their number of ancestors to
+        # reduce the padding
+        lengths = ptr[a + 1] - ptr[a]
+        order = numpy.argsort(lengths, kind='stable')
+        chunks = []
+        max_rows = max(1, chunk_size // min(max(len(b), 1), block_size))
+        start = 0
+        while start < len(a):
+            # extend the chunk while its padded size is below `max_rows`
+            # (the last term of the chunk has the most ancestors)
+            end = start + 1
+            while (end < len(a)
+                   and (end - start + 1) * lengths[order[end]] <= max_rows):
+                end += 1
+            rows = order[start:end]
+            anc = numpy.full((len(rows), lengths[order[end - 1]]), num_anc,
+                             dtype=numpy.int64)
+            row, values = csr_gather(ptr, idx, a[rows])
+            offsets = numpy.cumsum(lengths[rows]) - lengths[rows]
+            anc[row, numpy.arange(len(row)) - offsets[row]] = local[values]
+            # the term indeces (the padding is never selected as MICA)
+            anc_ids = ancestors[numpy.minimum(anc, num_anc - 1)]
+            chunks.append((rows, anc, anc_ids))
+            start = end
+
+        result = numpy.full((len(a), len(b)), -1, dtype=numpy.int64)
+        for start in range(0, len(b), block_size):
+            block = b[start:start + block_size]
+            # is_anc[t, j]: ancestor t is an ancestor of block[j] (or itself)
+            is_anc = numpy.zeros((num_anc + 1, len(block)), dtype=bool)
+            col, values = csr_gather(ptr, idx, block)
+            is_anc[local[values], col] = True
+            # the padding row is set by the ancestors not in `ancestors`
+            is_anc[num_anc] = False
+            for rows, anc, anc_ids in chunks:
+                common = is_anc[anc]
+                first = common.argmax(axis=1)
+                found = numpy.take_along_axis(common, first[:, None, :],
+                                              axis=1)[:, 0, :]
+                mica = numpy.take_along_axis(anc_ids, first, axis=1)
+                result[rows, start:start + len(block)] = numpy.where(
+                    found, mica, -1)
+        return result
+
+    def mica(self, terms_a, terms_b):
+        """
+        Returns the MICA (the common ancestor with the maximum IC) of all
+        pairs of the given terms as array (len(terms_a), len(terms_b)) of
+        term ids (-1 if the terms have no common ancestor). `term_IC()` has
+        to be called first.
+        """
+        a = [self.term_index[self._to_id(t)] for t in terms_a]
+        b = [self.term_index[self._to_id(t)] for t in terms_b]
+        result = self.mica_indeces(a, b)
+        return numpy.where(result >= 0, self.term_ids[result], -1)
+
     def get_max_IC_anc(self, term1, term2):
         """
         Returns the common ancestor of term1 and term2 with the maximum
         information conent (IC) score.
         """
-        # get common ancestors
-        t1_anc = self.ancestors[term1]
-        t1_anc.add(term1)
+        if self._mica_lists is None:
+            ptr, idx = self._ranked_ancestors()
+            self._mica_lists = (ptr.tolist(), self.term_ids[idx].tolist())
+        ptr, ids = self._mica_lists
+        # the first ancestor of term1 (by decreasing IC) that is also an
+        # ancestor of term2
         t2_anc = self.ancestors[term2]
-        t2_anc.add(term2)
-        common_ancestors = t1_anc.intersection(t2_anc)
-
-        # get the ancestor with maxium IC
-        ic = -1
-        max_anc = None
-        for t in common_ancestors:
-            if self.IC[t] > ic:
-                ic = self.IC[t]
-                max_anc = t
-        # return the max IC anc
-        return max_anc
+        i = self.term_index[term1]
+        for t in ids[ptr[i]:ptr[i + 1]]:
+            if t == term2 or t in t2_anc:
+                return t
+        return None
@@ -17,10 +17,11 @@ from pappi.go.fast_similarity import GoFastSimilarity
 class GoGenePreBufSimilarity(GoPreBufSimilarity):
     def __init__(self, obo_file, sim_file, term_mapping_file,
                  bpscore_file, bpscore_row_file, gene_mapping_file,
-                 sql_conn, verbose=True):
+                 sql_conn, verbose=True, cache_dir=None):
         # initialize the super class
         GoPreBufSimilarity.__init__(self, obo_file, sim_file,
-                                    term_mapping_file, sql_conn, verbose)
+                                    term_mapping_file, sql_conn, verbose,
+                                    cache_dir)
 
         # load the data file or create and fill it
         self._load_or_create_bpscore(bpscore_file, bpscore_row_file,
@@ -14,9 +14,10 @@ from pappi.go.fast_similarity import GoFastSimilarity
 
 
 class GoPreBufSimilarity(GoFastSimilarity):
-    def __init__(self, obo_file, sim_file, mapping_file, sql_conn, verbose=True):
+    def __init__(self, obo_file, sim_file, mapping_file, sql_conn, verbose=True,
+                 cache_dir=None):
         # initialize the super class
-        GoFastSimilarity.__init__(self, obo_file, sql_conn, verbose)
+        GoFastSimilarity.__init__(self, obo_file, sql_conn, verbose, cache_dir)
 
         # load the data file or create and fill it
         self._load_or_create(sim_file, mapping_file)
@@ -48,7 +49,7 @@ class GoPreBufSimilarity(GoFastSimilarity):
         self.term_mapping = mapping
 
 
-    def _fill_sim_matrix(self, verbose=True):
+    def _fill_sim_matrix(self, verbose=True, block_size=256):
         # get the unique go_terms
         terms = set()
         for term_set in self.assoc.values():
@@ -72,17 +73,15 @@ class GoPreBufSimilarity(GoFastSimilarity):
             print("Pre-calculating SemSim between all " + str(len(terms)) + " terms...")
         sim_vals = numpy.zeros((nTerms, nTerms))
 
-        # fill matrix in row major
-        for i in range(0, nTerms):
-            t1 = idx_2_term[i]
+        # fill matrix in blocks of rows (the upper triangle and mirrored)
+        for i in range(0, nTerms, block_size):
+            end = min(i + block_size, nTerms)
             if verbose:
-                if i % 10 == 0:
-                    print("filling row " + str(i) + "/" + str(nTerms))
-            for j in range(i+1, nTerms):
-                t2 = idx_2_term[j]
-                sim = self._simRel_score(t1, t2)
-                sim_vals[i][j] = sim
-                sim_vals[j][i] = sim
+                print("filling rows " + str(i) + "-" + str(end) + "/"
+                      + str(nTerms))
+            sim = self.simRel_scores(idx_2_term[i:end], idx_2_term[i:])
+            sim_vals[i:end, i:] = sim
+            sim_vals[i:, i:end] = sim.T
 
         # fill diagonal with (1-p)
         if verbose:
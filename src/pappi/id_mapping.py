@@ -10,6 +10,8 @@ Import operations for ID mapping tables. (Ensembl ENSG<->ENSP and Ensembl ENSG
 #  - idk what else yet
 
 import csv
+import itertools
+import operator
 
 from . import sql
 
@@ -30,6 +32,33 @@ U133A_MAPPING_TABLE_NAME = 'u133a'
 
 MAPPING_STATS_TABLE = 'mapping_stats'
 
+# The identifier catalog: all identifiers of the mapping tables (dictionary
+# encoded with integer keys) and the resolved mappings between all of them
+ID_CATALOG_TABLE = 'id_catalog'
+ID_CATALOG_MAP_TABLE = 'id_catalog_map'
+ID_CATALOG_AMBIGUITIES_TABLE = 'id_catalog_ambiguities'
+ID_CATALOG_SOURCES = [HGNC_MAPPING_TABLE_NAME, BIOMART_MAPPING_TABLE_NAME]
+
+# The global gene dictionary: the catalog keys of all identifiers of the
+# `UNIFYING_ID` type, by which the genes of the PPI edge tables are encoded
+GENE_DICT_TABLE = 'gene_dict'
+
+# The resolutions of ambiguous identifier matches (see `AmbiguityResolver`)
+RESOLVE_MIN = 'min'
+RESOLVE_SUPPORT = 'support'
+RESOLVE_ALL = 'all'
+RESOLUTIONS = [RESOLVE_MIN, RESOLVE_SUPPORT, RESOLVE_ALL]
+AMBIGUITY_RESOLUTION = RESOLVE_MIN
+
+# Whether `map_identifier()` maps the rows with an in-memory index of the
+# mapping tables (instead of SQL JOINs)
+IN_MEMORY_MAPPING = False
+
+# Whether `map_identifier()` creates the tables of the unmatched identifiers
+# and rows (`<table>_unmatched_ids` and `<table>_unmatched_rows`) in verbose
+# mode, otherwise only their numbers are counted
+MAPPING_UNMATCHED_TABLES = False
+
 # The Gene ID that is used throughout the project,
 # all other Gene IDs are mapped to this one
 UNIFYING_ID = "hgnc"
@@ -164,8 +193,32 @@ def import_hgnc_file(filename, sql_conn, table=HGNC_MAPPING_TABLE_NAME):
     sql.new_table_from_query(table, query, sql_conn)
 
 
+def create_mapping_stats_table(sql_conn):
+    """
+    Creates the mapping stats table (in case it does not yet exist), which
+    holds a single row per mapped table and identifier types: a re-mapped
+    table replaces its previous row. Duplicate rows of older databases are
+    removed (only the last one is kept).
+    """
+    cur = sql_conn.cursor()
+    cur.execute('CREATE TABLE IF NOT EXISTS ' + MAPPING_STATS_TABLE + ' '
+                '(mapped_table varchar(32), from_id varchar(16), '
+                ' to_id varchar(16), total_ids int, matched_ids int, '
+                ' unmatched_ids int, total_rows int,'
+                ' matched_rows int, unmatched_rows int)')
+    cur.execute('DELETE FROM ' + MAPPING_STATS_TABLE + ' WHERE rowid NOT IN '
+                '(SELECT MAX(rowid) FROM ' + MAPPING_STATS_TABLE + ' '
+                ' GROUP BY mapped_table, from_id, to_id)')
+    cur.execute('CREATE UNIQUE INDEX IF NOT EXISTS ' + MAPPING_STATS_TABLE
+                + '_key ON ' + MAPPING_STATS_TABLE + ' '
+                '(mapped_table, from_id, to_id)')
+    cur.close()
+    sql_conn.commit()
+
+
 def map_identifier(from_table, from_cols, from_id, to_table, to_id,
-                   sql_conn, verbose=False):
+                   sql_conn, verbose=False, in_memory=None,
+                   unmatched_tables=None):
     """
     Takes any SQL table and creates a new SQL table, replacing the given column
     of gene identifiers by a new column of gene identifiers of another kind.
@@ -182,7 +235,19 @@ def map_identifier(from_table, from_cols, from_id, to_table, to_id,
     @param verbose:     Whether or not to print out debug information, this
                         may result in an elongated run time (due to
                         calculating statistics). Default: False
+    @param in_memory:   Whether to map the rows with an in-memory index of the
+                        mapping table (see `map_rows_in_memory()`) instead of
+                        SQL JOINs. Default: `IN_MEMORY_MAPPING`
+    @param unmatched_tables:    Whether to create the tables of the unmatched
+                                ids and rows in verbose mode (instead of only
+                                counting them).
+                                Default: `MAPPING_UNMATCHED_TABLES`
     """
+    if in_memory is None:
+        in_memory = IN_MEMORY_MAPPING
+    if unmatched_tables is None:
+        unmatched_tables = MAPPING_UNMATCHED_TABLES
+
     # get a SQl cursor object
     cur = sql_conn.cursor()
 
@@ -190,12 +255,7 @@ def map_identifier(from_table, from_cols, from_id, to_table, to_id,
         print("Matching Table '" + from_table + "' -> '" + to_table + "' "
               "by mapping identifiers " + from_id + " -> " + to_id)
         if not sql.table_exists(MAPPING_STATS_TABLE, sql_conn):
-            # create the mapping stats table
-            cur.execute('CREATE TABLE ' + MAPPING_STATS_TABLE + ' '
-                        '(mapped_table varchar(32), from_id varchar(16), '
-                        ' to_id varchar(16), total_ids int, matched_ids int, '
-                        ' unmatched_ids int, total_rows int,'
-                        ' matched_rows int, unmatched_rows int)')
+            create_mapping_stats_table(sql_conn)
 
     # in case both identifiers are the same, don't map
     # TODO: create table of unmapped identifiers (which probably are
@@ -213,18 +273,16 @@ def map_identifier(from_table, from_cols, from_id, to_table, to_id,
         # TODO: only genes that are in the mapping table
         allids = "(SELECT " + from_id + " FROM " + from_id + "_all_ids)"
         where = "WHERE " + " AND ".join(c + " in " + allids for c in from_cols)
-        sql.new_table_from_query(to_table,
-                                 'SELECT * FROM ' + from_table + " " + where,
-                                 sql_conn)
+        sqlquery = 'SELECT * FROM ' + from_table + " " + where
 
         #sql.new_table_from_query(to_table, 'SELECT * FROM ' + from_table,
         #                         sql_conn)
 
-        # get some stats
-        if verbose:
-            # set the mapping table to this, so that the mapping
-            # stats are also generated for this mapping
-            mapping_table = from_id + "_all_ids"
+        # set the mapping table to this, so that the mapping
+        # stats are also generated for this mapping
+        mapping_table = from_id + "_all_ids"
+        # the ids are compared as they are
+        from_id_type = None
 
     else:
         # check if the needed mapping table is already present
@@ -245,8 +303,11 @@ def map_identifier(from_table, from_cols, from_id, to_table, to_id,
         # for data conversions (if the according column in the from_table is
         # not converted to the same data type, then the indexes are not used,
         # resulting in very very poor performance)
-        cur.execute('SELECT TYPEOF(' + from_id + ') FROM ' + mapping_table)
-        from_id_type = cur.fetchone()[0]
+        # (fetch all rows, so that the statement doesn't keep the tables
+        # locked)
+        cur.execute('SELECT TYPEOF(' + from_id + ') FROM ' + mapping_table
+                    + ' LIMIT 1')
+        from_id_type = cur.fetchall()[0][0]
 
         # construct the fields for the result table and
         # the JOIN statement composed of INNER JOINs
@@ -282,55 +343,33 @@ def map_identifier(from_table, from_cols, from_id, to_table, to_id,
                     'FROM ' + from_table + ' AS src '
                     + " ".join(join_commands))
 
-        # for performance reasons: create an index for the from_id column of
-        # the mapping table (in case it does not yet exist)
-        cur.execute('CREATE INDEX IF NOT EXISTS ' + mapping_table + '_'
-                    + from_id + '_index ON ' + mapping_table + '('
-                    + from_id + ')')
-
+        if not in_memory:
+            # for performance reasons: create an index for the from_id column
+            # of the mapping table (in case it does not yet exist)
+            create_mapping_table_index(from_id, to_id, sql_conn)
+
+    if in_memory:
+        # map all rows and get the statistics in a single pass over the
+        # source table (the query is only used for the result's schema)
+        sql.new_table_from_query(to_table, sqlquery + ' LIMIT 0', sql_conn)
+        stats = map_rows_in_memory(from_table, from_cols, mapping_table,
+                                   from_id, to_id, from_id_type, to_table,
+                                   sql_conn, verbose, unmatched_tables)
+    else:
         # run the inner join
         sql.new_table_from_query(to_table, sqlquery, sql_conn)
-
-    # verbose debug output: get table and statistics of non-matched rows
+        if verbose and unmatched_tables:
+            stats = _mapping_stats_sql(from_table, from_cols, mapping_table,
+                                       from_id, to_table, sql_conn)
+        elif verbose:
+            stats = _mapping_stats_counts(from_table, from_cols,
+                                          mapping_table, from_id, to_table,
+                                          sql_conn)
+
+    # verbose debug output: statistics of non-matched rows
     if verbose:
-        # get all from_ids from all used columns
-        union_of_ids = " UNION ".join('SELECT ' + c + ' AS id FROM '
-                                      + from_table
-                                      for c in from_cols)
-        sqlquery = ('SELECT DISTINCT id FROM (' + union_of_ids + ')')
-        sql.new_table_from_query(from_table + '_orig_ids', sqlquery, sql_conn)
-
-        # create table of non-matched ids
-        sqlquery = ('SELECT DISTINCT id FROM ' + from_table + '_orig_ids '
-                    'WHERE id NOT IN ('
-                    '   SELECT ' + from_id + ' FROM ' + mapping_table + ')')
-        sql.new_table_from_query(to_table + '_unmatched_ids', sqlquery,
-                                 sql_conn)
-
-        # create table made of rows which did not map
-        where_or = ") OR (".join(c + ' IN (SELECT id FROM ' + to_table
-                                 + '_unmatched_ids)' for c in from_cols)
-        where_cond = "(" + where_or + ")"
-        sqlquery = ('SELECT * FROM ' + from_table + ' '
-                    'WHERE ' + where_cond)
-        sql.new_table_from_query(to_table + '_unmatched_rows', sqlquery,
-                                 sql_conn)
-
-        # get statistics (number of matched and unmatched rows and ids)
-        cur.execute('SELECT COUNT(*) FROM ' + from_table)
-        nrows_from = cur.fetchone()[0]
-
-        cur.execute('SELECT COUNT(*) FROM ' + to_table)
-        nrows_to = cur.fetchone()[0]
-
-        cur.execute('SELECT COUNT(*) FROM ' + to_table + '_unmatched_rows')
-        nrows_unmatched = cur.fetchone()[0]
-
-        cur.execute('SELECT COUNT(*) FROM ' + from_table + '_orig_ids')
-        num_from_ids = cur.fetchone()[0]
-
-        cur.execute('SELECT COUNT(*) FROM ' + to_table + '_unmatched_ids')
-        num_unmatched_ids = cur.fetchone()[0]
+        num_from_ids, num_unmatched_ids, nrows_from, nrows_to, \
+            nrows_unmatched = stats
 
         # print out all the statistics
         print("Matched Table '" + from_table + "' -> '" + to_table + "'")
@@ -339,32 +378,318 @@ def map_identifier(from_table, from_cols, from_id, to_table, to_id,
               + " identifiers (" + str(num_unmatched_ids) + " unmatched)")
         print("    Successfully matched rows: " + str(nrows_to) + "/"
               + str(nrows_from))
-        if (num_unmatched_ids > 0):
+        if num_unmatched_ids > 0 and unmatched_tables:
             print("    Unmatched rows ( = " + str(nrows_unmatched)
                   + " ) are now available in the SQL table `" + to_table
                   + "_unmatched_rows`")
             print("    Unmatched identfiers ( = " + str(num_unmatched_ids)
                   + " ) are now available in the SQL table `" + to_table
                   + "_unmatched_ids`")
+        elif num_unmatched_ids > 0:
+            print("    Unmatched rows: " + str(nrows_unmatched))
 
-        # insert all the ID mapping stats into the table
-        cur.execute('INSERT INTO ' + MAPPING_STATS_TABLE + ' '
+        # insert all the ID mapping stats into the table (the table name
+        # without the `temp.` prefix of staged tables), replacing the stats
+        # of a previous mapping of the table
+        cur.execute('INSERT OR REPLACE INTO ' + MAPPING_STATS_TABLE + ' '
                     '(mapped_table, from_id, to_id, total_ids, '
                     ' matched_ids, unmatched_ids, total_rows, '
                     ' matched_rows, unmatched_rows) VALUES '
                     '(?,?,?,?,?,?,?,?,?)',
-                    [from_table, from_id, to_id, num_from_ids,
+                    [from_table.split('.')[-1], from_id, to_id, num_from_ids,
                      num_from_ids - num_unmatched_ids, num_unmatched_ids,
                      nrows_from, nrows_to, nrows_unmatched])
 
-        # clean up somewhat
-        cur.execute('DROP TABLE ' + from_table + '_orig_ids')
-
     # close cursor and commit to server
     cur.close()
     sql_conn.commit()
 
 
+def _mapping_stats_sql(from_table, from_cols, mapping_table, from_id,
+                       to_table, sql_conn):
+    """
+    Creates the tables of the unmatched ids and rows of the mapping of
+    `from_table` to `to_table` via SQL queries and returns the mapping
+    statistics (see `map_rows_in_memory()`).
+    """
+    cur = sql_conn.cursor()
+
+    # get all from_ids from all used columns
+    union_of_ids = " UNION ".join('SELECT ' + c + ' AS id FROM '
+                                  + from_table
+                                  for c in from_cols)
+    sqlquery = ('SELECT DISTINCT id FROM (' + union_of_ids + ')')
+    sql.new_table_from_query(from_table + '_orig_ids', sqlquery, sql_conn)
+
+    # create table of non-matched ids
+    sqlquery = ('SELECT DISTINCT id FROM ' + from_table + '_orig_ids '
+                'WHERE id NOT IN ('
+                '   SELECT ' + from_id + ' FROM ' + mapping_table + ')')
+    sql.new_table_from_query(to_table + '_unmatched_ids', sqlquery,
+                             sql_conn)
+
+    # create table made of rows which did not map
+    where_or = ") OR (".join(c + ' IN (SELECT id FROM ' + to_table
+                             + '_unmatched_ids)' for c in from_cols)
+    where_cond = "(" + where_or + ")"
+    sqlquery = ('SELECT * FROM ' + from_table + ' '
+                'WHERE ' + where_cond)
+    sql.new_table_from_query(to_table + '_unmatched_rows', sqlquery,
+                             sql_conn)
+
+    # get statistics (number of matched and unmatched rows and ids)
+    cur.execute('SELECT COUNT(*) FROM ' + from_table)
+    nrows_from = cur.fetchone()[0]
+
+    cur.execute('SELECT COUNT(*) FROM ' + to_table)
+    nrows_to = cur.fetchone()[0]
+
+    cur.execute('SELECT COUNT(*) FROM ' + to_table + '_unmatched_rows')
+    nrows_unmatched = cur.fetchone()[0]
+
+    cur.execute('SELECT COUNT(*) FROM ' + from_table + '_orig_ids')
+    num_from_ids = cur.fetchone()[0]
+
+    cur.execute('SELECT COUNT(*) FROM ' + to_table + '_unmatched_ids')
+    num_unmatched_ids = cur.fetchone()[0]
+
+    # clean up somewhat
+    cur.execute('DROP TABLE ' + from_table + '_orig_ids')
+    cur.close()
+    return (num_from_ids, num_unmatched_ids, nrows_from, nrows_to,
+            nrows_unmatched)
+
+
+def _mapping_stats_counts(from_table, from_cols, mapping_table, from_id,
+                          to_table, sql_conn):
+    """
+    Counts the unmatched ids and rows of the mapping of `from_table` to
+    `to_table` in a single query, without creating any tables, and returns
+    the same statistics as `_mapping_stats_sql()`.
+    """
+    cur = sql_conn.cursor()
+    # the same sets as the tables of `_mapping_stats_sql()`, as common table
+    # expressions (which SQLite materializes, as they are used twice)
+    union_of_ids = " UNION ".join('SELECT ' + c + ' AS id FROM '
+                                  + from_table
+                                  for c in from_cols)
+    unmatched_or = " OR ".join(c + ' IN unmatched_ids' for c in from_cols)
+    cur.execute('WITH orig_ids AS (SELECT DISTINCT id '
+                '                  FROM (' + union_of_ids + ')), '
+                'unmatched_ids AS (SELECT id FROM orig_ids '
+                '                  WHERE id NOT IN ('
+                '                     SELECT ' + from_id + ' '
+                '                     FROM ' + mapping_table + ')) '
+                'SELECT (SELECT COUNT(*) FROM orig_ids), '
+                '       (SELECT COUNT(*) FROM unmatched_ids), '
+                '       (SELECT COUNT(*) FROM ' + to_table + '), '
+                '       COUNT(*), COALESCE(SUM(' + unmatched_or + '), 0) '
+                'FROM ' + from_table)
+    num_from_ids, num_unmatched_ids, nrows_to, nrows_from, \
+        nrows_unmatched = cur.fetchall()[0]
+    cur.close()
+    return (num_from_ids, num_unmatched_ids, nrows_from, nrows_to,
+            nrows_unmatched)
+
+
+def load_mapping_index(mapping_table, from_id, to_id, sql_conn):
+    """
+    Loads the mapping table into a dictionary, which maps each `from_id` to
+    the list of its `to_id`s (in the order of the mapping table).
+
+    @returns:   The tuple (index, has_null), where `has_null` is `True` if the
+                mapping table contains NULL `from_id`s. These can't be matched
+                and are not part of the index.
+    """
+    cur = sql_conn.cursor()
+    cur.execute('SELECT ' + from_id + ', ' + to_id + ' FROM ' + mapping_table)
+    index = {}
+    has_null = False
+    for key, value in cur:
+        if key is None:
+            has_null = True
+        elif key in index:
+            index[key].append(value)
+        else:
+            index[key] = [value]
+    cur.close()
+    return index, has_null
+
+
+def map_rows_in_memory(from_table, from_cols, mapping_table, from_id, to_id,
+                       from_id_type, to_table, sql_conn, verbose=False,
+                       unmatched_tables=True):
+    """
+    Maps the columns `from_cols` of all rows of `from_table` with an
+    in-memory index of the mapping table (see `load_mapping_index()`) and
+    inserts the mapped rows into the (existing) table `to_table`.
+    The result is the same as for the INNER JOINs with the mapping table:
+    rows with an unmatched (or NULL) identifier are dropped, rows with an
+    identifier matching several `to_id`s are repeated.
+
+    The source table is streamed once in batches of
+    `sql.BULK_LOAD_BATCH_SIZE` rows, and the statistics are collected while
+    mapping the rows. In verbose mode, the tables `to_table`_unmatched_ids and
+    `to_table`_unmatched_rows are created as well, unless `unmatched_tables`
+    is `False`.
+
+    @param from_id_type:    The SQL type the identifiers are CAST to before
+                            looking them up (the type of the `from_id` of the
+                            mapping table). If `None`, the identifiers are
+                            not mapped, only rows with all ids contained in the
+                            mapping table are copied.
+    @returns:   The tuple (num_from_ids, num_unmatched_ids, nrows_from,
+                nrows_to, nrows_unmatched) if `verbose` is set, else `None`.
+    """
+    if from_id_type is None:
+        index, has_null = load_mapping_index(mapping_table, from_id, from_id,
+                                             sql_conn)
+    else:
+        index, has_null = load_mapping_index(mapping_table, from_id, to_id,
+                                             sql_conn)
+
+    col_names = sql.get_column_names(from_table, sql_conn)
+    num_cols = len(col_names)
+    positions = [i for i, c in enumerate(col_names) if c in from_cols]
+    # select the (casted) lookup keys after all columns of the source table
+    if from_id_type is None:
+        keys = positions
+        query = 'SELECT * FROM ' + from_table
+    else:
+        keys = list(range(num_cols, num_cols + len(positions)))
+        query = ('SELECT *, '
+                 + ", ".join('CAST(' + col_names[p] + ' AS ' + from_id_type
+                             + ')' for p in positions) + ' '
+                 'FROM ' + from_table)
+
+    # identifiers with several `to_id`s (the rows are repeated for these),
+    # all others are looked up directly
+    multi = dict((k, v) for k, v in index.items() if len(v) > 1)
+    index = dict((k, v[0]) for k, v in index.items())
+
+    nrows_from = 0
+    orig_ids = set()
+    unmatched_ids = set()
+    unmatched_rows = []
+
+    def map_batch(rows):
+        # maps a batch of source rows column by column
+        columns = list(zip(*rows))
+        out_cols = columns[:num_cols]
+        matched = None
+        for p, k in zip(positions, keys):
+            # `index` is the marker for unmatched ids
+            out_cols[p] = list(map(index.get, columns[k],
+                                   itertools.repeat(index)))
+            found = list(map(operator.is_not, out_cols[p],
+                             itertools.repeat(index)))
+            if verbose:
+                orig_ids.update(columns[p])
+                unmatched_ids.update(itertools.compress(
+                    columns[p], map(operator.not_, found)))
+            if matched is None:
+                matched = found
+            else:
+                matched = list(map(operator.and_, matched, found))
+        if verbose and not has_null:
+            unmatched_rows.extend(
+                row[:num_cols] for row in
+                itertools.compress(rows, map(operator.not_, matched))
+                if any(row[k] is not None and row[k] not in index
+                       for k in keys))
+
+        mapped_rows = itertools.compress(zip(*out_cols), matched)
+        if multi:
+            expand = [False] * len(rows)
+            for k in keys:
+                expand = list(map(operator.or_, expand,
+                                  map(multi.__contains__, columns[k])))
+            if any(expand):
+                mapped_rows = _expand_rows(mapped_rows,
+                                           itertools.compress(rows, matched),
+                                           itertools.compress(expand,
+                                                              matched),
+                                           positions, keys, multi)
+        return mapped_rows
+
+    def mapped_rows():
+        # streams through the source table in batches
+        nonlocal nrows_from
+        cur = sql_conn.cursor()
+        cur.execute(query)
+        while True:
+            rows = cur.fetchmany(sql.BULK_LOAD_BATCH_SIZE)
+            if not rows:
+                break
+            nrows_from += len(rows)
+            yield from map_batch(rows)
+        cur.close()
+
+    nrows_to = sql.insert_rows(to_table, mapped_rows(), num_cols, sql_conn)
+    sql_conn.commit()
+
+    if not verbose:
+        return None
+
+    # as `id NOT IN (...)`: NULL ids and ids compared to a NULL in the
+    # mapping table are not unmatched
+    unmatched_ids.discard(None)
+    if has_null:
+        unmatched_ids.clear()
+    if not unmatched_tables:
+        return (len(orig_ids), len(unmatched_ids), nrows_from, nrows_to,
+                len(unmatched_rows))
+    # the ids of all mapped columns (as the UNION of the columns), with the
+    # same column type as the first one
+    sql.new_table_from_query(to_table + '_unmatched_ids',
+                             'SELECT ' + from_cols[0] + ' AS id '
+                             'FROM ' + from_table + ' LIMIT 0', sql_conn)
+    sql.insert_rows(to_table + '_unmatched_ids',
+                    ((i,) for i in unmatched_ids), 1, sql_conn)
+    sql.new_table_from_query(to_table + '_unmatched_rows',
+                             'SELECT * FROM ' + from_table + ' LIMIT 0',
+                             sql_conn)
+    sql.insert_rows(to_table + '_unmatched_rows', unmatched_rows, num_cols,
+                    sql_conn)
+    sql_conn.commit()
+    return (len(orig_ids), len(unmatched_ids), nrows_from, nrows_to,
+            len(unmatched_rows))
+
+
+def _expand_rows(mapped_rows, src_rows, expand, positions, keys, multi):
+    """
+    Repeats the mapped rows for all `to_id`s of their ambiguous identifiers
+    (in the order of the nested loops of the INNER JOINs).
+    """
+    for row, src_row, exp in zip(mapped_rows, src_rows, expand):
+        if not exp:
+            yield row
+            continue
+        matches = [multi.get(src_row[k], [row[p]])
+                   for p, k in zip(positions, keys)]
+        out = list(row)
+        for values in itertools.product(*matches):
+            for p, v in zip(positions, values):
+                out[p] = v
+            yield tuple(out)
+
+
+def create_mapping_table_index(from_id, to_id, sql_conn):
+    """
+    Creates the index on the `from_id` column of the mapping table
+    `from_id`_2_`to_id` (in case it does not yet exist).
+    """
+    mapping_table = from_id + '_2_' + to_id
+    index_name = mapping_table + '_' + from_id + '_index'
+    # the index may already exist in an attached (read only) database
+    if not sql.index_exists(index_name, sql_conn):
+        cur = sql_conn.cursor()
+        cur.execute('CREATE INDEX ' + index_name + ' ON ' + mapping_table
+                    + '(' + from_id + ')')
+        cur.close()
+        sql_conn.commit()
+
+
 def create_all_id_table(id_type, sql_conn, verbose=False):
     """
     Creates the the table `id_type`_all_ids (i.e. hgnc_all_ids) containing
@@ -388,12 +713,427 @@ def create_all_id_table(id_type, sql_conn, verbose=False):
     sql.new_table_from_query(table_name, sqlquery, sql_conn)
 
 
+def default_mapping_tables(from_id, to_id):
+    """
+    Returns the mapping tables used for mapping `from_id` -> `to_id`, in the
+    order of their precedence.
+    """
+    # if either `to` or `from` is HGNC, then use HGNC as primary table
+    # TODO global table management !?
+    if to_id == COL_ENSP_ID or from_id == COL_ENSP_ID:
+        # in case ENSP (ensembl protein ids) are used -> only use biomart
+        # TODO until a proper table mapping is implemented
+        return [BIOMART_MAPPING_TABLE_NAME]
+    elif to_id == COL_HGNC_SYMB or from_id == COL_HGNC_SYMB:
+        return [HGNC_MAPPING_TABLE_NAME, BIOMART_MAPPING_TABLE_NAME]
+    else:
+        return [BIOMART_MAPPING_TABLE_NAME, HGNC_MAPPING_TABLE_NAME]
+
+
+def create_id_catalog(sql_conn, verbose=False):
+    """
+    Creates the identifier catalog from the mapping tables
+    `ID_CATALOG_SOURCES`.
+
+    The table `ID_CATALOG_TABLE` holds every identifier of the types
+    `MAPPED_IDS` once, with an integer key (id_key), its type and a bit mask
+    of the mapping tables containing it (bit i for the i-th source table).
+    The table `ID_CATALOG_MAP_TABLE` holds all candidate matches of every
+    identifier to every other type (from_key, to_type, to_key), with the
+    precedence of the first mapping table containing the match (see
+    `default_mapping_tables()`), the number of mapping tables supporting it
+    and a bit mask of the resolutions (see `AmbiguityResolver`) which keep the
+    match (bit i for the i-th of `RESOLUTIONS`). The table
+    `ID_CATALOG_AMBIGUITIES_TABLE` holds the number of candidates of all
+    ambiguous identifiers for each resolution.
+
+    The mapping tables are read only once, afterwards any `from_id`_2_`to_id`
+    mapping table is created with a single indexed join of the catalog, for
+    any of the resolutions.
+    """
+    if verbose:
+        print("Creating identifier catalog from: "
+              + ", ".join(ID_CATALOG_SOURCES))
+
+    # (id_type, id) -> [id_key, sources]
+    ids = {}
+    # (from_key, to_type) -> {to_key -> [precedence, sources]}
+    candidates = {}
+    cur = sql_conn.cursor()
+    for source_idx, table in enumerate(ID_CATALOG_SOURCES):
+        source_cols = sql.get_column_names(table, sql_conn)
+        cols = [c for c in MAPPED_IDS if c in source_cols]
+        # all pairs of columns which are mapped via this table, with the
+        # precedence of this table for the mapping
+        pairs = []
+        for i, from_id in enumerate(cols):
+            for j, to_id in enumerate(cols):
+                tables = default_mapping_tables(from_id, to_id)
+                if i != j and table in tables:
+                    pairs.append((i, j, to_id, tables.index(table)))
+
+        cur.execute('SELECT ' + ", ".join(cols) + ' FROM ' + table)
+        for row in cur:
+            keys = [None] * len(cols)
+            for i, col in enumerate(cols):
+                value = row[i]
+                # empty identifiers are never matched
+                if value is None or value == "":
+                    continue
+                entry = ids.get((col, value))
+                if entry is None:
+                    entry = [len(ids) + 1, 0]
+                    ids[(col, value)] = entry
+                entry[1] |= 1 << source_idx
+                keys[i] = entry[0]
+            for i, j, to_id, precedence in pairs:
+                if keys[i] is None or keys[j] is None:
+                    continue
+                group = candidates.get((keys[i], to_id))
+                if group is None:
+                    candidates[(keys[i], to_id)] = \
+                        {keys[j]: [precedence, 1 << source_idx]}
+                elif keys[j] not in group:
+                    group[keys[j]] = [precedence, 1 << source_idx]
+                else:
+                    candidate = group[keys[j]]
+                    candidate[0] = min(candidate[0], precedence)
+                    candidate[1] |= 1 << source_idx
+
+    # resolve the candidates of each (from_key, to_type) for all resolutions
+    values = dict((key, value) for (id_type, value), (key, sources)
+                  in ids.items())
+    resolvers = [AmbiguityResolver(r) for r in RESOLUTIONS]
+    all_resolutions = (1 << len(RESOLUTIONS)) - 1
+    map_rows = []
+    ambiguities = []
+    for from_key, to_id in sorted(candidates):
+        group = candidates[(from_key, to_id)]
+        if len(group) == 1:
+            # unambiguous, kept by all resolutions
+            for to_key, (precedence, sources) in group.items():
+                map_rows.append((from_key, to_id, to_key, precedence,
+                                 bin(sources).count('1'), all_resolutions))
+            continue
+        # (to_id, precedence, support, to_key) ordered by to_id
+        rows = sorted((values[to_key], c[0], bin(c[1]).count('1'), to_key)
+                      for to_key, c in group.items())
+        resolved = dict((row[3], 0) for row in rows)
+        for i, resolver in enumerate(resolvers):
+            considered, kept = resolver.resolve_group(rows)
+            for row in kept:
+                resolved[row[3]] |= 1 << i
+            if len(considered) > 1:
+                ambiguities.append((to_id, resolver.resolution, from_key,
+                                    len(considered), len(kept)))
+        map_rows.extend((from_key, to_id, row[3], row[1], row[2],
+                         resolved[row[3]]) for row in rows)
+
+    # create the (dictionary encoded) catalog tables
+    for table in [ID_CATALOG_TABLE, ID_CATALOG_MAP_TABLE,
+                  ID_CATALOG_AMBIGUITIES_TABLE]:
+        cur.execute('DROP TABLE IF EXISTS ' + sql.main_schema(table))
+    cur.execute('CREATE TABLE ' + ID_CATALOG_TABLE + ' '
+                '(id_key INTEGER PRIMARY KEY, id_type varchar(16), '
+                ' id varchar(32), sources int)')
+    cur.execute('CREATE TABLE ' + ID_CATALOG_MAP_TABLE + ' '
+                '(from_key int, to_type varchar(16), to_key int, '
+                ' precedence int, support int, resolved int, '
+                ' PRIMARY KEY (from_key, to_type, to_key)) WITHOUT ROWID')
+    cur.execute('CREATE TABLE ' + ID_CATALOG_AMBIGUITIES_TABLE + ' '
+                '(to_type varchar(16), resolution varchar(16), from_key int, '
+                ' candidates int, resolved int, '
+                ' PRIMARY KEY (to_type, resolution, from_key)) WITHOUT ROWID')
+    cur.close()
+    sql.insert_rows(ID_CATALOG_TABLE,
+                    ((key, id_type, value, sources)
+                     for (id_type, value), (key, sources) in ids.items()),
+                    4, sql_conn)
+    sql.insert_rows(ID_CATALOG_MAP_TABLE, map_rows, 6, sql_conn)
+    sql.insert_rows(ID_CATALOG_AMBIGUITIES_TABLE, sorted(ambiguities), 5,
+                    sql_conn)
+    cur = sql_conn.cursor()
+    cur.execute('CREATE UNIQUE INDEX ' + ID_CATALOG_TABLE + '_id_index '
+                'ON ' + ID_CATALOG_TABLE + '(id_type, id)')
+    cur.close()
+    sql_conn.commit()
+
+    if verbose:
+        print("    Cataloged " + str(len(ids)) + " identifiers with "
+              + str(len(map_rows)) + " candidate matches")
+
+    create_gene_dict(sql_conn)
+
+
+def create_gene_dict(sql_conn, id_type=None):
+    """
+    Creates the gene dictionary `GENE_DICT_TABLE` (id, Gene) from the
+    identifier catalog: all identifiers of the type `id_type` (default:
+    `UNIFYING_ID`) with their catalog key as integer id.
+    """
+    if id_type is None:
+        id_type = UNIFYING_ID
+    cur = sql_conn.cursor()
+    cur.execute('DROP TABLE IF EXISTS ' + sql.main_schema(GENE_DICT_TABLE))
+    cur.execute('CREATE TABLE ' + GENE_DICT_TABLE + ' '
+                '(id INTEGER PRIMARY KEY, Gene varchar(16))')
+    cur.execute('INSERT INTO ' + GENE_DICT_TABLE + ' (id, Gene) '
+                'SELECT id_key, id FROM ' + ID_CATALOG_TABLE + ' '
+                'WHERE id_type = ? ORDER BY id_key', [id_type])
+    cur.execute('CREATE UNIQUE INDEX ' + GENE_DICT_TABLE + '_gene_index '
+                'ON ' + GENE_DICT_TABLE + ' (Gene)')
+    cur.close()
+    sql_conn.commit()
+
+
+class AmbiguityResolver:
+    """
+    Resolves the ambiguous matches of identifiers, i.e. a `from_id` matching
+    several `to_id`s, with one of the following resolutions:
+
+    `RESOLVE_MIN`:      Of the matches of the first mapping table (by
+                        precedence) containing the `from_id`, the MIN()
+                        `to_id` is used.
+    `RESOLVE_SUPPORT`:  The match supported by the most mapping tables is
+                        used, ties are resolved as by `RESOLVE_MIN`.
+    `RESOLVE_ALL`:      All matches of the first mapping table containing the
+                        `from_id` are kept, each with the weight 1/#matches
+                        (the fan-out of the `from_id`).
+
+    While resolving, the number of candidates of all ambiguous `from_id`s and
+    the `to_id`s which are matched or have been dropped are collected.
+    """
+
+    def __init__(self, resolution=None):
+        if resolution is None:
+            resolution = AMBIGUITY_RESOLUTION
+        if resolution not in RESOLUTIONS:
+            raise ValueError("Unsupported ambiguity resolution: '"
+                             + str(resolution) + "'")
+        self.resolution = resolution
+        # (from_id, #candidates, #resolved) of all ambiguous from_ids
+        self.ambiguities = []
+        self.matched_ids = set()
+        self.dropped_ids = set()
+
+    def resolve_group(self, rows):
+        """
+        Resolves the candidate matches of a single `from_id`.
+
+        @param rows:    The candidate (to_id, precedence, support, ...) rows,
+                        ordered by to_id.
+        @returns:       The tuple (considered, resolved) of the candidates
+                        considered by the resolution and the resolved ones.
+        """
+        if len(rows) == 1:
+            return rows, rows
+        if self.resolution == RESOLVE_SUPPORT:
+            # the first match with the maximum support (and the minimum
+            # precedence for equal support)
+            return rows, [max(rows, key=lambda r: (r[2], -r[1]))]
+        first = min(r[1] for r in rows)
+        considered = [r for r in rows if r[1] == first]
+        if self.resolution == RESOLVE_ALL:
+            return considered, considered
+        return considered, considered[:1]
+
+    def resolve(self, candidates):
+        """
+        Resolves the given candidate matches in a single pass.
+
+        @param candidates:  An iterable of (from_id, to_id, precedence,
+                            support) rows, ordered by (from_id, to_id).
+        @returns:           A generator of the resolved (from_id, to_id) rows,
+                            or (from_id, to_id, weight) rows for
+                            `RESOLVE_ALL`.
+        """
+        for from_id, rows in itertools.groupby(candidates,
+                                               operator.itemgetter(0)):
+            considered, resolved = self.resolve_group([r[1:] for r in rows])
+            if len(considered) > 1:
+                self.ambiguities.append((from_id, len(considered),
+                                         len(resolved)))
+                self.dropped_ids.update(r[0] for r in considered
+                                        if r not in resolved)
+            for r in resolved:
+                self.matched_ids.add(r[0])
+                if self.resolution == RESOLVE_ALL:
+                    yield (from_id, r[0], 1.0 / len(resolved))
+                else:
+                    yield (from_id, r[0])
+
+    def num_unmatched_by_resolution(self):
+        """
+        Returns the number of `to_id`s which are not matched, because their
+        matches have been dropped by the resolution of ambiguities.
+        """
+        return len(self.dropped_ids - self.matched_ids)
+
+
+def _mapping_table_schemas(table_name, from_id, to_id, schema_table,
+                           resolution):
+    """
+    Returns the (table, query) pairs for creating the (empty) mapping table
+    `table_name` and the table of its ambiguities `table_name`_ambiguities
+    (from_id, candidates, resolved), with the column types of the
+    `schema_table`.
+    """
+    # the `to_id` column has no type (as for the `MIN(to_id)` aggregate the
+    # mapping tables have always been created with)
+    schema_query = ('SELECT ' + from_id + ', MIN(' + to_id + ') AS ' + to_id)
+    if resolution == RESOLVE_ALL:
+        schema_query += ', 1.0 AS weight'
+    return [(table_name, schema_query + ' FROM ' + schema_table
+             + ' LIMIT 0'),
+            (table_name + '_ambiguities', 'SELECT ' + from_id + ', '
+             'CAST(0 AS int) AS candidates, CAST(0 AS int) AS resolved '
+             'FROM ' + schema_table + ' LIMIT 0')]
+
+
+def create_mapping_table_from_catalog(from_id, to_id, sql_conn,
+                                      verbose=False, resolution=None):
+    """
+    Creates the table `from_id`_2_`to_id` (see `create_mapping_table()`) from
+    the identifier catalog (see `create_id_catalog()`).
+    """
+    if resolution is None:
+        resolution = AMBIGUITY_RESOLUTION
+    if resolution not in RESOLUTIONS:
+        raise ValueError("Unsupported ambiguity resolution: '"
+                         + str(resolution) + "'")
+    table_name = from_id + "_2_" + to_id
+    tables = default_mapping_tables(from_id, to_id)
+    resolved_bit = str(1 << RESOLUTIONS.index(resolution))
+
+    if verbose:
+        print("Creating mapping table for " + from_id + " -> " + to_id
+              + " from the identifier catalog:")
+
+    for table, schema_query in _mapping_table_schemas(table_name, from_id,
+                                                      to_id, tables[0],
+                                                      resolution):
+        sql.new_table_from_query(table, schema_query, sql_conn)
+
+    # the resolved matches of all `from_id`s, joined via the index of the
+    # catalog
+    ambiguities = (ID_CATALOG_AMBIGUITIES_TABLE + ' AS a '
+                   'ON a.to_type = \'' + to_id + '\' '
+                   'AND a.resolution = \'' + resolution + '\' '
+                   'AND a.from_key = f.id_key ')
+    result_fields = 'f.id, t.id'
+    if resolution == RESOLVE_ALL:
+        # the weights: 1/fan-out of the `from_id`
+        result_fields += ', 1.0 / COALESCE(a.resolved, 1)'
+    cur = sql_conn.cursor()
+    cur.execute('INSERT INTO ' + table_name + ' '
+                'SELECT ' + result_fields + ' '
+                'FROM ' + ID_CATALOG_TABLE + ' AS f '
+                'INNER JOIN ' + ID_CATALOG_MAP_TABLE + ' AS m '
+                'ON m.from_key = f.id_key AND m.to_type = \'' + to_id + '\' '
+                'INNER JOIN ' + ID_CATALOG_TABLE + ' AS t '
+                'ON t.id_key = m.to_key '
+                'LEFT JOIN ' + ambiguities + ' '
+                'WHERE f.id_type = \'' + from_id + '\' '
+                'AND m.resolved & ' + resolved_bit + ' '
+                'ORDER BY f.id, t.id')
+    cur.execute('INSERT INTO ' + table_name + '_ambiguities '
+                'SELECT f.id, a.candidates, a.resolved '
+                'FROM ' + ID_CATALOG_TABLE + ' AS f '
+                'INNER JOIN ' + ambiguities + ' '
+                'WHERE f.id_type = \'' + from_id + '\' '
+                'ORDER BY f.id')
+    sql_conn.commit()
+
+    # get statistic for #matched/#unique-ids
+    if verbose:
+        cur.execute('SELECT COUNT(*) FROM ' + table_name + '_ambiguities')
+        num_ambiguities = cur.fetchone()[0]
+        _print_resolution_stats(num_ambiguities, resolution)
+
+        # the ids of the mapping tables used for this mapping
+        sources = sum(1 << ID_CATALOG_SOURCES.index(t) for t in tables)
+        for i in [from_id, to_id]:
+            sql.new_table_from_query(i + '_all_ids', 'SELECT ' + i + ' '
+                                     'FROM ' + tables[0] + ' LIMIT 0',
+                                     sql_conn)
+            cur.execute('INSERT INTO ' + i + '_all_ids '
+                        'SELECT id FROM ' + ID_CATALOG_TABLE + ' '
+                        'WHERE id_type = \'' + i + '\' '
+                        'AND sources & ' + str(sources))
+
+            # create table of unmatched identifiers
+            new_table = table_name + '_unmatched_' + i
+            sqlquery = ('SELECT * FROM ' + i + '_all_ids '
+                        'WHERE ' + i + ' NOT IN '
+                        '( SELECT ' + i + ' FROM ' + table_name + ')')
+            sql.new_table_from_query(new_table, sqlquery, sql_conn)
+
+            # get count of all
+            cur.execute('SELECT COUNT() FROM ' + i + '_all_ids')
+            count_from_all = cur.fetchone()[0]
+
+            # get count of non-matched
+            cur.execute('SELECT COUNT() FROM ' + new_table)
+            count_from_unmatched = cur.fetchone()[0]
+
+            print("    " + i + " identifiers matched:")
+            print("        Matched identifiers: "
+                  + str(count_from_all - count_from_unmatched) + "/"
+                  + str(count_from_all))
+            print("        Unmatched identfiers: "
+                  + str(count_from_unmatched))
+            if i == to_id:
+                # unmatched ids of the candidates considered by the
+                # resolution (all of the first mapping table containing
+                # the `from_id`, as kept by `RESOLVE_ALL`)
+                considered = ''
+                if resolution != RESOLVE_SUPPORT:
+                    considered = ('AND m.resolved & '
+                                  + str(1 << RESOLUTIONS.index(RESOLVE_ALL))
+                                  + ' ')
+                cur.execute('SELECT COUNT(DISTINCT t.id) '
+                            'FROM ' + ID_CATALOG_TABLE + ' AS f '
+                            'INNER JOIN ' + ID_CATALOG_MAP_TABLE + ' AS m '
+                            'ON m.from_key = f.id_key '
+                            'AND m.to_type = \'' + to_id + '\' '
+                            + considered +
+                            'INNER JOIN ' + ID_CATALOG_TABLE + ' AS t '
+                            'ON t.id_key = m.to_key '
+                            'WHERE f.id_type = \'' + from_id + '\' '
+                            'AND t.id IN (SELECT ' + to_id + ' '
+                            'FROM ' + new_table + ')')
+                print("            because of removal of duplicates: "
+                      + str(cur.fetchone()[0]) + "/"
+                      + str(count_from_unmatched))
+            print("        Unmatched identifiers are now saved in the `"
+                  + new_table + "` SQL table.")
+
+    # close cursor and commit changes to SQL server
+    cur.close()
+    sql_conn.commit()
+
+
+def _print_resolution_stats(num_ambiguities, resolution):
+    if num_ambiguities > 0:
+        print("    Resolved " + str(num_ambiguities)
+              + " ambiguous identifiers (" + resolution + ")")
+
+
 def create_mapping_table(from_id, to_id, sql_conn, verbose=False,
-                         mapping_tables=None):
+                         mapping_tables=None, resolution=None):
     """
     Creates the table `from_id`_2_`to_id` as an Identifier mapping table.
     Each unique identifier on the `from_id` side maps only to one identifier
-    on the `to_id` side.
+    on the `to_id` side (unless the resolution `RESOLVE_ALL` is used, see
+    `AmbiguityResolver`). The number of candidates of all ambiguous
+    identifiers are saved in the table `from_id`_2_`to_id`_ambiguities.
+
+    If no `mapping_tables` are given and the identifier catalog exists (see
+    `create_id_catalog()`), the table is created from the catalog.
+
+    @param resolution:  The resolution of ambiguous matches (`RESOLVE_MIN`,
+                        `RESOLVE_SUPPORT` or `RESOLVE_ALL`).
+                        Default: `AMBIGUITY_RESOLUTION`
     """
     # check parameters, both IDs must be in the supported field IDs
     if not from_id in MAPPED_IDS and not to_id in MAPPED_IDS:
@@ -402,69 +1142,54 @@ def create_mapping_table(from_id, to_id, sql_conn, verbose=False,
     # name for the result table:
     table_name = from_id + "_2_" + to_id
 
-    if verbose:
-        print("Creating mapping table for " + from_id + " -> " + to_id + ":")
-
-    # if either `to` or `from` is HGNC, then use HGNC as primary table
-    # TODO global table management !?
     if mapping_tables is None:
-        if to_id == COL_ENSP_ID or from_id == COL_ENSP_ID:
-            # in case ENSP (ensembl protein ids) are used -> only use biomart
-            # TODO until a proper table mapping is implemented
-            tables = ["biomart"]
-        elif to_id == COL_HGNC_SYMB or from_id == COL_HGNC_SYMB:
-            tables = ["hgnc", "biomart"]
-        else:
-            tables = ["biomart", "hgnc"]
+        # the mapping can be looked up in the identifier catalog
+        if (from_id in MAPPED_IDS and to_id in MAPPED_IDS
+                and from_id != to_id
+                and sql.table_exists(ID_CATALOG_MAP_TABLE, sql_conn)):
+            create_mapping_table_from_catalog(from_id, to_id, sql_conn,
+                                              verbose, resolution)
+            return
+        tables = default_mapping_tables(from_id, to_id)
     else:
         tables = mapping_tables
     # TODO maybe check if the tables even exists and quit with an error if not
 
-    table1 = tables[0]
-
-    cur = sql_conn.cursor()
-
     if verbose:
-        print("    Creating pairwise table from: " + table1)
-
-    # create first simple pairwise mapping table
-    sqlquery = ('SELECT ' + from_id + ', ' + to_id + ' '
-                'FROM ' + table1 + ' '
-                'WHERE ' + from_id + '!="" AND ' + to_id + '!=""')
-    sql.new_table_from_query(table_name + '_pairwise', sqlquery, sql_conn)
-
-    # insert pairwise matchings for those identifiers
-    # in the other mapping tables, that have not yet been matched
-    for table in tables[1:]:
-
-        if verbose:
-            print("    Inserting matchings from " + table)
-
-        # create table of identifiers already matched
-        cur.execute('CREATE TABLE ' + table_name + '_fromids AS '
-                    'SELECT DISTINCT ' + from_id + ' '
-                    'FROM ' + table_name + '_pairwise')
-        # insert pairwise matching for identifers that have
-        # not been matched before
-        cur.execute('INSERT INTO ' + table_name + '_pairwise '
-                    'SELECT ' + from_id + ', ' + to_id + ' '
-                    'FROM ' + table + ' '
-                    'WHERE ' + from_id + ' != "" AND ' + to_id + ' != "" '
-                    'AND ' + from_id + ' NOT IN '
-                    '(SELECT * FROM ' + table_name + '_fromids)')
-        cur.execute('DROP TABLE ' + table_name + '_fromids')
-
-    # remove duplicates
-    # - this is done somewhat naively (choosing the identifier with MIN)
-    # TODO how else can ambiguities be resolved?
-    # TODO how does this change/influence the PPIs for example?
+        print("Creating mapping table for " + from_id + " -> " + to_id + ":")
+        print("    Collecting matches from: " + ", ".join(tables))
+
+    # all distinct matches of all mapping tables, with the precedence of the
+    # first table containing them and the number of tables supporting them
+    candidates = " UNION ALL ".join('SELECT ' + from_id + ', '
+                                    + to_id + ', ' + str(i) + ' AS prec '
+                                    'FROM ' + table + ' '
+                                    'WHERE ' + from_id + ' != "" '
+                                    'AND ' + to_id + ' != ""'
+                                    for i, table in enumerate(tables))
+    sqlquery = ('SELECT ' + from_id + ', ' + to_id + ', MIN(prec), '
+                'COUNT(DISTINCT prec) FROM (' + candidates + ') '
+                'GROUP BY ' + from_id + ', ' + to_id + ' '
+                'ORDER BY ' + from_id + ', ' + to_id)
+
+    # resolve the ambiguities in a single pass over the matches
     if verbose:
         print("    Removing duplicate and ambiguous matchings")
-
-    sqlquery = ('SELECT MIN(' + to_id + ') AS ' + to_id + ', ' + from_id + ' '
-                'FROM ' + table_name + '_pairwise '
-                'GROUP BY ' + from_id)
-    sql.new_table_from_query(table_name + '_single', sqlquery, sql_conn)
+    resolver = AmbiguityResolver(resolution)
+    for table, schema_query in _mapping_table_schemas(table_name, from_id,
+                                                      to_id, tables[0],
+                                                      resolver.resolution):
+        sql.new_table_from_query(table, schema_query, sql_conn)
+    cur = sql_conn.cursor()
+    cur.execute(sqlquery)
+    num_cols = 3 if resolver.resolution == RESOLVE_ALL else 2
+    sql.insert_rows(table_name, resolver.resolve(cur), num_cols, sql_conn)
+    sql.insert_rows(table_name + '_ambiguities', resolver.ambiguities, 3,
+                    sql_conn)
+    sql_conn.commit()
+    if verbose:
+        _print_resolution_stats(len(resolver.ambiguities),
+                                resolver.resolution)
 
     # get statistic for #matched/#unique-ids
     if verbose:
@@ -473,7 +1198,7 @@ def create_mapping_table(from_id, to_id, sql_conn, verbose=False,
             # create table of identifiers already matched
             cur.execute('CREATE TABLE ' + table_name + '_' + i + ' AS '
                         'SELECT DISTINCT ' + i + ' '
-                        'FROM ' + table_name + '_single')
+                        'FROM ' + table_name)
 
             # get all distinct identifier from all tables
             union_of_ids = " UNION ".join('SELECT ' + i + ' FROM ' + t
@@ -501,13 +1226,7 @@ def create_mapping_table(from_id, to_id, sql_conn, verbose=False,
             # get count of non-matched because of removal of replicates
             unmatched_by_rm_dupl = -1
             if i == to_id:
-                cur.execute('SELECT COUNT() FROM ('
-                            'SELECT DISTINCT ' + i + ' '
-                            'FROM ' + table_name + '_pairwise '
-                            'WHERE ' + i + ' NOT IN ('
-                            'SELECT DISTINCT ' + i + ' '
-                            'FROM ' + table_name + '_single))')
-                unmatched_by_rm_dupl = cur.fetchone()[0]
+                unmatched_by_rm_dupl = resolver.num_unmatched_by_resolution()
 
             cur.execute('DROP TABLE ' + table_name + '_' + i)
 
@@ -523,12 +1242,6 @@ def create_mapping_table(from_id, to_id, sql_conn, verbose=False,
             print("        Unmatched identifiers are now saved in the `"
                   + table_name + "_unmatched_" + i + "` SQL table.")
 
-    # create the real mapping table
-    sqlquery = ('SELECT ' + from_id + ', ' + to_id + ' '
-                'FROM ' + table_name + '_single '
-                'ORDER BY ' + from_id)
-    sql.new_table_from_query(table_name, sqlquery, sql_conn)
-
     # close cursor and commit changes to SQL server
     cur.close()
     sql_conn.commit()
@@ -1,6 +1,9 @@
 import itertools
 
+import numpy
+
 from . import sql
+from .ppis.ppi import create_all_ids_table, edge_table
 
 PPIS_TO_ANALYZE = ['bossi', 'ccsb', 'havu', 'string', 'psicquic_all']
 #PPIS_TO_ANALYZE = ['psicquic_dip', 'psicquic_i2d_imex',
@@ -9,6 +12,11 @@ PPIS_TO_ANALYZE = ['bossi', 'ccsb', 'havu', 'string', 'psicquic_all']
 #                   'psicquic_molcon', 'psicquic_mpidb', 'psicquic_uniprot']
 EXPRS_TO_ANALYZE = ['emtab', 'gene_atlas', 'hpa', 'hpa_all', 'rnaseq_atlas']
 
+# Whether the Venn-diagram overlaps (`calc_ppi_edge_overlap()`,
+# `calc_ppi_id_overlap()` and `calc_expr_overlap()`) are computed from
+# NumPy bitmasks (see `save_venn_overlap()`) instead of SQL GROUP BYs
+BITMASK_OVERLAP = False
+
 
 # TODO put these two next functions (create all ids) to the outside
 def create_ppi_all_ids_table(ppi, sql_conn):
@@ -16,14 +24,7 @@ def create_ppi_all_ids_table(ppi, sql_conn):
     Creates a table named `ppi`_ids that holds all the distinct IDs used
     in the ppi network.
     """
-    cur = sql_conn.cursor()
-    cur.execute('CREATE TABLE IF NOT EXISTS `' + ppi + '_ids` '
-                '(id integer primary key autoincrement, Gene varchar(16))')
-    sqlquery = ('SELECT Gene1 as Gene FROM ' + ppi + ' UNION '
-                'SELECT Gene2 as Gene FROM ' + ppi)
-    cur.execute('INSERT INTO `' + ppi + '_ids` (Gene) ' + sqlquery)
-    cur.close()
-    sql_conn.commit()
+    create_all_ids_table(ppi, sql_conn)
 
 
 def create_expr_all_ids_table(expr, sql_conn):
@@ -49,11 +50,161 @@ def get_binary_fields(fields, src_field):
                      for p in fields)
 
 
-def calc_ppi_edge_overlap(sql_conn, ppis=PPIS_TO_ANALYZE):
+def encode_keys(values, codes):
+    """
+    Returns the integer codes of the given values (e.g. genes) as array. New
+    values are added to the dict `codes` (value -> code), so that the codes
+    are consistent between calls with the same dict.
+    """
+    for v in set(values):
+        codes.setdefault(v, len(codes))
+    return numpy.fromiter(map(codes.__getitem__, values), dtype=numpy.int64,
+                          count=len(values))
+
+
+def membership_matrix(key_sets):
+    """
+    Returns the boolean matrix (#distinct keys x #data sets) of whether each
+    key is in each data set.
+
+    @param key_sets:    A list of integer arrays, the keys of each data set.
+    """
+    keys, inverse = numpy.unique(numpy.concatenate(key_sets),
+                                 return_inverse=True)
+    membership = numpy.zeros((len(keys), len(key_sets)), dtype=bool)
+    ends = numpy.cumsum([len(k) for k in key_sets])
+    for i, end in enumerate(ends):
+        membership[inverse[end - len(key_sets[i]):end], i] = True
+    return membership
+
+
+def venn_masks(key_sets):
+    """
+    Returns the bitmasks of the data set membership of all distinct keys.
+
+    @param key_sets:    A list of integer arrays, the keys of each data set.
+                        Bit i of the masks is set for the keys of data set i.
+    @returns:           The array of the masks (in the order of the keys).
+    """
+    if len(key_sets) > 64:
+        raise ValueError("At most 64 data sets are supported")
+    dtype = numpy.min_scalar_type((1 << len(key_sets)) - 1)
+    bits = numpy.arange(len(key_sets), dtype=dtype)
+    return (membership_matrix(key_sets).astype(dtype) << bits).sum(
+        axis=1, dtype=dtype)
+
+
+def save_venn_overlap(names, key_sets, table, sql_conn):
+    """
+    Saves the Venn-diagram data of the given data sets into the table
+    `table`, which has a column per data set (1 if the keys are in the data
+    set, 0 otherwise) and the `count` of the keys with each such pattern.
+    This equals grouping by the keys and then by the bit patterns in SQL,
+    but in a single `numpy.unique` of the bitmasks of the keys.
+
+    @param names:       The column names of the data sets.
+    @param key_sets:    A list of integer arrays, the keys of each data set.
+    """
+    patterns, counts = numpy.unique(venn_masks(key_sets), return_counts=True)
+    rows = sorted(tuple((int(m) >> i) & 1 for i in range(len(names)))
+                  + (int(c),) for m, c in zip(patterns, counts))
+    schema = ('SELECT ' + ', '.join('0 AS ' + n for n in names)
+              + ', 0 AS count LIMIT 0')
+    sql.new_table_from_query(table, schema, sql_conn)
+    sql.insert_rows(table, rows, len(names) + 1, sql_conn)
+    sql_conn.commit()
+
+
+def fetch_column(query, sql_conn):
+    """
+    Returns the values of the (single column) query as list.
+    """
+    cur = sql_conn.cursor()
+    cur.execute(query)
+    result = [row[0] for row in cur.fetchall()]
+    cur.close()
+    return result
+
+
+def encode_ppi_edges(ppis, codes, sql_conn):
+    """
+    Returns the integer encoded edges of the given PPIs, as list of the
+    arrays (Gene1, Gene2) of each PPI. The genes are encoded with the dict
+    `codes` (see `encode_keys()`). Duplicate edges are not removed.
+    """
+    result = []
+    for p in ppis:
+        cur = sql_conn.cursor()
+        cur.execute('SELECT Gene1, Gene2 FROM ' + p)
+        edges = cur.fetchall()
+        cur.close()
+        genes = [encode_keys(g, codes) for g in zip(*edges)]
+        if not genes:
+            genes = [numpy.zeros(0, dtype=numpy.int64)] * 2
+        result.append(genes)
+    return result
+
+
+def pairwise_overlaps(key_sets):
+    """
+    Returns the matrix of the sizes of the pairwise intersections of the
+    given data sets (the diagonal holds the sizes of the data sets), as the
+    matrix product of the membership matrix with itself.
+
+    @param key_sets:    A list of integer arrays, the keys of each data set.
+    """
+    membership = membership_matrix(key_sets).astype(numpy.int64)
+    return membership.T.dot(membership)
+
+
+def get_id_sets(tables, codes, sql_conn):
+    """
+    Returns the (integer encoded) distinct genes of the given PPIs or
+    expression data sets, without NULL. The genes are read from their
+    `<table>_ids` tables (see `create_ppi_all_ids_table()` and
+    `create_expr_all_ids_table()`), which have to exist.
+    """
+    return [encode_keys(fetch_column('SELECT DISTINCT Gene FROM ' + t
+                                     + '_ids WHERE Gene NOT NULL', sql_conn),
+                        codes)
+            for t in tables]
+
+
+def ppi_gene_sets(edge_sets, codes):
+    """
+    Returns the (integer encoded) distinct genes of each of the encoded PPIs
+    (see `encode_ppi_edges()`), without NULL.
+    """
+    result = []
+    for g1, g2 in edge_sets:
+        genes = numpy.unique(numpy.concatenate([g1, g2]))
+        result.append(genes[genes != codes.get(None, -1)])
+    return result
+
+
+def calc_ppi_edge_overlap(sql_conn, ppis=PPIS_TO_ANALYZE, bitmask=None):
     """
     Calculates the overlap of the edges of all combinations of PPIs
     in order to generate the data needed for a Venn-diagram.
+
+    @param bitmask:     Whether to compute the overlap from NumPy bitmasks
+                        (default: `BITMASK_OVERLAP`).
     """
+    if bitmask is None:
+        bitmask = BITMASK_OVERLAP
+    if bitmask:
+        codes = dict()
+        edge_sets = encode_ppi_edges(ppis, codes, sql_conn)
+        # encode each (directed) edge as a single integer, edges with a NULL
+        # gene are all the same (NULL) interaction
+        num_genes = len(codes)
+        null = codes.get(None, -1)
+        key_sets = [numpy.where((g1 == null) | (g2 == null), -1,
+                                g1 * num_genes + g2)
+                    for g1, g2 in edge_sets]
+        save_venn_overlap(ppis, key_sets, 'ppi_edge_overlap', sql_conn)
+        return
+
     union = ' UNION '.join('SELECT Gene1 || "-" || Gene2 as Interaction, '
                            + get_binary_fields(ppis, p) + ' '
                            'FROM ' + p for p in ppis)
@@ -71,11 +222,26 @@ def calc_ppi_edge_overlap(sql_conn, ppis=PPIS_TO_ANALYZE):
     sql.new_table_from_query('ppi_edge_overlap', sqlquery, sql_conn)
 
 
-def calc_ppi_id_overlap(sql_conn, ppis=PPIS_TO_ANALYZE):
+def calc_ppi_id_overlap(sql_conn, ppis=PPIS_TO_ANALYZE, bitmask=None):
     """
     Calculates the overlap of the gene identifiers of all combinations of PPIs
     in order to calculate the data needed for a Venn-diagram.
+
+    @param bitmask:     Whether to compute the overlap from NumPy bitmasks
+                        (default: `BITMASK_OVERLAP`).
     """
+    if bitmask is None:
+        bitmask = BITMASK_OVERLAP
+    if bitmask:
+        codes = dict()
+        key_sets = [encode_keys(fetch_column('SELECT Gene1 FROM ' + p + ' '
+                                             'UNION '
+                                             'SELECT Gene2 FROM ' + p,
+                                             sql_conn), codes)
+                    for p in ppis]
+        save_venn_overlap(ppis, key_sets, 'ppi_id_overlap', sql_conn)
+        return
+
     union = ' UNION '.join('SELECT DISTINCT Gene1 as Gene, '
                            + get_binary_fields(ppis, p) + ' '
                            'FROM ' + p + ' '
@@ -97,11 +263,24 @@ def calc_ppi_id_overlap(sql_conn, ppis=PPIS_TO_ANALYZE):
     sql.new_table_from_query('ppi_id_overlap', sqlquery, sql_conn)
 
 
-def calc_expr_overlap(sql_conn, exprs=EXPRS_TO_ANALYZE):
+def calc_expr_overlap(sql_conn, exprs=EXPRS_TO_ANALYZE, bitmask=None):
     """
     Calculates the gene overlap of all combinations of expression data sets
     in order to generate the data needed for a Venn-diagram.
+
+    @param bitmask:     Whether to compute the overlap from NumPy bitmasks
+                        (default: `BITMASK_OVERLAP`).
     """
+    if bitmask is None:
+        bitmask = BITMASK_OVERLAP
+    if bitmask:
+        codes = dict()
+        key_sets = [encode_keys(fetch_column('SELECT Gene FROM ' + e,
+                                             sql_conn), codes)
+                    for e in exprs]
+        save_venn_overlap(exprs, key_sets, 'expr_overlap', sql_conn)
+        return
+
     union = ' UNION '.join('SELECT Gene, '
                            + get_binary_fields(exprs, p) + ' '
                            'FROM ' + p for p in exprs)
@@ -163,10 +342,15 @@ def get_and_save_id_overlap(table1, table2, id_field, result_table, sql_conn,
 
 
 def calc_pairwise_expr_ppi_id_overlap(sql_conn, exprs=EXPRS_TO_ANALYZE,
-                                      ppis=PPIS_TO_ANALYZE, verbose=True):
+                                      ppis=PPIS_TO_ANALYZE, verbose=True,
+                                      bitmask=None):
     """
     Calculates the pairwise ID overlap of the expression data sets given
     by `exprs` and the PPI networks given by `ppis`.
+
+    @param bitmask:     Whether to compute all overlaps at once from the
+                        membership matrix of the genes (default:
+                        `BITMASK_OVERLAP`).
     """
     # create table for overlap results
     cur = sql_conn.cursor()
@@ -187,6 +371,22 @@ def calc_pairwise_expr_ppi_id_overlap(sql_conn, exprs=EXPRS_TO_ANALYZE,
                 print("Creating ID table for " + e)
             create_expr_all_ids_table(e, sql_conn)
 
+    if bitmask is None:
+        bitmask = BITMASK_OVERLAP
+    if bitmask:
+        codes = dict()
+        expr_genes = get_id_sets(exprs, codes, sql_conn)
+        ppi_genes = get_id_sets(ppis, codes, sql_conn)
+        overlaps = pairwise_overlaps(expr_genes + ppi_genes).tolist()
+        n = len(exprs)
+        rows = [(e, p, overlaps[i][i], overlaps[n + j][n + j],
+                 overlaps[i][n + j])
+                for j, p in enumerate(ppis) for i, e in enumerate(exprs)]
+        sql.insert_rows('overlap_pairwise_expr_ppi', rows, 5, sql_conn)
+        cur.close()
+        sql_conn.commit()
+        return
+
     for p in ppis:
         for e in exprs:
             get_and_save_id_overlap(e, p, 'Gene',
@@ -199,7 +399,8 @@ def calc_pairwise_expr_ppi_id_overlap(sql_conn, exprs=EXPRS_TO_ANALYZE,
 
 
 def calc_pairwise_expr_ppi_edge_overlap(sql_conn, exprs=EXPRS_TO_ANALYZE,
-                                        ppis=PPIS_TO_ANALYZE, verbose=True):
+                                        ppis=PPIS_TO_ANALYZE, verbose=True,
+                                        bitmask=None):
     """
     Calculates the pairwise overlap of the expression data sets given
     by `exprs` and the edges of the PPI networks given by `ppis`.
@@ -208,6 +409,10 @@ def calc_pairwise_expr_ppi_edge_overlap(sql_conn, exprs=EXPRS_TO_ANALYZE,
     the count of edges of the PPIS (instead of count of distinct IDs)
     and the number of edges where _both_ IDs are in the expression data set
     as the overlap_size.
+
+    @param bitmask:     Whether to compute the overlaps with a single scan of
+                        each PPI from the membership matrix of the genes in
+                        the expression data sets (default: `BITMASK_OVERLAP`).
     """
     # create table for overlap results
     cur = sql_conn.cursor()
@@ -216,6 +421,33 @@ def calc_pairwise_expr_ppi_edge_overlap(sql_conn, exprs=EXPRS_TO_ANALYZE,
                 '(`expr` varchar(16), `ppi` varchar(16), `expr_size` int, '
                 '`ppi_size` int, `overlap_size` int)')
 
+    if bitmask is None:
+        bitmask = BITMASK_OVERLAP
+    if bitmask:
+        if verbose:
+            print("Getting the genes of all expression data sets and PPIs")
+        codes = dict()
+        expr_genes = [encode_keys(fetch_column('SELECT DISTINCT Gene FROM '
+                                               + e, sql_conn), codes)
+                      for e in exprs]
+        edge_sets = encode_ppi_edges(ppis, codes, sql_conn)
+        # the genes x exprs membership matrix (NULL is never matched)
+        expressed = numpy.zeros((len(codes), len(exprs)), dtype=bool)
+        for i, genes in enumerate(expr_genes):
+            expressed[genes, i] = True
+        if None in codes:
+            expressed[codes[None], :] = False
+        # number of edges of each PPI with both genes in each expr
+        overlaps = [(expressed[g1] & expressed[g2]).sum(axis=0).tolist()
+                    for g1, g2 in edge_sets]
+        rows = [(e, p, len(expr_genes[i]), len(edge_sets[j][0]),
+                 overlaps[j][i])
+                for i, e in enumerate(exprs) for j, p in enumerate(ppis)]
+        sql.insert_rows('overlap_pairwise_expr_ppi_edges', rows, 5, sql_conn)
+        cur.close()
+        sql_conn.commit()
+        return
+
     # loop through all combinations
     for e in exprs:
         # create distinct id table
@@ -252,7 +484,7 @@ def calc_pairwise_expr_ppi_edge_overlap(sql_conn, exprs=EXPRS_TO_ANALYZE,
 
 
 def calc_pairwise_ppi_id_overlap(sql_conn, ppis=PPIS_TO_ANALYZE,
-                                 verbose=False):
+                                 verbose=False, bitmask=None):
     """
     Calculates the pairwise overlap of the gene/protein IDs of all PPI
     networks given by `ppis`.
@@ -260,6 +492,9 @@ def calc_pairwise_ppi_id_overlap(sql_conn, ppis=PPIS_TO_ANALYZE,
     @param sql_conn:    The SQL connection to be used.
     @param ppis:        A list of PPI names that correspond to tables in the
                         given database.
+    @param bitmask:     Whether to compute all overlaps at once from the
+                        membership matrix of the genes (default:
+                        `BITMASK_OVERLAP`).
     """
     # first create the result table
     cur = sql_conn.cursor()
@@ -267,6 +502,25 @@ def calc_pairwise_ppi_id_overlap(sql_conn, ppis=PPIS_TO_ANALYZE,
     cur.execute('CREATE TABLE overlap_pairwise_ppi_ids'
                 '(`ppi1` varchar(16), `ppi2` varchar(16), `ppi1_size` int, '
                 '`ppi2_size` int, `overlap_size` int)')
+
+    if bitmask is None:
+        bitmask = BITMASK_OVERLAP
+    if bitmask:
+        # create all_ids tables if not yet existing
+        for p in ppis:
+            if not sql.table_exists(p + '_ids', sql_conn):
+                if verbose:
+                    print("Creating ID table for " + p)
+                create_ppi_all_ids_table(p, sql_conn)
+        overlaps = pairwise_overlaps(get_id_sets(ppis, dict(),
+                                                 sql_conn)).tolist()
+        rows = [(ppis[i], ppis[j], overlaps[i][i], overlaps[j][j],
+                 overlaps[i][j])
+                for i, j in itertools.combinations(range(len(ppis)), 2)]
+        sql.insert_rows('overlap_pairwise_ppi_ids', rows, 5, sql_conn)
+        cur.close()
+        sql_conn.commit()
+        return
     # close cursor and commit changes to DB
     cur.close()
     sql_conn.commit()
@@ -312,7 +566,7 @@ def get_subset_ppi_size(ppi, id_subset, sql_conn):
 
 
 def calc_pairwise_ppi_edge_overlap(sql_conn, ppis=PPIS_TO_ANALYZE,
-                                   verbose=False):
+                                   verbose=False, bitmask=None):
     """
     Calculates the pairwise overlap of the edges of all PPI
     networks given by `ppis` (i.e. the shared edges between
@@ -321,6 +575,9 @@ def calc_pairwise_ppi_edge_overlap(sql_conn, ppis=PPIS_TO_ANALYZE,
     @param sql_conn:    The SQL connection to be used.
     @param ppis:        A list of PPI names that correspond to tables in the
                         given database.
+    @param bitmask:     Whether to compute all overlaps with a single scan of
+                        each PPI from the membership matrices of the genes and
+                        edges (default: `BITMASK_OVERLAP`).
     """
     # first create the result table
     cur = sql_conn.cursor()
@@ -331,6 +588,34 @@ def calc_pairwise_ppi_edge_overlap(sql_conn, ppis=PPIS_TO_ANALYZE,
                 '`ppi1_shared_ids_size` int, `ppi2_shared_ids_size`, '
                 '`overlap_size` int)')
 
+    if bitmask is None:
+        bitmask = BITMASK_OVERLAP
+    if bitmask:
+        if verbose:
+            print("Getting the edges of all PPIs")
+        codes = dict()
+        edge_sets = encode_ppi_edges(ppis, codes, sql_conn)
+        # the genes x ppis membership matrix
+        genes = numpy.zeros((len(codes), len(ppis)), dtype=bool)
+        for i, ids in enumerate(ppi_gene_sets(edge_sets, codes)):
+            genes[ids, i] = True
+        # shared_sizes[i][j]: the number of edges of PPI i with both genes
+        # in PPI j
+        shared_sizes = [(genes[g1] & genes[g2]).sum(axis=0).tolist()
+                        for g1, g2 in edge_sets]
+        # the pairwise overlaps of the distinct (directed) edges
+        num_genes = len(codes)
+        overlaps = pairwise_overlaps([g1 * num_genes + g2
+                                      for g1, g2 in edge_sets]).tolist()
+        rows = [(ppis[i], ppis[j], len(edge_sets[i][0]),
+                 len(edge_sets[j][0]), shared_sizes[i][j],
+                 shared_sizes[j][i], overlaps[i][j])
+                for i, j in itertools.combinations(range(len(ppis)), 2)]
+        sql.insert_rows('overlap_pairwise_ppi_edges', rows, 7, sql_conn)
+        cur.close()
+        sql_conn.commit()
+        return
+
     # create all_ids tables if not yet existing
     for p in ppis:
         if not sql.table_exists(p + '_ids', sql_conn):
@@ -360,11 +645,14 @@ def calc_pairwise_ppi_edge_overlap(sql_conn, ppis=PPIS_TO_ANALYZE,
 
         cur.execute('DROP TABLE overlap_ids_tmp')
 
-        # get overlap size
+        # get overlap size (comparing the integer encoded edges if possible)
+        edges = [edge_table(p, sql_conn) for p in [x, y]]
+        if None in edges:
+            edges = [x, y]
         cur.execute('SELECT COUNT(*) FROM ('
-                    'SELECT Gene1, Gene2 FROM ' + x + ' '
+                    'SELECT Gene1, Gene2 FROM ' + edges[0] + ' '
                     'INTERSECT '
-                    'SELECT Gene1, Gene2 FROM ' + y + ')')
+                    'SELECT Gene1, Gene2 FROM ' + edges[1] + ')')
         overlap_size = cur.fetchone()[0]
 
         # save results to db
@@ -1,11 +1,63 @@
 import csv
+import numpy
 from .. import sql
 from .. import id_mapping
+from .. import binary_io
 from ..table_manager import TableManager
 
 # import the UNIFYING ID variable
 from ..id_mapping import UNIFYING_ID
 
+# the suffix of the integer encoded edge tables (see `PPI.create_edge_table()`)
+EDGE_TABLE_SUFFIX = '_edges'
+
+
+def edge_table(ppi_name, sql_conn):
+    """
+    Returns the integer encoded edge table of the PPI network `ppi_name` if it
+    exists, otherwise `None`.
+    """
+    table = ppi_name + EDGE_TABLE_SUFFIX
+    if sql.table_exists(table, sql_conn):
+        return table
+    return None
+
+
+def create_all_ids_table(ppi_name, sql_conn):
+    """
+    Creates a table named `ppi_name`_ids that holds all the distinct IDs used
+    in the ppi network (in the order of the gene names), together with their
+    key in the gene dictionary (`id_mapping.GENE_DICT_TABLE`), if the PPI has
+    an integer encoded edge table.
+    """
+    cur = sql_conn.cursor()
+    if not sql.table_exists(ppi_name + '_ids', sql_conn):
+        cur.execute('CREATE TABLE IF NOT EXISTS `' + ppi_name + '_ids` '
+                    '(id integer primary key autoincrement, '
+                    'Gene varchar(16), GeneKey int)')
+        edges = edge_table(ppi_name, sql_conn)
+        if edges is None:
+            sqlquery = ('SELECT Gene1 as Gene, NULL FROM ' + ppi_name + ' '
+                        'UNION '
+                        'SELECT Gene2 as Gene, NULL FROM ' + ppi_name + ' '
+                        'ORDER BY Gene')
+        else:
+            # collect the distinct integer keys, only these are decoded
+            sqlquery = ('SELECT Gene, id FROM ' + id_mapping.GENE_DICT_TABLE
+                        + ' WHERE id IN (SELECT Gene1 FROM ' + edges + ' '
+                        '                UNION '
+                        '                SELECT Gene2 FROM ' + edges + ') '
+                        'ORDER BY Gene')
+        cur.execute('INSERT INTO `' + ppi_name + '_ids` (Gene, GeneKey) '
+                    + sqlquery)
+    # create the indexes for fast merging
+    for index, col in [('_ids_index', 'Gene'), ('_ids_key_index', 'GeneKey')]:
+        cur.execute('DROP INDEX IF EXISTS ' + ppi_name + index)
+        cur.execute('CREATE UNIQUE INDEX ' + ppi_name + index + ' '
+                    'ON ' + ppi_name + '_ids (' + col + ')')
+    cur.close()
+    sql_conn.commit()
+
 
 class PPI(TableManager):
     """ An interface to all PPI networks. """
@@ -67,6 +119,8 @@ class PPI(TableManager):
         if verbose:
             print("    normalizing graph")
         self.normalize_graph()
+        # drop the intermediate tables (in staging mode)
+        self.drop_staged_tables()
 
     def import_raw_file(self):
         """
@@ -75,7 +129,8 @@ class PPI(TableManager):
         table_name = self.next_tmp_table("raw")
         sql.import_csv(self.filename, table_name, self.file_field_seperator,
                        self.file_has_header, csv_quoting=self.file_quoting,
-                       sql_conn=self.sql_conn)
+                       sql_conn=self.sql_conn,
+                       num_workers=self.import_workers)
 
     def filter(self):
         """
@@ -137,36 +192,58 @@ class PPI(TableManager):
                     'END AS Gene2 '
                     'FROM ' + src_table)
         sql.new_table_from_query(dst_table, sqlquery, self.sql_conn)
+        self.create_edge_table()
 
-    def create_all_ids_table(self):
+    def create_edge_table(self):
         """
-        Creates a table named `ppi_name`_ids that holds all the distinct IDs
-        used in the ppi network.
+        Creates the table `ppi_name`_edges of all edges of the (normalized)
+        PPI network, with both genes encoded by their integer id in the gene
+        dictionary (`id_mapping.GENE_DICT_TABLE`). The (Gene1, Gene2) primary
+        key is the clustered index of the table (`WITHOUT ROWID`), such that
+        graph loading and overlap joins compare integers instead of gene
+        names.
+
+        The table is only created if the gene dictionary exists. Edges with
+        genes that aren't in the dictionary are not part of the table.
         """
+        if not sql.table_exists(id_mapping.GENE_DICT_TABLE, self.sql_conn):
+            return
+        table = self.name + EDGE_TABLE_SUFFIX
         cur = self.sql_conn.cursor()
-        if not sql.table_exists(self.name + '_ids', self.sql_conn):
-            cur.execute('CREATE TABLE IF NOT EXISTS `' + self.name + '_ids` '
-                        '(id integer primary key autoincrement, '
-                        'Gene varchar(16))')
-            sqlquery = ('SELECT Gene1 as Gene FROM ' + self.name + ' UNION '
-                        'SELECT Gene2 as Gene FROM ' + self.name)
-            cur.execute('INSERT INTO `' + self.name + '_ids` (Gene) '
-                        + sqlquery)
-        # create an index for fast merging
-        cur.execute('DROP INDEX IF EXISTS ' + self.name + '_ids_index')
-        cur.execute('CREATE UNIQUE INDEX ' + self.name + '_ids_index '
-                    'ON ' + self.name + '_ids (Gene)')
+        cur.execute('DROP TABLE IF EXISTS ' + sql.main_schema(table))
+        cur.execute('CREATE TABLE ' + table + ' '
+                    '(Gene1 integer, Gene2 integer, '
+                    ' PRIMARY KEY (Gene1, Gene2)) WITHOUT ROWID')
+        # insert in primary key order (the edges are distinct already)
+        cur.execute('INSERT INTO ' + table + ' (Gene1, Gene2) '
+                    'SELECT g1.id, g2.id '
+                    'FROM ' + self.name + ' AS e '
+                    'INNER JOIN ' + id_mapping.GENE_DICT_TABLE + ' AS g1 '
+                    ' ON g1.Gene = e.Gene1 '
+                    'INNER JOIN ' + id_mapping.GENE_DICT_TABLE + ' AS g2 '
+                    ' ON g2.Gene = e.Gene2 '
+                    'ORDER BY g1.id, g2.id')
         cur.close()
         self.sql_conn.commit()
 
-    def export_to_edge_list(self, only_ids=None):
+    def create_all_ids_table(self):
+        """
+        Creates a table named `ppi_name`_ids that holds all the distinct IDs
+        used in the ppi network (see `create_all_ids_table()`).
+        """
+        create_all_ids_table(self.name, self.sql_conn)
+
+    def export_to_edge_list(self, only_ids=None, filename=None):
         """
         Exports the network from the SQL table into an edge list of IDs
-        in the range [1,#IDs] and saves the resulting list into a tab
-        separated file.
+        in the range [1,#IDs] (the table `ppi_name`_for_export) and saves the
+        resulting list into a binary file (see `binary_io.write_edge_list()`,
+        with the node ids [0,#IDs) in the order of the IDs).
 
         @param filename:        The file-path for the file to which the
-                                edgelist is written.
+                                edgelist is written. If this is set to
+                                `None`, only the table is created.
+                                (default: None)
         @param only_ids:        An SQL table of Gene ids. The exported network
                                 will consist only of edges between those ids,
                                 i.e. the subnetwork/subgraph defined by this
@@ -189,18 +266,34 @@ class PPI(TableManager):
             # name
             id_table = '(' + sqlquery + ')'
 
-        # merge PPI network  with unique integer ids (node-ids)
+        # merge PPI network  with unique integer ids (node-ids), via the
+        # integer keys of the genes if possible
+        edges = edge_table(self.name, self.sql_conn)
+        if edges is None:
+            edges = self.name
+            gene_col = 'Gene'
+        else:
+            gene_col = 'GeneKey'
         sqlquery = ('SELECT b.id AS Gene1, c.id AS Gene2 '
-                    'FROM ' + self.name + ' AS a '
+                    'FROM ' + edges + ' AS a '
                     'INNER JOIN ' + id_table + ' AS b '
-                    ' ON a.Gene1 = b.Gene '
+                    ' ON a.Gene1 = b.' + gene_col + ' '
                     'INNER JOIN ' + id_table + ' AS c '
-                    ' ON a.Gene2 = c.Gene ')
+                    ' ON a.Gene2 = c.' + gene_col + ' ')
 
         sql.new_table_from_query(self.name + "_for_export", sqlquery,
                                  self.sql_conn)
 
         # save results to file
-        #with open(filename, "w") as f:
-        #    for row in cur.fetchall():
-        #        f.write("%i\t%i\n" % (row[0], row[1]))
+        if filename is not None:
+            cur = self.sql_conn.cursor()
+            cur.execute('SELECT id, Gene FROM ' + id_table + ' ORDER BY id')
+            nodes = cur.fetchall()
+            cur.execute('SELECT Gene1, Gene2 FROM ' + self.name
+                        + '_for_export')
+            edges = numpy.array(cur.fetchall(), dtype=numpy.int64)
+            cur.close()
+            # the IDs (of a filtered ID table) aren't necessarily consecutive
+            ids = numpy.array([n[0] for n in nodes], dtype=numpy.int64)
+            edges = numpy.searchsorted(ids, edges.reshape(-1, 2))
+            binary_io.write_edge_list(filename, edges, [n[1] for n in nodes])
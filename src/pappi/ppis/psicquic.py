@@ -3,6 +3,112 @@ from .. import sql
 import re
 
 
+# function to extract a uniprot id
+def psicqic_get_uniprot_id(s):
+    p = re.compile(r'uniprotkb:(\w+)')
+    m = p.match(s)
+    if m:
+        return m.group(1)
+    else:
+        return None
+
+
+# custom row iterator wrapper for the PSI-MITAB 2.5 format
+# (this is the original csv based parser, it is kept for benchmarking
+#  against the `mitab_line_parser`)
+def psicquic_row_iter(base_iter):
+    for row in base_iter:
+        # simply "parses" uniprot and confidence from PSI MITAB 2.5:
+        # https://code.google.com/p/psicquic/wiki/MITAB25Format
+        gene1 = psicqic_get_uniprot_id(row[0])
+        gene2 = psicqic_get_uniprot_id(row[1])
+        confidence = row[14]
+        yield [gene1, gene2, confidence]
+    return
+
+
+# PSI-MITAB 2.5 column indeces:
+# https://code.google.com/p/psicquic/wiki/MITAB25Format
+MITAB_ID_A = 0
+MITAB_ID_B = 1
+MITAB_ALT_ID_A = 2
+MITAB_ALT_ID_B = 3
+MITAB_CONFIDENCE = 14
+
+# the uniprot ID at the beginning of the unique identifier columns
+MITAB_UNIPROT_ID = re.compile(r'uniprotkb:(\w+)')
+# an UniProt accession in the (`|` separated) alternative identifier columns,
+# these columns also contain gene names (e.g. `uniprotkb:CDK2(gene name)`),
+# thus only proper accessions are accepted:
+# http://www.uniprot.org/help/accession_numbers
+MITAB_ALT_UNIPROT_ID = re.compile(
+    r'(?:^|\|)uniprotkb:'
+    r'([OPQ][0-9][A-Z0-9]{3}[0-9]|[A-NR-Z][0-9](?:[A-Z][A-Z0-9]{2}[0-9]){1,2})'
+    r'\b')
+# the preferred confidence score method
+MITAB_PREFERRED_SCORE = 'intact-miscore'
+
+
+def mitab_uniprot_id(id_field, alt_id_field):
+    """
+    Returns the UniProt ID of an interactor from its unique identifier
+    column, falling back to the alternative identifier column in case the
+    unique identifier is not a UniProt ID. Returns `None` if neither column
+    holds an UniProt ID.
+    """
+    m = MITAB_UNIPROT_ID.match(id_field)
+    if m:
+        return m.group(1)
+    m = MITAB_ALT_UNIPROT_ID.search(alt_id_field)
+    if m:
+        return m.group(1)
+    return None
+
+
+def mitab_score(confidence):
+    """
+    Parses the PSI-MITAB confidence column into a numeric score.
+    The IntAct MI-score is preferred if available, otherwise the first
+    numeric score is returned. Returns `None` for non-numeric confidences.
+    """
+    score = None
+    # entries are of the form `method:value` and separated by `|`
+    # (e.g. `intact-miscore:0.56|author score:0.8`)
+    for entry in confidence.split('|'):
+        method, _, value = entry.partition(':')
+        try:
+            value = float(value.strip('"'))
+        except ValueError:
+            continue
+        if method == MITAB_PREFERRED_SCORE:
+            return value
+        if score is None:
+            score = value
+    return score
+
+
+def mitab_line_parser(lines):
+    """
+    A high-throughput line parser for PSI-MITAB 2.5 files to be used as the
+    `line_parser` of `sql.import_csv`. Each line is only split up to the
+    confidence column (the remaining columns are never materialized) and all
+    regular expressions are compiled once.
+
+    Yields rows of the form [Gene1, Gene2, Confidence, Score].
+    """
+    max_split = MITAB_CONFIDENCE + 1
+    for line in lines:
+        fields = line.rstrip('\r\n').split('\t', max_split)
+        if len(fields) <= MITAB_CONFIDENCE:
+            # skip empty or broken lines
+            continue
+        gene1 = mitab_uniprot_id(fields[MITAB_ID_A], fields[MITAB_ALT_ID_A])
+        gene2 = mitab_uniprot_id(fields[MITAB_ID_B], fields[MITAB_ALT_ID_B])
+        confidence = fields[MITAB_CONFIDENCE]
+        yield [gene1, gene2, confidence, mitab_score(confidence)]
+    return
+
+
 class Psicquic(ppi.PPI):
     """
     Imports and filters the string-db PPI network.
@@ -33,35 +139,20 @@ class Psicquic(ppi.PPI):
         """
         Import the PSI-MITAB v 2.5 file, but only the first two columns
         ( the interacting proteins) and the reliablility column.
+        Interactors without an UniProt ID in the first two columns are looked
+        up in the alternative ID columns, and the confidence column is
+        additionally parsed into the numeric `Score` column.
         """
-        # function to extract a uniprot id
-        def psicqic_get_uniprot_id(s):
-            p = re.compile(r'uniprotkb:(\w+)')
-            m = p.match(s)
-            if m:
-                return m.group(1)
-            else:
-                return None
-
-        # custom row iterator wrapper for the PSI-MITAB 2.5 format
-        def psicquic_row_iter(base_iter):
-            for row in base_iter:
-                # simply "parses" uniprot and confidence from PSI MITAB 2.5:
-                # https://code.google.com/p/psicquic/wiki/MITAB25Format
-                # TODO maybe look in alt names if none found here
-                gene1 = psicqic_get_uniprot_id(row[0])
-                gene2 = psicqic_get_uniprot_id(row[1])
-                confidence = row[14]
-                yield [gene1, gene2, confidence]
-            return
         # import the psicquic ppi
         table_name = self.next_tmp_table("raw")
         sql.import_csv(self.filename, table_name, self.file_field_seperator,
                        self.file_has_header,
-                       column_names=["Gene1", "Gene2", "Confidence"],
-                       column_types=["varchar(16)"]*3,
-                       row_iterator_wrapper=psicquic_row_iter,
-                       csv_quoting=self.file_quoting, sql_conn=self.sql_conn)
+                       column_names=["Gene1", "Gene2", "Confidence", "Score"],
+                       column_types=["varchar(16)"]*3 + ["real"],
+                       line_parser=mitab_line_parser,
+                       csv_quoting=self.file_quoting, sql_conn=self.sql_conn,
+                       bulk_load=True, verbose=True,
+                       num_workers=self.import_workers)
 
     def filter(self):
         # don't filter yet
@@ -35,3 +35,4 @@ class PsicquicAll(ppi.PPI):
         sql.new_table_from_query(self.name + "_count", sqlquery, self.sql_conn)
         sqlquery = ("SELECT Gene1, Gene2 FROM " + self.name + "_count")
         sql.new_table_from_query(self.name, sqlquery, self.sql_conn)
+        self.create_edge_table()
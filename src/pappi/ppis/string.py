@@ -2,10 +2,26 @@ from . import ppi
 from .. import sql
 
 
+def string_row_iter(base_iter):
+    """
+    Custom row iterator wrapper for the string-db file, which removes the
+    `9606.` prefix from all fields.
+    (This is a module level function, such that it can be used by the
+    worker processes of parallel imports)
+    """
+    for row in base_iter:
+        row = [s.replace("9606.", "") for s in row]
+        yield row
+    return
+
+
 class StringDB(ppi.PPI):
     """
     Imports and filters the string-db PPI network.
     """
+    # the raw string-db table is several GB large, staged intermediate
+    # tables are thus kept in a temporary file rather than in memory
+    staging_temp_store = 'FILE'
 
     def __init__(self, filename, sql_connection):
         """
@@ -30,12 +46,6 @@ class StringDB(ppi.PPI):
         """
         Imports the string-db PPI file in csv format into the SQL database.
         """
-        # custom row iterator wrapper:
-        def string_row_iter(base_iter):
-            for row in base_iter:
-                row = [s.replace("9606.", "") for s in row]
-                yield row
-            return
         # import the string PPI without the 9606. prefix
         table_name = self.next_tmp_table("raw")
         sql.import_csv(self.filename, table_name, self.file_field_seperator,
@@ -43,7 +53,9 @@ class StringDB(ppi.PPI):
                        column_names=["Gene1", "Gene2", "Reliability"],
                        column_types=["varchar(16)", "varchar(16)", "int"],
                        row_iterator_wrapper=string_row_iter,
-                       csv_quoting=self.file_quoting, sql_conn=self.sql_conn)
+                       csv_quoting=self.file_quoting, sql_conn=self.sql_conn,
+                       bulk_load=True, verbose=True,
+                       num_workers=self.import_workers)
 
     def filter(self):
         # don't filter yet
@@ -11,9 +11,29 @@ from .data_config import DATABASE
 import sqlite3
 import csv
 import re
+import os
+import io
+import time
+import itertools
+import contextlib
+import collections
+import concurrent.futures
 
 PAPPI_SQL_CONN = None
 
+# default number of rows inserted per transaction during bulk loads
+BULK_LOAD_BATCH_SIZE = 100000
+# default page cache size during bulk loads (negative values are in KiB,
+# i.e. this is 512 MiB)
+BULK_LOAD_CACHE_SIZE = -512*1024
+
+# size (in bytes) of the file chunks parsed by each worker process during
+# parallel CSV imports
+IMPORT_CHUNK_SIZE = 16*1024*1024
+# default number of worker processes for parallel CSV imports (the stages of
+# the `TaskGraph` get their share of the CPUs instead, see `_run_worker`)
+IMPORT_WORKERS = 1
+
 
 def execute_script(script_filename, sql_conn=PAPPI_SQL_CONN):
     """
@@ -62,10 +82,11 @@ def new_table_from_query(new_table, query, sql_conn=PAPPI_SQL_CONN,
     # depending on the `overwrite` parameter: drop table and set correct
     # CREATE statement
     if overwrite:
-        cur.execute('DROP TABLE IF EXISTS ' + new_table)
-        sql_prefix = 'CREATE TABLE "' + new_table + '" AS '
+        cur.execute('DROP TABLE IF EXISTS ' + main_schema(new_table))
+        sql_prefix = 'CREATE TABLE ' + quote_table(new_table) + ' AS '
     else:
-        sql_prefix = 'CREATE TABLE IF NOT EXISTS "' + new_table + '" AS '
+        sql_prefix = ('CREATE TABLE IF NOT EXISTS ' + quote_table(new_table)
+                      + ' AS ')
 
     # execute the query and save in the new table
     cur.execute(sql_prefix + query)
@@ -87,11 +108,197 @@ def extend_row_iterator(base_iterator, num, indices=None):
     return
 
 
+@contextlib.contextmanager
+def bulk_load_session(sql_conn=PAPPI_SQL_CONN,
+                      cache_size=BULK_LOAD_CACHE_SIZE):
+    """
+    Tunes the SQLite session for fast bulk inserts for the duration of the
+    `with` block: turns off the rollback journal and synchronous writes and
+    increases the page cache. The previous settings are restored afterwards.
+
+    NOTE: a crash during the bulk load can leave the database corrupted,
+          this is only meant for (re-)building tables from raw files.
+
+    @param sql_conn:    The SQL connection to be tuned.
+    @param cache_size:  The page cache size during the bulk load (as for
+                        `PRAGMA cache_size`, negative values are in KiB).
+    """
+    # the journal mode can't be changed inside of a transaction
+    sql_conn.commit()
+    cur = sql_conn.cursor()
+    # save the current settings (of the main database only, other databases
+    # may be attached)
+    old_settings = []
+    for pragma in ['journal_mode', 'synchronous', 'cache_size']:
+        cur.execute('PRAGMA main.' + pragma)
+        old_settings.append((pragma, cur.fetchone()[0]))
+    # set the bulk load settings, a database in WAL mode is kept in WAL mode
+    # (it may be read concurrently by other processes)
+    if old_settings[0][1].lower() != 'wal':
+        cur.execute('PRAGMA main.journal_mode = OFF')
+    cur.execute('PRAGMA main.synchronous = OFF')
+    cur.execute('PRAGMA main.cache_size = ' + str(int(cache_size)))
+    try:
+        yield sql_conn
+    finally:
+        # commit outstanding rows and restore the previous settings
+        sql_conn.commit()
+        for pragma, value in old_settings:
+            cur.execute('PRAGMA main.' + pragma + ' = ' + str(value))
+        cur.close()
+
+
+def insert_rows(table, rows, num_cols, sql_conn=PAPPI_SQL_CONN,
+                batch_size=None):
+    """
+    Inserts all rows given by the iterator `rows` into the given table.
+    If `batch_size` is given, the rows are inserted and commited in batches
+    of that many rows, otherwise all rows are inserted in a single
+    `executemany` call.
+
+    @param table:       The name of the (existing) SQL table.
+    @param rows:        An iterable of rows, each of length `num_cols`.
+    @param num_cols:    The number of columns of the table.
+    @param sql_conn:    The SQL connection to be used.
+    @param batch_size:  The number of rows per transaction. (default: None)
+    @returns:           The number of inserted rows.
+    """
+    cur = sql_conn.cursor()
+    vals = ", ".join(['?'] * num_cols)
+    insert_stmt = ('INSERT INTO ' + quote_table(table) + ' VALUES (' + vals
+                   + ')')
+    num_rows = 0
+    if batch_size is None:
+        # count rows while passing them through to executemany
+        def counting_iter(it):
+            nonlocal num_rows
+            for row in it:
+                num_rows += 1
+                yield row
+        cur.executemany(insert_stmt, counting_iter(rows))
+    else:
+        rows = iter(rows)
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                break
+            cur.executemany(insert_stmt, batch)
+            sql_conn.commit()
+            num_rows += len(batch)
+    cur.close()
+    return num_rows
+
+
+def _row_reader(csv_file, csv_delimiter, csv_quoting, line_parser=None):
+    """
+    Returns the row reader for the given (opened) file: either a csv reader
+    or the custom `line_parser` applied to the file's line iterator.
+    """
+    if line_parser is None:
+        return csv.reader(csv_file, delimiter=csv_delimiter,
+                          quoting=csv_quoting)
+    else:
+        return line_parser(csv_file)
+
+
+def _csv_chunk_offsets(csv_filename, skip_lines, chunk_size):
+    """
+    Splits the given file (after skipping the first `skip_lines` lines) into
+    chunks of roughly `chunk_size` bytes, such that every chunk starts at the
+    beginning of a line.
+
+    @returns    A list of (begin, end) byte offsets of all chunks.
+    """
+    offsets = []
+    with open(csv_filename, 'rb') as f:
+        for i in range(0, skip_lines):
+            f.readline()
+        begin = f.tell()
+        file_end = os.fstat(f.fileno()).st_size
+        while begin < file_end:
+            # jump ahead and finish reading the current line
+            f.seek(begin + chunk_size)
+            f.readline()
+            end = min(f.tell(), file_end)
+            offsets.append((begin, end))
+            begin = end
+    return offsets
+
+
+def _parse_csv_chunk(args):
+    """
+    Parses one chunk of a CSV file (given by byte offsets) in a worker process
+    and returns the list of (transformed and extended) rows.
+    """
+    (csv_filename, begin, end, csv_delimiter, csv_quoting,
+     row_iterator_wrapper, line_parser, num, indices) = args
+    with open(csv_filename, 'rb') as f:
+        f.seek(begin)
+        data = f.read(end - begin)
+    # decode the same way as `open(csv_filename, 'r')` would
+    chunk_file = io.TextIOWrapper(io.BytesIO(data))
+    csv_reader = _row_reader(chunk_file, csv_delimiter, csv_quoting,
+                             line_parser)
+    if row_iterator_wrapper is None:
+        row_iter = csv_reader
+    else:
+        row_iter = row_iterator_wrapper(csv_reader)
+    return list(extend_row_iterator(row_iter, num, indices))
+
+
+def parallel_csv_rows(csv_filename, skip_lines, csv_delimiter, csv_quoting,
+                      num, indices=None, row_iterator_wrapper=None,
+                      line_parser=None, num_workers=IMPORT_WORKERS,
+                      chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Parses the given CSV file with a pool of worker processes and yields all
+    rows in the original order of the file.
+
+    The file is split into chunks on line boundaries, thus rows MUST NOT
+    span multiple lines (i.e. no quoted newlines). The `row_iterator_wrapper`
+    has to be a module level function, so that it can be sent to the worker
+    processes.
+
+    @param csv_filename:    The file name of the CSV file to be parsed.
+    @param skip_lines:      The number of lines (e.g. comments and header) to
+                            skip at the beginning of the file.
+    @param csv_delimiter:   The delimiter/seperator of the CSV file.
+    @param csv_quoting:     Field-Quoting of the CSV file.
+    @param num:             The number of columns of each returned row.
+    @param indices:         The column indeces to keep (see
+                            `extend_row_iterator`).
+    @param row_iterator_wrapper:
+                            A generator function wrapping the csv reader.
+    @param line_parser:     A generator function replacing the csv reader
+                            (see `import_csv`).
+    @param num_workers:     The number of worker processes.
+    @param chunk_size:      The size of the chunks in bytes.
+    """
+    offsets = _csv_chunk_offsets(csv_filename, skip_lines, chunk_size)
+    tasks = ((csv_filename, begin, end, csv_delimiter, csv_quoting,
+              row_iterator_wrapper, line_parser, num, indices)
+             for begin, end in offsets)
+    with concurrent.futures.ProcessPoolExecutor(num_workers) as pool:
+        # keep a bounded number of chunks in flight, such that the parsed
+        # rows don't pile up in memory in case the SQL writer is slower
+        pending = collections.deque()
+        for task in itertools.islice(tasks, 2*num_workers):
+            pending.append(pool.submit(_parse_csv_chunk, task))
+        while pending:
+            rows = pending.popleft().result()
+            for task in itertools.islice(tasks, 1):
+                pending.append(pool.submit(_parse_csv_chunk, task))
+            for row in rows:
+                yield row
+
+
 def import_csv(csv_filename, table, csv_delimiter, has_header,
                import_columns=None,
                column_names=None, column_types=None,
                csv_quoting=None, sql_conn=PAPPI_SQL_CONN, skip_rows=0,
-               row_iterator_wrapper=None):
+               row_iterator_wrapper=None, bulk_load=False,
+               batch_size=BULK_LOAD_BATCH_SIZE, verbose=False,
+               num_workers=None, line_parser=None):
     """
     Imports a CSV file into an SQL table.
 
@@ -109,6 +316,28 @@ def import_csv(csv_filename, table, csv_delimiter, has_header,
     @param csv_quoting:     Field-Quoting of the CSV file. Default: QUOTE_NONE
     @param sql_conn:        The SQL connection to be used. Default: current
                             connection.
+    @param skip_rows:       Number of lines to skip at the beginning of the
+                            file.
+    @param row_iterator_wrapper:
+                            A generator function wrapping the csv reader,
+                            which can transform the rows before insertion.
+    @param bulk_load:       Whether to tune the SQL session for bulk inserts
+                            (see `bulk_load_session`) and insert the rows in
+                            batches of `batch_size` rows. Default: False
+    @param batch_size:      Number of rows per transaction in bulk load mode.
+    @param verbose:         Whether to print the import rate (rows/sec).
+    @param num_workers:     If this is bigger than 1, the file is parsed in
+                            chunks by this many worker processes (see
+                            `parallel_csv_rows`). The `row_iterator_wrapper`
+                            then has to be a module level function.
+                            Default: None (parse in this process)
+    @param line_parser:     A generator function, which takes an iterator over
+                            the lines of the file and yields the split rows.
+                            If this is given, it replaces the csv reader (and
+                            `csv_delimiter` and `csv_quoting` are ignored).
+                            This enables specialized parsers for formats,
+                            where only some of the fields are needed.
+    @returns:               The number of imported rows.
     """
     # check parameters
     if not csv_quoting:
@@ -125,8 +354,10 @@ def import_csv(csv_filename, table, csv_delimiter, has_header,
         cur = sql_conn.cursor()
 
         # get csv reader for the CCSB file
-        csv_reader = csv.reader(csv_file, delimiter=csv_delimiter,
-                                quoting=csv_quoting)
+        csv_reader = _row_reader(csv_file, csv_delimiter, csv_quoting,
+                                 line_parser)
+        # the number of lines read before the actual data starts
+        skip_lines = skip_rows + 1
 
         # if no column names are given, use the header row if available
         # or use default names Column_1, Column_2, ...
@@ -144,8 +375,8 @@ def import_csv(csv_filename, table, csv_delimiter, has_header,
                 for i in range(1, len(row) + 1):
                     column_names.append("Column_" + str(i))
                 # reset the csv_reader object
-                csv_reader = csv.reader(csv_file, delimiter=csv_delimiter,
-                                        quoting=csv_quoting)
+                csv_reader = _row_reader(csv_file, csv_delimiter,
+                                         csv_quoting, line_parser)
             # use only those wanted
             if not import_columns is None:
                 column_names = [column_names[i] for i in import_columns]
@@ -153,6 +384,8 @@ def import_csv(csv_filename, table, csv_delimiter, has_header,
             if has_header:
                 # ignore header
                 csv_reader.__next__()
+            else:
+                skip_lines = skip_rows
 
         # if no column types are given, use the default for all
         default_col_type = "varchar(16)"
@@ -164,41 +397,122 @@ def import_csv(csv_filename, table, csv_delimiter, has_header,
         sql_table_def = ", ".join('"' + x + '" ' + y for x, y in cols)
 
         # delete old and create new table
-        cur.execute('DROP TABLE IF EXISTS "' + table + '"')
-        cur.execute('CREATE TABLE "' + table + '" (' + sql_table_def + ')')
-
-        # insert all lines
-        vals = ", ".join(['?'] * len(column_names))
-        if row_iterator_wrapper is None:
-            row_iter = csv_reader
-        else:
-            row_iter = row_iterator_wrapper(csv_reader)
-        cur.executemany('INSERT INTO "' + table + '" VALUES (' + vals + ')',
-                        extend_row_iterator(row_iter, len(column_names),
-                                            import_columns))
+        cur.execute('DROP TABLE IF EXISTS ' + main_schema(quote_table(table)))
+        cur.execute('CREATE TABLE ' + quote_table(table) + ' ('
+                    + sql_table_def + ')')
 
         # close cursor and commit
         cur.close()
         sql_conn.commit()
 
+        # insert all lines
+        if (num_workers is not None and num_workers > 1
+                and os.path.getsize(csv_filename) > IMPORT_CHUNK_SIZE):
+            rows = parallel_csv_rows(csv_filename, skip_lines, csv_delimiter,
+                                     csv_quoting, len(column_names),
+                                     import_columns, row_iterator_wrapper,
+                                     line_parser, num_workers)
+        else:
+            if row_iterator_wrapper is None:
+                row_iter = csv_reader
+            else:
+                row_iter = row_iterator_wrapper(csv_reader)
+            rows = extend_row_iterator(row_iter, len(column_names),
+                                       import_columns)
+        start = time.time()
+        if bulk_load:
+            with bulk_load_session(sql_conn):
+                num_rows = insert_rows(table, rows, len(column_names),
+                                       sql_conn, batch_size)
+        else:
+            num_rows = insert_rows(table, rows, len(column_names), sql_conn)
+            sql_conn.commit()
+        elapsed = time.time() - start
+
+    if verbose:
+        rate = num_rows / elapsed if elapsed > 0 else float('inf')
+        print("    Imported %i rows into `%s` in %.2f s (%.0f rows/s)"
+              % (num_rows, table, elapsed, rate))
+
+    return num_rows
+
 
 def linearize_table(src_table, excl_columns, cat_col_name, val_col_name,
                     dst_table, con=PAPPI_SQL_CONN):
+    """
+    Linearizes (unpivots) a table in the format [IDs]x[Categories] into the
+    table `dst_table` with the columns (excl_columns..., cat_col_name,
+    val_col_name).
+
+    The source table is scanned only once: each row is joined with the list
+    of categories and the value is picked by the category index. Duplicate
+    result rows are removed (as a `UNION` of one `SELECT` per category
+    would), but only for rows whose IDs are not unique in the source table,
+    since all other result rows are distinct already.
+
+    @param src_table:       The wide table.
+    @param excl_columns:    The (ID) columns that are kept as they are, all
+                            other columns are linearized.
+    @param cat_col_name:    The name of the new column holding the names of
+                            the linearized columns (e.g. "Tissue").
+    @param val_col_name:    The name of the new column holding the values of
+                            the linearized columns (e.g. "ExpressionValue").
+    @param dst_table:       The name of the new table.
+    @param con:             The SQL connection to be used.
+    """
     col_names = get_column_names(src_table, con)
 
     transpose_cols = [x for x in col_names if not x in excl_columns]
 
-    remaining_cols = ", ".join(excl_columns)
-
-    select_stmts = ['SELECT ' + remaining_cols + ' , \'' + x + '\' AS '
-                    + cat_col_name + ', [' + x + '] AS ' + val_col_name
-                    + ' FROM ' + src_table for x in transpose_cols]
-    union = " UNION ".join(select_stmts)
+    key_cols = ", ".join('src.[' + x + ']' for x in excl_columns)
 
     # get SQL cursor
     cur = con.cursor()
-    cur.execute('DROP TABLE IF EXISTS ' + dst_table)
-    cur.execute('CREATE TABLE ' + dst_table + ' AS ' + union)
+    cur.execute('DROP TABLE IF EXISTS ' + main_schema(dst_table))
+    # create the empty table with the same column types as the
+    # `SELECT ... UNION SELECT ...` would
+    cur.execute('CREATE TABLE ' + dst_table + ' AS '
+                'SELECT ' + key_cols + ', ? AS ' + cat_col_name + ', '
+                'src.[' + transpose_cols[0] + '] AS ' + val_col_name + ' '
+                'FROM ' + src_table + ' AS src WHERE 0', [transpose_cols[0]])
+
+    # join every row with all categories and select the category's value
+    categories = ('(VALUES '
+                  + ", ".join('(' + str(i) + ', ?)'
+                              for i in range(len(transpose_cols))) + ')')
+    value = ('CASE cat.column1 '
+             + " ".join('WHEN ' + str(i) + ' THEN src.[' + x + ']'
+                        for i, x in enumerate(transpose_cols))
+             + ' END')
+    # CROSS JOIN keeps the source table as the outer loop (single scan)
+    linear_select = ('SELECT ' + key_cols + ', cat.column2, ' + value + ' '
+                     'FROM ' + src_table + ' AS src '
+                     'CROSS JOIN ' + categories + ' AS cat ')
+
+    # find the rows with non unique IDs, only these can produce duplicates
+    cur.execute('SELECT COUNT(*) FROM (SELECT 1 FROM ' + src_table + ' AS src '
+                'GROUP BY ' + key_cols + ' HAVING COUNT(*) > 1)')
+    has_dups = cur.fetchone()[0] > 0
+
+    insert = 'INSERT INTO ' + main_schema(dst_table) + ' '
+    if not has_dups:
+        cur.execute(insert + linear_select, transpose_cols)
+    else:
+        dup_keys = ", ".join('[' + x + ']' for x in excl_columns)
+        join_cond = " AND ".join('src.[' + x + '] IS dup.[' + x + ']'
+                                 for x in excl_columns)
+        cur.execute('DROP TABLE IF EXISTS temp.linearize_dup_rows')
+        cur.execute('CREATE TEMP TABLE linearize_dup_rows AS '
+                    'SELECT src.rowid AS id FROM ' + src_table + ' AS src '
+                    'INNER JOIN (SELECT ' + dup_keys + ' FROM ' + src_table
+                    + ' GROUP BY ' + dup_keys + ' HAVING COUNT(*) > 1) AS dup '
+                    'ON ' + join_cond)
+        dup_rows = '(SELECT id FROM temp.linearize_dup_rows)'
+        cur.execute(insert + linear_select
+                    + 'WHERE src.rowid NOT IN ' + dup_rows, transpose_cols)
+        cur.execute(insert + 'SELECT DISTINCT * FROM (' + linear_select
+                    + 'WHERE src.rowid IN ' + dup_rows + ')', transpose_cols)
+        cur.execute('DROP TABLE temp.linearize_dup_rows')
 
     # commit SQl changes
     cur.close()
@@ -217,40 +531,112 @@ def dump_csv(outfile, table, sql_conn=PAPPI_SQL_CONN):
     cur = sql_conn.cursor()
 
     cols = []
-    for row in cur.execute('PRAGMA table_info("' + table + '")'):
-        cols.append(row[1])
+    for row in cur.execute('SELECT * FROM ' + quote_table(table)
+                           + ' WHERE 0').description:
+        cols.append(row[0])
 
     wr = csv.writer(outfile, delimiter=' ', quoting=csv.QUOTE_NONE)
     wr.writerow(cols)
 
-    for row in cur.execute('SELECT * FROM "' + table + '"'):
+    for row in cur.execute('SELECT * FROM ' + quote_table(table)):
         wr.writerow(row)
 
     cur.close()
     sql_conn.commit()
 
 
+def quote_table(table):
+    """
+    Returns the double quoted table name. A schema prefix (e.g. `temp.`) is
+    kept in front of the quoted name.
+
+    @param table:   The table name, optionally prefixed by the schema name.
+    @return         The quoted table name.
+    """
+    schema, sep, name = table.rpartition('.')
+    return schema + sep + '"' + name + '"'
+
+
+def main_schema(table):
+    """
+    Returns the table name qualified with the `main` schema (unless it is
+    already qualified). Tables are always created in the `main` database,
+    qualifying them when dropping them makes sure that no equally named table
+    of an attached database is dropped instead.
+
+    @param table:   The (unquoted or double quoted) table name.
+    @return         The table name prefixed by `main.`.
+    """
+    if '.' in table:
+        return table
+    return 'main.' + table
+
+
 def table_exists(table, sql_conn=PAPPI_SQL_CONN):
     """
     Returns whether a table with the given name exists in the SQL database
-    given by the SQL connection.
+    given by the SQL connection (or any database attached to it).
 
     @param table:       The name of the SQL table to be checked for.
     @param sql_conn:    The SQl Connection object to be used.
                         Default: current connection.
     @return             Boolean, whether the table with the given name exits.
     """
+    return _schema_object_exists('table', table, sql_conn)
+
+
+def index_exists(index, sql_conn=PAPPI_SQL_CONN):
+    """
+    Returns whether an index with the given name exists in the SQL database
+    given by the SQL connection (or any database attached to it).
+
+    @param index:       The name of the SQL index to be checked for.
+    @param sql_conn:    The SQl Connection object to be used.
+                        Default: current connection.
+    @return             Boolean, whether the index with the given name exits.
+    """
+    return _schema_object_exists('index', index, sql_conn)
+
+
+def _schema_object_exists(obj_type, name, sql_conn):
     cur = sql_conn.cursor()
     # the general SQL version
     #cur.execute('SELECT COUNT(*) FROM INFORMATION_SCHEMA.TABLES '
                 #'WHERE TABLE_NAME = "' + table + '"')
-    # for SQLite:
-    cur.execute('SELECT COUNT(*) FROM sqlite_master '
-                'WHERE type="table" AND name="' + table + '"')
-    result = cur.fetchone()[0]
+    # for SQLite: check the schema of the main and all attached databases
+    cur.execute('PRAGMA database_list')
+    schemas = [row[1] for row in cur.fetchall()]
+    result = 0
+    for schema in schemas:
+        master = 'sqlite_temp_master' if schema == 'temp' else 'sqlite_master'
+        cur.execute('SELECT COUNT(*) FROM "' + schema + '".' + master + ' '
+                    'WHERE type=? AND name=?', [obj_type, name])
+        result += cur.fetchone()[0]
+    cur.close()
     return result > 0
 
 
+def get_table_names(sql_conn=PAPPI_SQL_CONN, like=None):
+    """
+    Returns the names of all tables in the database.
+
+    @param sql_conn:    The SQL connection object.
+    @param like:        If given, only tables with names matching this SQL
+                        `LIKE` pattern are returned (`\\` is the escape
+                        character). Default: None
+    @Returns            A list of table names.
+    """
+    cur = sql_conn.cursor()
+    if like is None:
+        cur.execute('SELECT name FROM sqlite_master WHERE type="table"')
+    else:
+        cur.execute('SELECT name FROM sqlite_master WHERE type="table" '
+                    'AND name LIKE ? ESCAPE "\\"', [like])
+    names = [row[0] for row in cur.fetchall()]
+    cur.close()
+    return names
+
+
 def get_column_names(table, sql_conn=PAPPI_SQL_CONN):
     """
     Returns the names of all columns in the given table.
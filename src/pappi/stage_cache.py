@@ -0,0 +1,151 @@
+'''
+A content-addressed cache for the stages of the data import pipeline.
+
+Each stage (e.g. the import of one PPI or one expression data set) records a
+fingerprint of its input files, parameters, code and upstream stages in the
+`pipeline_stages` table. When the pipeline is run again, a stage is only
+rebuilt if its fingerprint changed (or its output tables are missing). Since
+the fingerprint of a stage includes the fingerprints of its upstream stages,
+rebuilding a stage also invalidates all of its descendants.
+
+@author: Patrick Flick
+'''
+
+import hashlib
+import inspect
+import json
+import os
+import time
+
+from . import sql
+
+STAGE_TABLE = 'pipeline_stages'
+FILE_FINGERPRINT_TABLE = 'pipeline_file_fingerprints'
+
+
+def _sha256_file(filename, chunk_size=1024*1024):
+    """
+    Returns the SHA-256 hex digest of the content of the given file.
+    """
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class StageCache:
+    """
+    Runs pipeline stages and skips those which are up to date.
+    """
+
+    def __init__(self, sql_conn, force=False, verbose=True):
+        """
+        @param sql_conn:    The SQL connection, the metadata tables are created
+                            in this database.
+        @param force:       If set to `True`, all stages are rebuilt.
+        @param verbose:     Whether to print which stages are skipped.
+        """
+        self.sql_conn = sql_conn
+        self.force = force
+        self.verbose = verbose
+        cur = sql_conn.cursor()
+        cur.execute('CREATE TABLE IF NOT EXISTS ' + STAGE_TABLE + ' '
+                    '(stage varchar(64) PRIMARY KEY, fingerprint varchar(64), '
+                    ' outputs text, duration real, finished real)')
+        cur.execute('CREATE TABLE IF NOT EXISTS ' + FILE_FINGERPRINT_TABLE
+                    + ' (filename text PRIMARY KEY, size int, mtime real, '
+                    ' sha256 varchar(64))')
+        cur.close()
+        sql_conn.commit()
+
+    def file_fingerprint(self, filename):
+        """
+        Returns the SHA-256 of the file's content. The hash is only
+        recomputed if the file's size or modification time changed.
+        """
+        if not filename or not os.path.exists(filename):
+            # missing files (e.g. empty filenames of derived data sets)
+            return None
+        filename = os.path.abspath(filename)
+        stat = os.stat(filename)
+        cur = self.sql_conn.cursor()
+        cur.execute('SELECT size, mtime, sha256 FROM ' + FILE_FINGERPRINT_TABLE
+                    + ' WHERE filename = ?', [filename])
+        row = cur.fetchone()
+        if row is not None and row[0] == stat.st_size \
+                and row[1] == stat.st_mtime:
+            cur.close()
+            return row[2]
+        sha = _sha256_file(filename)
+        cur.execute('INSERT OR REPLACE INTO ' + FILE_FINGERPRINT_TABLE + ' '
+                    '(filename, size, mtime, sha256) VALUES (?,?,?,?)',
+                    [filename, stat.st_size, stat.st_mtime, sha])
+        cur.close()
+        self.sql_conn.commit()
+        return sha
+
+    def stage_fingerprint(self, stage):
+        """
+        Returns the currently recorded fingerprint of the given stage, or
+        `None` if the stage has not been run yet.
+        """
+        cur = self.sql_conn.cursor()
+        cur.execute('SELECT fingerprint FROM ' + STAGE_TABLE + ' '
+                    'WHERE stage = ?', [stage])
+        row = cur.fetchone()
+        cur.close()
+        return None if row is None else row[0]
+
+    def fingerprint(self, stage, files=(), params=None, upstream=(),
+                    code=()):
+        """
+        Computes the fingerprint of a stage from the content of its input
+        files, its parameters, the source code of the given classes/modules
+        and the fingerprints of its upstream stages.
+        """
+        # the source files of all given modules and classes (including
+        # the super-classes, e.g. HPA_All -> HPA -> GeneExpression)
+        code_objs = []
+        for c in code:
+            if inspect.isclass(c):
+                code_objs.extend(k for k in c.__mro__ if k is not object)
+            else:
+                code_objs.append(c)
+        code_files = sorted(set(inspect.getsourcefile(inspect.getmodule(c))
+                                for c in code_objs))
+        content = {'stage': stage,
+                   'files': [self.file_fingerprint(f) for f in files],
+                   'params': params,
+                   'code': [_sha256_file(f) for f in code_files],
+                   'upstream': [(u, self.stage_fingerprint(u))
+                                for u in upstream]}
+        content_str = json.dumps(content, sort_keys=True, default=repr)
+        return hashlib.sha256(content_str.encode('utf-8')).hexdigest()
+
+    def is_fresh(self, stage, fingerprint, outputs=()):
+        """
+        Returns whether the stage was built with the given fingerprint and
+        all its output tables still exist.
+        """
+        if self.force:
+            return False
+        if self.stage_fingerprint(stage) != fingerprint:
+            return False
+        return all(sql.table_exists(t, self.sql_conn) for t in outputs)
+
+    def record(self, stage, fingerprint, outputs=(), duration=0.0):
+        """
+        Records the successful build of the given stage.
+        """
+        cur = self.sql_conn.cursor()
+        cur.execute('INSERT OR REPLACE INTO ' + STAGE_TABLE + ' '
+                    '(stage, fingerprint, outputs, duration, finished) '
+                    'VALUES (?,?,?,?,?)',
+                    [stage, fingerprint, json.dumps(list(outputs)), duration,
+                     time.time()])
+        cur.close()
+        self.sql_conn.commit()
@@ -1,3 +1,6 @@
+from . import sql
+
+
 class TableManager:
     """
     A class to handle import of csv files into SQL tables and
@@ -7,6 +10,21 @@ class TableManager:
     """
     tmp_table_idx = 0
     cur_tmp_name = None
+    staged_tables = []
+    # number of worker processes used for parsing the raw file (set for each
+    # stage by the `TaskGraph`)
+    import_workers = sql.IMPORT_WORKERS
+    # staging mode: the intermediate tables of the pre-processing steps are
+    # created in the `temp` schema of the SQL connection (which is kept in
+    # memory, see `staging_temp_store`) instead of the database file, and
+    # are dropped once the final table is created
+    staging = False
+    # where SQLite keeps the `temp` schema while staging ('MEMORY' or 'FILE')
+    staging_temp_store = 'MEMORY'
+    # the suffixes (see `next_tmp_table`) of the intermediate tables, `None`
+    # stands for the numbered tables
+    staged_suffixes = [None, 'raw', 'filtered', 'linear', 'normalized',
+                       'no_dupl']
 
     def __init__(self, table_name, sql_connection):
         self.name = table_name
@@ -39,6 +57,7 @@ class TableManager:
         use of it to get the names for temporary tables.
         """
         self.tmp_table_idx += 1
+        staged = self.staging and suffix in self.staged_suffixes
         if suffix is None:
             suffix = str(self.tmp_table_idx)
 
@@ -48,5 +67,32 @@ class TableManager:
         else:
             self.cur_tmp_name = self.name + '_' + suffix
 
+        # intermediate tables are put into the `temp` schema
+        if staged:
+            self.cur_tmp_name = 'temp.' + self.cur_tmp_name
+            if not self.staged_tables:
+                cur = self.sql_conn.cursor()
+                cur.execute('PRAGMA temp_store = ' + self.staging_temp_store)
+                cur.close()
+            self.staged_tables = self.staged_tables + [self.cur_tmp_name]
+
         # return via the current table function
         return self.get_cur_tmp_table()
+
+    def drop_staged_tables(self):
+        """
+        Drops all intermediate tables created in staging mode, including the
+        tables derived from them (e.g. the `_unmatched_rows` tables of the ID
+        mapping). This is called once the final table is created.
+        """
+        cur = self.sql_conn.cursor()
+        cur.execute('SELECT name FROM sqlite_temp_master WHERE type="table"')
+        temp_tables = [row[0] for row in cur.fetchall()]
+        for staged in self.staged_tables:
+            staged = staged[len('temp.'):]
+            for table in temp_tables:
+                if table == staged or table.startswith(staged + '_'):
+                    cur.execute('DROP TABLE IF EXISTS temp."' + table + '"')
+        cur.close()
+        self.sql_conn.commit()
+        self.staged_tables = []
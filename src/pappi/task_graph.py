@@ -0,0 +1,444 @@
+'''
+A task graph runner for the stages of the data import pipeline.
+
+Stages declare the stages they depend on. Independent stages (e.g. the import
+of the different PPIs and expression data sets, which only read the shared
+mapping tables) are run concurrently in forked worker processes. Each worker
+writes into its own SQLite database, to which the shared database is attached
+read-only (as `shared`): all tables created by the stage end up in the
+worker's database, while unqualified reads of existing tables are resolved in
+the shared database. Once a worker is finished, its tables are merged into
+the shared database (by the main process, which is the only writer of the
+shared database).
+
+Up-to-date stages (see `StageCache.is_fresh`) are skipped.
+
+@author: Patrick Flick
+'''
+
+import multiprocessing
+import multiprocessing.connection
+import os
+import re
+import sqlite3
+import sys
+import time
+import traceback
+import urllib.request
+
+from . import sql
+from .table_manager import TableManager
+
+# the schema name of the shared database inside of the workers
+SHARED_SCHEMA = 'shared'
+# the schema name of a worker database while it is merged
+WORKER_SCHEMA = 'worker'
+
+
+def _worker_db_filename(folder, stage):
+    """
+    Returns the file name of the worker database for the given stage.
+    """
+    return os.path.join(folder, re.sub(r'[^a-zA-Z0-9_-]', '_', stage)
+                        + '.sqlite')
+
+
+def _db_uri(filename, mode=None):
+    uri = 'file:' + urllib.request.pathname2url(os.path.abspath(filename))
+    if mode is not None:
+        uri += '?mode=' + mode
+    return uri
+
+
+def _run_worker(func, db_filename, worker_db, append_tables,
+                import_workers):
+    """
+    The entry point of the worker processes: runs the stage function `func`
+    on a connection to a new worker database with the shared database
+    attached. The stage may use up to `import_workers` processes for parsing
+    its raw files (see `TableManager.import_workers`).
+    """
+    TableManager.import_workers = import_workers
+    if os.path.exists(worker_db):
+        os.remove(worker_db)
+    con = sqlite3.connect(_db_uri(worker_db), uri=True)
+    cur = con.cursor()
+    cur.execute('ATTACH DATABASE ? AS ' + SHARED_SCHEMA,
+                [_db_uri(db_filename, 'ro')])
+    # tables which are appended to (instead of created) by the stages need
+    # to exist in the worker's database, otherwise the rows would be
+    # inserted into the (read-only) shared database
+    for table in append_tables:
+        if sql.table_exists(table, con):
+            cur.execute('CREATE TABLE main."' + table + '" AS SELECT * FROM '
+                        + SHARED_SCHEMA + '."' + table + '" WHERE 0')
+    cur.close()
+    con.commit()
+    func(con)
+    con.commit()
+    con.close()
+
+
+class Task:
+    """
+    A single stage of the task graph.
+    """
+
+    def __init__(self, name, func, parallel, upstream, files, params, code,
+                 outputs, drop):
+        self.name = name
+        self.func = func
+        self.parallel = parallel
+        self.upstream = list(upstream)
+        self.files = list(files)
+        self.params = params
+        self.code = list(code)
+        self.outputs = list(outputs)
+        self.drop = list(drop)
+        # the run time of the stage (`None` if the stage was skipped)
+        self.start = None
+        self.duration = None
+
+
+class TaskGraph:
+    """
+    Runs the stages of the pipeline in dependency order, with independent
+    stages running concurrently in worker processes.
+    """
+
+    def __init__(self, stage_cache, db_filename, num_workers=None,
+                 append_tables=(), worker_folder=None):
+        """
+        @param stage_cache:     The `StageCache` of the shared database.
+        @param db_filename:     The file name of the shared database.
+        @param num_workers:     The maximum number of concurrently running
+                                worker processes, which is shared with the
+                                processes the running stages parse their raw
+                                files with. Default: number of CPUs.
+        @param append_tables:   Tables which stages insert rows into, rather
+                                than (re-)creating them (e.g. the mapping
+                                stats). The rows of these tables are
+                                appended on merge (via `INSERT OR REPLACE`,
+                                i.e. rows replace the rows with the same
+                                unique key, if the table has one).
+        @param worker_folder:   The folder for the worker databases.
+                                Default: `<db_filename>.workers`
+        """
+        self.stages = stage_cache
+        self.sql_conn = stage_cache.sql_conn
+        self.db_filename = db_filename
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.append_tables = list(append_tables)
+        if worker_folder is None:
+            worker_folder = db_filename + '.workers'
+        self.worker_folder = worker_folder
+        self.tasks = {}
+        self.order = []
+
+    def add(self, name, func, parallel=False, upstream=(), files=(),
+            params=None, code=(), outputs=(), drop=()):
+        """
+        Adds a stage to the graph.
+
+        @param name:        The unique name of the stage.
+        @param func:        The function building the stage, it is called
+                            with the SQL connection to be used as argument.
+        @param parallel:    Whether the stage is run in a worker process.
+                            Otherwise it is run in the main process on the
+                            shared database.
+        @param upstream:    Names of the stages this stage depends on.
+        @param files:       The input files of the stage.
+        @param params:      Parameters of the stage (any JSON serializable
+                            object).
+        @param code:        Classes or modules defining the stage.
+        @param outputs:     The tables created by the stage.
+        @param drop:        Derived tables to be dropped before the stage is
+                            rebuilt.
+        @returns:           The name of the stage.
+        """
+        if name in self.tasks:
+            raise ValueError("Duplicate stage name: '" + name + "'")
+        self.tasks[name] = Task(name, func, parallel, upstream, files, params,
+                                code, outputs, drop)
+        self.order.append(name)
+        return name
+
+    def _ancestors(self, name):
+        """
+        Returns the names of all (transitive) upstream stages of a stage.
+        """
+        result = set()
+        stack = list(self.tasks[name].upstream)
+        while stack:
+            u = stack.pop()
+            if u not in result:
+                result.add(u)
+                stack.extend(self.tasks[u].upstream)
+        return result
+
+    def _main_table_exists(self, table):
+        cur = self.sql_conn.cursor()
+        cur.execute('SELECT COUNT(*) FROM main.sqlite_master '
+                    'WHERE type="table" AND name=?', [table])
+        result = cur.fetchone()[0]
+        cur.close()
+        return result > 0
+
+    def _merge(self, task, worker_db):
+        """
+        Merges the tables (and indexes) of the worker database into the
+        shared database.
+        """
+        # the outputs of upstream stages are only read by this stage, any
+        # local copy of them (e.g. lazily re-created ID tables) stays local
+        upstream_outputs = set()
+        for u in self._ancestors(task.name):
+            upstream_outputs.update(self.tasks[u].outputs)
+
+        # databases can't be attached inside of a transaction
+        self.sql_conn.commit()
+        cur = self.sql_conn.cursor()
+        cur.execute('ATTACH DATABASE ? AS ' + WORKER_SCHEMA, [worker_db])
+        cur.execute('SELECT type, name, tbl_name, sql FROM ' + WORKER_SCHEMA
+                    + '.sqlite_master WHERE type IN ("table", "index") '
+                    'AND name NOT LIKE "sqlite_%" ORDER BY type DESC')
+        objects = cur.fetchall()
+        merged = set()
+        for obj_type, name, table, obj_sql in objects:
+            if obj_type == 'table':
+                if name in upstream_outputs:
+                    continue
+                if name in self.append_tables and \
+                        self._main_table_exists(name):
+                    cur.execute('INSERT OR REPLACE INTO main."' + name
+                                + '" SELECT * FROM ' + WORKER_SCHEMA + '."'
+                                + name + '"')
+                    continue
+                cur.execute('DROP TABLE IF EXISTS main."' + name + '"')
+                # the (unqualified) CREATE statement creates the table in
+                # the main database
+                cur.execute(obj_sql)
+                cur.execute('INSERT INTO main."' + name + '" SELECT * FROM '
+                            + WORKER_SCHEMA + '."' + name + '"')
+                merged.add(name)
+            elif table in merged and obj_sql is not None:
+                cur.execute('DROP INDEX IF EXISTS main."' + name + '"')
+                cur.execute(obj_sql)
+        self.sql_conn.commit()
+        cur.execute('DETACH DATABASE ' + WORKER_SCHEMA)
+        cur.close()
+        os.remove(worker_db)
+
+    def _prepare(self, task):
+        """
+        Returns the fingerprint of the stage, or `None` if the stage is up to
+        date. Stale derived tables are dropped.
+        """
+        fingerprint = self.stages.fingerprint(task.name, task.files,
+                                              task.params, task.upstream,
+                                              task.code)
+        if self.stages.is_fresh(task.name, fingerprint, task.outputs):
+            if self.stages.verbose:
+                print("Stage '" + task.name + "' is up to date, skipping.")
+            return None
+        cur = self.sql_conn.cursor()
+        for table in task.drop + task.outputs:
+            cur.execute('DROP TABLE IF EXISTS main."' + table + '"')
+        cur.close()
+        self.sql_conn.commit()
+        return fingerprint
+
+    def _import_workers(self, pending, done, running):
+        """
+        Returns the number of processes a stage started next may use for
+        parsing its raw files: its share of the `num_workers` CPUs among the
+        running stages and the parallel stages ready to start.
+        """
+        num_ready = sum(1 for name in pending
+                        if self.tasks[name].parallel
+                        and all(u in done for u in self.tasks[name].upstream))
+        concurrent = min(self.num_workers, len(running) + 1 + num_ready)
+        return max(1, self.num_workers // concurrent)
+
+    def _next_ready(self, pending, done, failed, worker_available):
+        """
+        Removes and returns the next stage (in insertion order) whose
+        upstream stages are all done, or `None` if no stage can be started.
+        Stages depending on failed stages are marked as failed.
+        """
+        for name in list(pending):
+            task = self.tasks[name]
+            if any(u in failed for u in task.upstream):
+                print("[ERROR] Skipping stage '" + name + "' due to failed "
+                      "upstream stages.")
+                pending.remove(name)
+                failed.add(name)
+                continue
+            if not all(u in done for u in task.upstream):
+                continue
+            if task.parallel and not worker_available:
+                continue
+            pending.remove(name)
+            return task
+        return None
+
+    def run(self):
+        """
+        Runs all stages of the graph.
+        """
+        for task in self.tasks.values():
+            for u in task.upstream:
+                if u not in self.tasks:
+                    raise ValueError("Unknown upstream stage '" + u
+                                     + "' of stage '" + task.name + "'")
+        os.makedirs(self.worker_folder, exist_ok=True)
+
+        # the workers read the shared database while the main process
+        # merges into it
+        self.sql_conn.commit()
+        cur = self.sql_conn.cursor()
+        cur.execute('PRAGMA main.journal_mode')
+        old_journal_mode = cur.fetchone()[0]
+        cur.execute('PRAGMA main.journal_mode = WAL')
+        cur.close()
+
+        ctx = multiprocessing.get_context('fork')
+        self.run_start = time.time()
+        pending = list(self.order)
+        done = set()
+        failed = set()
+        # running workers: process sentinel -> (task, process, fingerprint,
+        #                                       worker database)
+        running = {}
+        try:
+            while pending or running:
+                task = self._next_ready(pending, done, failed,
+                                        len(running) < self.num_workers)
+                if task is not None:
+                    fingerprint = self._prepare(task)
+                    if fingerprint is None:
+                        done.add(task.name)
+                    elif task.parallel:
+                        # flush before forking, otherwise buffered output
+                        # is printed twice
+                        sys.stdout.flush()
+                        worker_db = _worker_db_filename(self.worker_folder,
+                                                        task.name)
+                        task.start = time.time()
+                        import_workers = self._import_workers(pending, done,
+                                                              running)
+                        p = ctx.Process(target=_run_worker,
+                                        args=(task.func, self.db_filename,
+                                              worker_db, self.append_tables,
+                                              import_workers),
+                                        name=task.name)
+                        p.start()
+                        running[p.sentinel] = (task, p, fingerprint,
+                                               worker_db)
+                    else:
+                        task.start = time.time()
+                        try:
+                            task.func(self.sql_conn)
+                        except Exception:
+                            traceback.print_exc()
+                            self.sql_conn.rollback()
+                            print("[ERROR] Stage '" + task.name + "' failed")
+                            failed.add(task.name)
+                            continue
+                        self._finish(task, fingerprint)
+                        done.add(task.name)
+                    continue
+
+                if not running:
+                    if not pending:
+                        # the remaining stages were skipped due to failures
+                        break
+                    raise ValueError("Cyclic dependencies between the "
+                                     "stages: " + ", ".join(pending))
+
+                # wait for any of the workers to finish
+                ready = multiprocessing.connection.wait(list(running.keys()))
+                for sentinel in ready:
+                    task, p, fingerprint, worker_db = running.pop(sentinel)
+                    p.join()
+                    if p.exitcode != 0:
+                        print("[ERROR] Stage '" + task.name + "' failed with "
+                              "exit code " + str(p.exitcode))
+                        failed.add(task.name)
+                        continue
+                    self._merge(task, worker_db)
+                    self._finish(task, fingerprint)
+                    done.add(task.name)
+        finally:
+            for task, p, fingerprint, worker_db in running.values():
+                p.terminate()
+                p.join()
+            cur = self.sql_conn.cursor()
+            cur.execute('PRAGMA main.journal_mode = ' + old_journal_mode)
+            cur.close()
+        self.run_end = time.time()
+        if failed:
+            raise RuntimeError("The following stages failed: "
+                               + ", ".join(sorted(failed)))
+
+    def _finish(self, task, fingerprint):
+        """
+        Records the successful run of a stage.
+        """
+        task.duration = time.time() - task.start
+        self.stages.record(task.name, fingerprint, task.outputs,
+                           task.duration)
+
+    def critical_path(self):
+        """
+        Returns the critical path (the chain of dependent stages with the
+        longest total run time) of the last run, as list of stage names,
+        and its total run time.
+        """
+        # longest run time of any chain ending in a stage
+        finish = {}
+        prev = {}
+
+        def longest(name):
+            if name not in finish:
+                task = self.tasks[name]
+                best = None
+                for u in task.upstream:
+                    if best is None or longest(u) > finish[best]:
+                        best = u
+                prev[name] = best
+                finish[name] = ((task.duration or 0.0)
+                                + (finish[best] if best is not None else 0.0))
+            return finish[name]
+
+        if not self.tasks:
+            return [], 0.0
+        last = max(self.order, key=longest)
+        path = []
+        while last is not None:
+            path.append(last)
+            last = prev[last]
+        return list(reversed(path)), finish[path[0]]
+
+    def print_report(self):
+        """
+        Prints the timing report of the last run: the run time of each stage,
+        the critical path and the wall time compared to the total stage time.
+        """
+        print("Stage timings:")
+        for name in self.order:
+            task = self.tasks[name]
+            if task.duration is None:
+                print("    %-40s skipped" % name)
+            else:
+                print("    %-40s %8.1f s  (started at %8.1f s)"
+                      % (name, task.duration, task.start - self.run_start))
+        path, path_time = self.critical_path()
+        print("Critical path (%.1f s):" % path_time)
+        for name in path:
+            if self.tasks[name].duration is not None:
+                print("    %-40s %8.1f s" % (name, self.tasks[name].duration))
+        total = sum(t.duration or 0.0 for t in self.tasks.values())
+        wall = self.run_end - self.run_start
+        print("Total stage time: %.1f s, wall time: %.1f s (speedup %.2f)"
+              % (total, wall, total / max(wall, 1e-9)))